@@ -0,0 +1,121 @@
+"""
+Compare the registered reader backends on a corpus of documents.
+
+Usage (from code/src/server):
+    python -m filereader.Benchmark <corpus_dir> [--repeat 3] [--formats pdf,docx] [--include-ocr] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Any, Dict, List
+from filereader.ReaderRegistry import readers, sniff_format, format_from_filename
+
+# backends that need tesseract are slow and skipped unless asked for
+OCR_BACKENDS = {'tesseract'}
+
+
+def load_corpus(corpus_dir: str) -> List[Dict[str, Any]]:
+    corpus = []
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                corpus.append({'path': os.path.relpath(path, corpus_dir), 'data': f.read()})
+    return corpus
+
+
+def run_benchmark(corpus: List[Dict[str, Any]], repeat: int = 3, formats: List[str] = None,
+                  include_ocr: bool = False) -> Dict[str, Any]:
+    """
+    Sniff every file, then time every backend registered for its format.
+
+    Returns:
+        Dict with sniffing stats and per (format, backend) timings
+    """
+    sniff_seconds = []
+    misnamed = []
+    by_format: Dict[str, List[Dict[str, Any]]] = {}
+    for item in corpus:
+        start_time = time.perf_counter()
+        file_format = sniff_format(item['data'], item['path'])
+        sniff_seconds.append(time.perf_counter() - start_time)
+        named_format = format_from_filename(item['path'])
+        if named_format and file_format != named_format:
+            misnamed.append({'path': item['path'], 'named': named_format, 'sniffed': file_format})
+        if file_format and (not formats or file_format in formats):
+            by_format.setdefault(file_format, []).append(item)
+
+    results = []
+    for file_format, items in sorted(by_format.items()):
+        for backend in readers.backends(file_format):
+            if backend in OCR_BACKENDS and not include_ocr:
+                continue
+            reader = readers.get(file_format, backend)
+            per_file = []
+            errors = 0
+            chars = 0
+            for item in items:
+                timings = []
+                for _ in range(repeat):
+                    start_time = time.perf_counter()
+                    try:
+                        text = reader(item['data'])
+                    except Exception:
+                        errors += 1
+                        break
+                    timings.append(time.perf_counter() - start_time)
+                else:
+                    chars += len(text)
+                    per_file.append(statistics.median(timings))
+            total_bytes = sum(len(item['data']) for item in items)
+            total_seconds = sum(per_file)
+            results.append({
+                'format': file_format,
+                'backend': backend,
+                'files': len(items),
+                'errors': errors,
+                'median_ms': round(statistics.median(per_file) * 1000, 3) if per_file else None,
+                'total_ms': round(total_seconds * 1000, 3),
+                'mb_per_second': round(total_bytes / 2**20 / total_seconds, 2) if total_seconds else None,
+                'chars': chars,
+            })
+
+    return {
+        'files': len(corpus),
+        'sniff_median_us': round(statistics.median(sniff_seconds) * 1e6, 1) if sniff_seconds else None,
+        'misnamed': misnamed,
+        'backends': results,
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark reader backends on a corpus of documents")
+    parser.add_argument('corpus_dir')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', help="comma separated formats to include, e.g. pdf,docx")
+    parser.add_argument('--include-ocr', action='store_true')
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(load_corpus(args.corpus_dir), args.repeat,
+                            args.formats.split(',') if args.formats else None, args.include_ocr)
+
+    print(f"{results['files']} files, median sniff time {results['sniff_median_us']} us, "
+          f"{len(results['misnamed'])} with a misleading name")
+    for entry in results['misnamed']:
+        print(f"  {entry['path']}: named {entry['named']}, sniffed {entry['sniffed']}")
+    print(f"{'format':<8}{'backend':<14}{'files':>6}{'errors':>8}{'median ms':>12}{'total ms':>12}{'MB/s':>9}{'chars':>10}")
+    for row in results['backends']:
+        print(f"{row['format']:<8}{row['backend']:<14}{row['files']:>6}{row['errors']:>8}"
+              f"{str(row['median_ms']):>12}{row['total_ms']:>12}{str(row['mb_per_second']):>9}{row['chars']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
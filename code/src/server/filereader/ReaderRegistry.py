@@ -0,0 +1,223 @@
+import io
+import os
+import zipfile
+import logging
+from email import policy
+from email.parser import BytesParser
+from typing import BinaryIO, Callable, Dict, List, Optional, Union
+import fitz  # PyMuPDF
+import docx2txt
+import puremagic
+from PyPDF2 import PdfReader
+from docx import Document
+from dotenv import load_dotenv
+from services.spreadsheet_service import extract_spreadsheet
+from services.ocr_service import ocr_service
+
+logger = logging.getLogger(__name__)
+
+# bytes needed to recognise every format below (zip based formats also look at the member list)
+SNIFF_BYTES = 8192
+
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+MAGIC_FORMATS = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'II*\x00', 'tiff'),
+]
+# short signatures that plain text can start with too ("BMO Harris ...", "MM\x00*" is rarer but as short);
+# like an email header block they are weak evidence and don't override a text file's name
+WEAK_MAGIC_FORMATS = [
+    (b'MM\x00*', 'tiff'),
+    (b'BM', 'bmp'),
+]
+EXTENSION_FORMATS = {'jpeg': 'jpg', 'tif': 'tiff', 'text': 'txt', 'csv': 'txt'}
+EMAIL_HEADERS = (b'from:', b'to:', b'subject:', b'date:', b'received:', b'message-id:', b'mime-version:', b'return-path:')
+
+
+def format_from_filename(filename: Optional[str]) -> Optional[str]:
+    if not filename:
+        return None
+    extension = os.path.splitext(filename)[1].lower().replace('.', '')
+    return EXTENSION_FORMATS.get(extension, extension) or None
+
+
+def _read_head(source: Union[str, bytes, BinaryIO]) -> bytes:
+    if isinstance(source, bytes):
+        return source[:SNIFF_BYTES]
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read(SNIFF_BYTES)
+    source.seek(0)
+    head = source.read(SNIFF_BYTES)
+    source.seek(0)
+    return head
+
+
+def _zip_format(source: Union[str, bytes, BinaryIO]) -> Optional[str]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+            names = archive.namelist()
+    except zipfile.BadZipFile:
+        return None
+    finally:
+        if not isinstance(source, (str, bytes)):
+            source.seek(0)
+    if any(name.startswith('word/') for name in names):
+        return 'docx'
+    if any(name.startswith('xl/') for name in names):
+        return 'xlsx'
+    return 'zip'
+
+
+def _looks_like_email(head: bytes) -> bool:
+    lines = head.lstrip().split(b'\n', 30)[:30]
+    headers = sum(1 for line in lines if line.lower().startswith(EMAIL_HEADERS))
+    return headers >= 2
+
+
+def sniff_format(source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> Optional[str]:
+    """
+    Work out a document's format from its content, using the filename only to
+    break ties (e.g. .doc vs .xls inside an OLE2 container), to keep a text file
+    whose content merely looks like a bitmap or an email, or as a last resort.
+
+    Args:
+        source: Path to the file, its bytes, or a binary file object
+        filename: Name of the file, if known
+
+    Returns:
+        Format name such as 'pdf', 'docx', 'xlsx', 'xls', 'doc', 'eml', 'png' or 'txt', or None
+    """
+    head = _read_head(source)
+    named_format = format_from_filename(filename or (source if isinstance(source, str) else None))
+
+    for magic, file_format in MAGIC_FORMATS:
+        if head.startswith(magic):
+            return file_format
+    if head.startswith(b'PK\x03\x04'):
+        return _zip_format(source)
+    if head.startswith(OLE2_MAGIC):
+        # Word and Excel 97-2003 share the container; trust the name when it is one of the two
+        return named_format if named_format in ('doc', 'xls') else 'doc'
+    if named_format == 'txt' and b'\x00' not in head:
+        return 'txt'
+    for magic, file_format in WEAK_MAGIC_FORMATS:
+        if head.startswith(magic):
+            return file_format
+    if _looks_like_email(head):
+        return 'eml'
+
+    try:
+        extension = puremagic.from_string(head)
+        return EXTENSION_FORMATS.get(extension.lstrip('.').lower(), extension.lstrip('.').lower())
+    except (puremagic.PureError, ValueError):
+        pass
+
+    if named_format:
+        return named_format
+    if head and b'\x00' not in head:
+        return 'txt'
+    return None
+
+
+class ReaderRegistry:
+    """
+    Text extraction backends per format. Several backends can be registered for
+    the same format; the default can be overridden with READER_BACKEND_<FORMAT>
+    (e.g. READER_BACKEND_PDF=pypdf2).
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self._readers: Dict[str, Dict[str, Callable[[bytes], str]]] = {}
+        self._defaults: Dict[str, str] = {}
+
+    def register(self, file_format: str, name: str, reader: Callable[[bytes], str], default: bool = False):
+        """
+        Register a backend.
+
+        Args:
+            file_format: Format name as returned by sniff_format
+            name: Backend name
+            reader: Callable taking the file's bytes and returning its text
+            default: Make this the default backend for the format
+        """
+        self._readers.setdefault(file_format, {})[name] = reader
+        if default or file_format not in self._defaults:
+            self._defaults[file_format] = name
+
+    @property
+    def formats(self) -> List[str]:
+        return list(self._readers)
+
+    def backends(self, file_format: str) -> List[str]:
+        return list(self._readers.get(file_format, {}))
+
+    def get(self, file_format: str, backend: Optional[str] = None) -> Callable[[bytes], str]:
+        """
+        Look up a backend, falling back to the configured default for the format.
+
+        Raises:
+            KeyError: If no matching backend is registered
+        """
+        readers = self._readers[file_format]
+        backend = backend or os.getenv(f"READER_BACKEND_{file_format.upper()}") or self._defaults[file_format]
+        return readers[backend]
+
+    def read(self, data: bytes, filename: Optional[str] = None, backend: Optional[str] = None) -> str:
+        """
+        Sniff the format of data and extract its text with the chosen backend.
+
+        Raises:
+            KeyError: If no backend is registered for the detected format
+        """
+        file_format = sniff_format(data, filename)
+        logger.info(f"Reading {filename or 'file'} as {file_format}")
+        return self.get(file_format, backend)(data)
+
+
+def read_pdf_pymupdf(data: bytes) -> str:
+    with fitz.open(stream=data, filetype="pdf") as pdf_document:
+        return "\n".join(page.get_text() for page in pdf_document)
+
+
+def read_pdf_pypdf2(data: bytes) -> str:
+    reader = PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+
+
+def read_docx_docx2txt(data: bytes) -> str:
+    return docx2txt.process(io.BytesIO(data))
+
+
+def read_docx_python_docx(data: bytes) -> str:
+    return "\n".join(para.text for para in Document(io.BytesIO(data)).paragraphs)
+
+
+def read_eml(data: bytes) -> str:
+    msg = BytesParser(policy=policy.default).parsebytes(data)
+    body = msg.get_body(preferencelist=('plain', 'html'))
+    return body.get_content() if body is not None else ''
+
+
+def read_text(data: bytes) -> str:
+    return data.decode('utf-8', errors='replace')
+
+
+def read_image_tesseract(data: bytes) -> str:
+    return ocr_service.ocr_images([data])[0]['text']
+
+
+readers = ReaderRegistry()
+readers.register('pdf', 'pymupdf', read_pdf_pymupdf)
+readers.register('pdf', 'pypdf2', read_pdf_pypdf2)
+readers.register('docx', 'docx2txt', read_docx_docx2txt)
+readers.register('docx', 'python-docx', read_docx_python_docx)
+readers.register('xlsx', 'openpyxl', extract_spreadsheet)
+readers.register('xls', 'xlrd', extract_spreadsheet)
+readers.register('eml', 'email', read_eml)
+readers.register('txt', 'utf-8', read_text)
+for image_format in ('png', 'jpg', 'tiff', 'bmp'):
+    readers.register(image_format, 'tesseract', read_image_tesseract)
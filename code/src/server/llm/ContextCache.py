@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import logging
+import time
+from google import genai
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiContextCache:
+    """
+    Registers the static system instruction as a Gemini cached content entry,
+    so each request references it by name instead of re-sending the taxonomy.
+    Registration goes through the async client, so a re-registration only
+    holds up the callers waiting for it, not the event loop.
+    """
+
+    def __init__(self, get_client, model_name, ttl_seconds=3600):
+        self.get_client = get_client
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self._lock = asyncio.Lock()
+        self._entry = None  # (key, name, expires_at)
+
+    async def get_or_register(self, key, prefix):
+        """
+        Returns the cached content name for the prefix, registering it when
+        the key has changed or the previous entry is about to expire.
+        """
+        if self._is_fresh(key):
+            return self._entry[1]
+        async with self._lock:
+            # another caller may have registered it while this one waited
+            if self._is_fresh(key):
+                return self._entry[1]
+
+            name = await self._register(prefix)
+            if self._entry and self._entry[0] != key:
+                await self._delete(self._entry[1])
+            self._entry = (key, name, time.time() + self.ttl_seconds)
+            return name
+
+    def _is_fresh(self, key):
+        return self._entry is not None and self._entry[0] == key and self._entry[2] > time.time() + 60
+
+    async def _register(self, prefix):
+        cache = await self.get_client().aio.caches.create(
+            model=self.model_name,
+            config=genai.types.CreateCachedContentConfig(
+                system_instruction=prefix,
+                display_name="loan-request-types",
+                ttl=f"{self.ttl_seconds}s"))
+        logger.info(f"Registered cached context {cache.name}")
+        return cache.name
+
+    async def _delete(self, name):
+        try:
+            await self.get_client().aio.caches.delete(name=name)
+        except Exception as e:
+            logger.warning(f"Could not delete cached context {name}: {str(e)}")
+
+
+class LocalContextCache(GeminiContextCache):
+    """
+    In-memory stand-in for GeminiContextCache used in tests and offline runs.
+    Records registered prefixes instead of calling the API.
+    """
+
+    def __init__(self, ttl_seconds=3600):
+        super().__init__(get_client=None, model_name="local", ttl_seconds=ttl_seconds)
+        self.contents = {}
+        self.register_count = 0
+
+    async def _register(self, prefix):
+        name = "cachedContents/local-" + hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        self.contents[name] = prefix
+        self.register_count += 1
+        return name
+
+    async def _delete(self, name):
+        self.contents.pop(name, None)
@@ -1,5 +1,13 @@
 REQUEST_TYPES = {}
 
+# bumped on every change to REQUEST_TYPES so compiled prompts and cached results can be invalidated
+REQUEST_TYPES_VERSION = 0
+
+def bump_version():
+    global REQUEST_TYPES_VERSION
+    REQUEST_TYPES_VERSION += 1
+    return REQUEST_TYPES_VERSION
+
 ROLE="""
 Context:
 The Commercial Bank Lending Service teams receive a high volume of servicing requests via email. These emails contain diverse requests, often with attachments. The system ingests these emails into the loan servicing platform, creating service requests that go through a structured workflow.
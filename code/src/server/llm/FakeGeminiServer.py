@@ -0,0 +1,97 @@
+"""
+A stand-in for the Gemini generateContent endpoint, for load and failure
+testing without calling the real API. Point the service at it with
+GEMINI_BASE_URL=http://localhost:8090 and any GEMINI_API_KEY.
+
+    python -m llm.FakeGeminiServer --port 8090 --latency-ms 200 --rate-limit-rate 0.1 --error-rate 0.05
+
+Answers pick a request type from the ones listed in the system instruction,
+so they are well-formed but not meaningful. They are derived from the prompt,
+so a continuation request for a cut-off answer gets the rest of the same answer.
+"""
+import time
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from llm.LLMBackend import prompt_text, split_continuation, synthetic_answer
+
+
+def _error(code, status, message):
+    return JSONResponse(status_code=code, content={'error': {'code': code, 'message': message, 'status': status}})
+
+
+def create_app(latency_ms=200, jitter_ms=50, error_rate=0.0, rate_limit_rate=0.0, rpm=0, truncate_rate=0.0):
+    """
+    Args:
+        latency_ms: Mean response time
+        jitter_ms: Random variation around latency_ms
+        error_rate: Fraction of requests answered with 503 UNAVAILABLE
+        rate_limit_rate: Fraction of requests answered with 429 RESOURCE_EXHAUSTED
+        rpm: Requests per minute over which every request gets a 429; 0 for no quota
+        truncate_rate: Fraction of answers cut off mid-JSON with finishReason MAX_TOKENS
+    """
+    app = FastAPI(title="Fake Gemini")
+    app.state.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'truncated': 0, 'continuations': 0}
+    window = []
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/{api_version}/models/{model}:generateContent")
+    async def generate_content(api_version: str, model: str, request: Request):
+        body = await request.json()
+        app.state.stats['requests'] += 1
+
+        now = time.monotonic()
+        window[:] = [t for t in window if now - t < 60]
+        if (rpm and len(window) >= rpm) or random.random() < rate_limit_rate:
+            app.state.stats['rate_limited'] += 1
+            return _error(429, 'RESOURCE_EXHAUSTED', 'Resource has been exhausted (e.g. check quota).')
+        window.append(now)
+
+        await asyncio.sleep(max(0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if random.random() < error_rate:
+            app.state.stats['errors'] += 1
+            return _error(503, 'UNAVAILABLE', 'The model is overloaded. Please try again later.')
+
+        instruction = prompt_text(body.get('systemInstruction') or body.get('system_instruction'))
+        contents, partial = split_continuation(body.get('contents') or [])
+        prompt = prompt_text(contents)
+        text = synthetic_answer(instruction, prompt)
+        finish_reason = 'STOP'
+        if partial is not None:
+            app.state.stats['continuations'] += 1
+            text = text[len(partial):] if text.startswith(partial) else text
+        elif random.random() < truncate_rate:
+            app.state.stats['truncated'] += 1
+            text = text[:random.randint(1, len(text) - 1)]
+            finish_reason = 'MAX_TOKENS'
+        prompt_tokens = (len(instruction) + len(prompt)) // 4
+        return {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': finish_reason}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': len(text) // 4,
+                              'totalTokenCount': prompt_tokens + len(text) // 4},
+            'modelVersion': model,
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini generateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.rpm,
+                           args.truncate_rate),
+                host=args.host, port=args.port)
@@ -0,0 +1,244 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+import httpx
+from dotenv import load_dotenv
+from google.genai import errors as genai_errors
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the LLM while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Wait until amount can be taken; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        # a single request larger than the bucket can never fit; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by about one slot per limit's worth of fast
+    successes, and halves on a 429 or when latency goes over the target.
+    release is synchronous so a slot is returned even by a cancelled call.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self, latency: Optional[float], overloaded: bool = False):
+        self.in_flight -= 1
+        if overloaded or (latency is not None and latency > self.latency_target):
+            # decrease at most once per target latency, so one burst of failures only halves it once
+            now = time.monotonic()
+            if now - self._last_decrease > self.latency_target:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+                logger.info(f"LLM concurrency limit decreased to {int(self.limit)}")
+        elif latency is not None:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; after reset_seconds one trial call is let through."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def before_call(self):
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._trial_in_flight):
+            raise CircuitOpenError(f"LLM circuit breaker is open after {self.failures} consecutive failures")
+        if state == 'half_open':
+            self._trial_in_flight = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("LLM circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """The trial call ended without telling whether the LLM recovered (cancelled, or a non-retryable error)"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning(f"LLM circuit breaker opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError))
+
+
+def is_overloaded(error: Exception) -> bool:
+    return isinstance(error, genai_errors.APIError) and error.code == 429
+
+
+class Governor:
+    """
+    Client-side control around every LLM call: request and token rate limits
+    (token buckets), AIMD adaptive concurrency, retries with exponential backoff
+    and full jitter on retryable errors, and a circuit breaker that fails fast
+    (CircuitOpenError) so callers can fall back to the local classifier.
+    Only outages (timeouts, 429 and 5xx) count as breaker failures; a bad
+    request says nothing about the LLM's health.
+    """
+
+    def __init__(self):
+        load_dotenv()
+        self.requests = TokenBucket(float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")))
+        self.tokens = TokenBucket(float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")))
+        self.limiter = AdaptiveLimiter(
+            initial=int(os.getenv("LLM_CONCURRENCY_INITIAL", "8")),
+            minimum=int(os.getenv("LLM_CONCURRENCY_MIN", "1")),
+            maximum=int(os.getenv("LLM_CONCURRENCY_MAX", "64")),
+            latency_target=float(os.getenv("LLM_LATENCY_TARGET_SECONDS", "10")))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")))
+        self.max_attempts = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4"))
+        self.base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0,
+                       'rejected_open_circuit': 0, 'throttled_seconds': 0.0}
+
+    async def call(self, func: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """
+        Run func (one LLM request) under the limits, retrying retryable errors.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open
+            Exception: The last error once retries are exhausted, or any non-retryable error
+        """
+        self._count('calls')
+        for attempt in range(self.max_attempts):
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count('rejected_open_circuit')
+                raise
+            try:
+                result = await self._attempt(func, estimated_tokens)
+            except Exception as e:
+                # timeouts, 429 and 5xx are outages; a bad request or a local error says nothing about the LLM
+                if is_retryable(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_trial()
+                if is_overloaded(e):
+                    self._count('rate_limited')
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    self._count('failures')
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning(f"LLM call failed ({str(e)[:200]}), retrying in {delay:.2f}s "
+                               f"(attempt {attempt + 1} of {self.max_attempts})")
+                self._count('retries')
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # cancelled: another call has to be able to try the half-open circuit
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, func: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Any:
+        """One request under the rate and concurrency limits; the concurrency slot is returned however it ends."""
+        throttled = await self.requests.acquire(1) + await self.tokens.acquire(estimated_tokens)
+        self._count('throttled_seconds', throttled)
+
+        await self.limiter.acquire()
+        self._count('attempts')
+        start_time = time.monotonic()
+        latency, overloaded = None, False
+        try:
+            result = await func()
+            latency = time.monotonic() - start_time
+            return result
+        except Exception as e:
+            overloaded = is_overloaded(e)
+            raise
+        finally:
+            self.limiter.release(latency, overloaded)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['throttled_seconds'] = round(stats['throttled_seconds'], 3)
+        return {**stats, 'concurrency_limit': int(self.limiter.limit), 'in_flight': self.limiter.in_flight,
+                'circuit': self.breaker.state}
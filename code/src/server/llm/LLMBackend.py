@@ -0,0 +1,300 @@
+import os
+import re
+import abc
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+from google import genai
+from google.genai import errors as genai_errors
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TYPE_PATTERN = re.compile(r'^Request Type: (.+)$', re.MULTILINE)
+BATCH_ITEM_PATTERN = re.compile(r'^=== EMAIL id=(\S+) ===$', re.MULTILINE)
+
+
+def prompt_text(content) -> str:
+    """Plain text of a prompt given as a string, Content objects or their JSON form."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(prompt_text(item) for item in content)
+    if isinstance(content, genai.types.Content):
+        content = content.model_dump(mode='json', exclude_none=True)
+    if isinstance(content, dict):
+        return "\n".join(part.get('text', '') for part in content.get('parts', []))
+    return ''
+
+
+def split_continuation(contents):
+    """A continuation request is [email, cut-off answer, "continue"]; returns (email contents, cut-off answer or None)."""
+    if isinstance(contents, list) and len(contents) == 3:
+        role = contents[1].role if isinstance(contents[1], genai.types.Content) else contents[1].get('role')
+        if role == 'model':
+            return contents[:1], prompt_text(contents[1])
+    return contents, None
+
+
+def synthetic_answer(instruction: str, prompt: str) -> str:
+    """
+    A well-formed but meaningless classification answer in the shape of the response schema,
+    choosing among the request types listed in the instruction. The same prompt always gets
+    the same answer, so a continuation can be served the rest of it.
+    """
+    request_types = REQUEST_TYPE_PATTERN.findall(instruction) or ['Unknown']
+    rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+
+    def answer():
+        return {'request_type': rng.choice(request_types), 'sub_request_type': '',
+                'confidence_score': round(rng.uniform(0.6, 0.99), 2),
+                'summary': 'Synthetic answer', 'priority': rng.choice(['High', 'Medium', 'Low']),
+                'extracted_fields': [{'name': 'reference', 'value': prompt[:20]}]}
+
+    item_ids = BATCH_ITEM_PATTERN.findall(prompt)
+    return json.dumps([{'id': item_id, **answer()} for item_id in item_ids] if item_ids else answer())
+
+
+def make_response(text: str, finish_reason: str = 'STOP') -> genai.types.GenerateContentResponse:
+    return genai.types.GenerateContentResponse(candidates=[genai.types.Candidate(
+        content=genai.types.Content(role='model', parts=[genai.types.Part(text=text)]),
+        finish_reason=finish_reason)])
+
+
+def prompt_key(model_name: str, contents, config) -> str:
+    """Hash of everything that determines the answer: model, system instruction, prompt and output settings."""
+    if isinstance(contents, list):
+        contents = [item.model_dump(mode='json', exclude_none=True) if isinstance(item, genai.types.Content) else item
+                    for item in contents]
+    schema = getattr(config.response_schema, '__name__', None) or repr(config.response_schema)
+    payload = json.dumps([model_name, config.system_instruction, config.cached_content, contents, schema,
+                          config.max_output_tokens],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMBackend(abc.ABC):
+    """Sends one generate_content request and returns a GenerateContentResponse."""
+
+    @abc.abstractmethod
+    async def generate(self, contents, config) -> genai.types.GenerateContentResponse:
+        """Send the request from the event loop."""
+
+    def generate_sync(self, contents, config) -> genai.types.GenerateContentResponse:
+        """
+        Send the request from synchronous code. Runs generate on a new event loop, so it can
+        only be called from a thread without a running loop (e.g. through run_io_bound);
+        coroutines must await generate instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.generate(contents, config))
+        raise RuntimeError("generate_sync called from a running event loop, await generate instead")
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class GeminiBackend(LLMBackend):
+    """The live Gemini API."""
+
+    def __init__(self, get_client, model_name):
+        self.get_client = get_client
+        self.model_name = model_name
+
+    async def generate(self, contents, config):
+        return await self.get_client().aio.models.generate_content(model=self.model_name, contents=contents, config=config)
+
+    def generate_sync(self, contents, config):
+        return self.get_client().models.generate_content(model=self.model_name, contents=contents, config=config)
+
+
+class RecordingStore:
+    """Prompt hash -> recorded answer, appended to a JSON lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self):
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry['key']] = entry
+                    except (ValueError, KeyError):
+                        continue
+        logger.info(f"Loaded {len(entries)} recorded LLM responses from {self.path}")
+        return entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return self._entries.get(key)
+
+    def put(self, key: str, text: str, finish_reason: str, seconds: float):
+        entry = {'key': key, 'text': text, 'finish_reason': finish_reason, 'seconds': round(seconds, 3)}
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            self._entries[key] = entry
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + "\n")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries or {})
+
+
+class RecordingBackend(LLMBackend):
+    """Calls the live backend and records every answer for later replay."""
+
+    def __init__(self, live: LLMBackend, store: RecordingStore, model_name: str):
+        self.live = live
+        self.store = store
+        self.model_name = model_name
+
+    async def generate(self, contents, config):
+        start_time = time.monotonic()
+        response = await self.live.generate(contents, config)
+        self._record(contents, config, response, time.monotonic() - start_time)
+        return response
+
+    def generate_sync(self, contents, config):
+        start_time = time.monotonic()
+        response = self.live.generate_sync(contents, config)
+        self._record(contents, config, response, time.monotonic() - start_time)
+        return response
+
+    def stats(self):
+        return {'recordings': len(self.store)}
+
+    def _record(self, contents, config, response, seconds):
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+        self.store.put(prompt_key(self.model_name, contents, config), response.text or '',
+                       getattr(finish_reason, 'name', None) or 'STOP', seconds)
+
+
+class SimulatedBackend(LLMBackend):
+    """
+    Answers without the network: recorded answers when a store is given
+    (replay), synthetic ones otherwise or on a replay miss. Latency follows a
+    configurable distribution, and 429/503 errors and cut-off answers are
+    injected at configurable rates.
+    """
+
+    def __init__(self, model_name: str, store: Optional[RecordingStore] = None, replay_miss: str = 'synthetic',
+                 latency: str = 'lognormal', latency_ms: float = 800, latency_spread: float = 0.5,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, truncate_rate: float = 0.0):
+        """
+        Args:
+            model_name: Model name, part of the replay key
+            store: Recorded answers to replay; None for synthetic answers only
+            replay_miss: On a prompt that was not recorded, "synthetic" answers anyway, "error" raises
+            latency: "constant", "uniform", "exponential", "lognormal", or "recorded" for the recorded latency
+            latency_ms: Mean latency (median for lognormal)
+            latency_spread: Sigma of the lognormal, or the +/- fraction of the uniform distribution
+            error_rate: Fraction of calls failing with 503 UNAVAILABLE
+            rate_limit_rate: Fraction of calls failing with 429 RESOURCE_EXHAUSTED
+            truncate_rate: Fraction of synthetic answers cut off with finish reason MAX_TOKENS
+        """
+        self.model_name = model_name
+        self.store = store
+        self.replay_miss = replay_miss
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.truncate_rate = truncate_rate
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'replayed': 0, 'synthetic': 0, 'misses': 0, 'errors': 0, 'rate_limited': 0}
+
+    def _sample_latency(self, recorded: Optional[float] = None) -> float:
+        mean = self.latency_ms / 1000
+        if self.latency == 'recorded' and recorded is not None:
+            return recorded
+        if self.latency == 'constant':
+            return mean
+        if self.latency == 'uniform':
+            return random.uniform(mean * (1 - self.latency_spread), mean * (1 + self.latency_spread))
+        if self.latency == 'exponential':
+            return random.expovariate(1 / mean) if mean > 0 else 0.0
+        return mean * math.exp(random.gauss(0, self.latency_spread))
+
+    async def generate(self, contents, config):
+        self._count('calls')
+        key = prompt_key(self.model_name, contents, config)
+        recorded = self.store.get(key) if self.store is not None else None
+        await asyncio.sleep(max(0.0, self._sample_latency(recorded['seconds'] if recorded else None)))
+
+        if random.random() < self.rate_limit_rate:
+            self._count('rate_limited')
+            raise genai_errors.ClientError(429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                                           'message': 'Simulated rate limit'}})
+        if random.random() < self.error_rate:
+            self._count('errors')
+            raise genai_errors.ServerError(503, {'error': {'code': 503, 'status': 'UNAVAILABLE',
+                                                           'message': 'Simulated server error'}})
+
+        if recorded is not None:
+            self._count('replayed')
+            return make_response(recorded['text'], recorded.get('finish_reason') or 'STOP')
+        if self.store is not None:
+            self._count('misses')
+            if self.replay_miss == 'error':
+                raise genai_errors.ClientError(404, {'error': {'code': 404, 'status': 'NOT_FOUND',
+                                                              'message': f'No recorded response for prompt {key[:12]}'}})
+
+        self._count('synthetic')
+        email, partial = split_continuation(contents)
+        text = synthetic_answer(prompt_text(config.system_instruction), prompt_text(email))
+        if partial is not None:
+            return make_response(text[len(partial):] if text.startswith(partial) else text)
+        if random.random() < self.truncate_rate:
+            return make_response(text[:random.randint(1, len(text) - 1)], 'MAX_TOKENS')
+        return make_response(text)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['recordings'] = len(self.store) if self.store is not None else None
+        return stats
+
+
+def create_backend(mode: str, get_client, model_name: str) -> LLMBackend:
+    """
+    Build the backend for LLM_BACKEND: "live" (Gemini), "record" (Gemini, recording
+    every answer), "replay" (recorded answers) or "synthetic" (generated answers).
+    """
+    live = GeminiBackend(get_client, model_name)
+    if mode == 'live':
+        return live
+    store = RecordingStore(os.getenv("LLM_RECORDINGS_FILE", "llm_recordings.jsonl"))
+    if mode == 'record':
+        return RecordingBackend(live, store, model_name)
+    if mode in ('replay', 'synthetic'):
+        return SimulatedBackend(
+            model_name, store=store if mode == 'replay' else None,
+            replay_miss=os.getenv("LLM_REPLAY_MISS", "synthetic").lower(),
+            latency=os.getenv("LLM_SIM_LATENCY", "lognormal").lower(),
+            latency_ms=float(os.getenv("LLM_SIM_LATENCY_MS", "800")),
+            latency_spread=float(os.getenv("LLM_SIM_LATENCY_SPREAD", "0.5")),
+            error_rate=float(os.getenv("LLM_SIM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("LLM_SIM_RATE_LIMIT_RATE", "0")),
+            truncate_rate=float(os.getenv("LLM_SIM_TRUNCATE_RATE", "0")))
+    raise ValueError(f"unknown LLM_BACKEND {mode!r}, expected live, record, replay or synthetic")
@@ -1,7 +1,25 @@
 from dotenv import load_dotenv
 import os
+import ssl
+import logging
+import threading
+import certifi
+import httpx
 from google import genai
 from . import DataStore
+from .ContextCache import GeminiContextCache, LocalContextCache
+from .MicroBatcher import MicroBatcher
+from .Governor import Governor
+from .ResponseSchema import ClassificationResponse, BatchClassificationResponse
+from .LLMBackend import create_backend
+from utils import jsonconverter
+
+logger = logging.getLogger(__name__)
+
+BATCH_INSTRUCTION = """Classify each of the {count} emails below independently, following the instructions above.
+Return only a JSON array with one object per email. Each object must contain an "id" field with the id of its email, plus the fields described above."""
+
+CONTINUATION_INSTRUCTION = """Your answer above was cut off. Continue it exactly where it stopped, without repeating anything, so that the two parts together form the complete JSON."""
 
 class LLMService:
 
@@ -10,42 +28,339 @@ class LLMService:
 
         # API Keys 
         self.google_api_key = os.getenv("GEMINI_API_KEY")
+        self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+        # e.g. a local fake Gemini server (python -m llm.FakeGeminiServer) for load and failure testing
+        self.base_url = os.getenv("GEMINI_BASE_URL")
+
+        # Connection pool settings shared by the sync and async HTTP clients
+        self.max_connections = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))
+        self.connect_timeout = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "10"))
+        self.request_timeout = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60"))
+
+        self._client = None
+        self._transports = None
+        self._client_lock = threading.Lock()
+        self._generation_config = None
+        self._generation_config_version = None
+        self._system_instruction = None
+        self._system_instruction_version = None
+
+        # Prompts only list the top-k request types ranked against the email; 0 always sends the full list
+        self.prompt_top_k = int(os.getenv("LLM_PROMPT_TOP_K", "5"))
+        # below this best similarity, or when a type outside the top-k scores nearly as well, the full list is sent
+        self.prompt_min_score = float(os.getenv("LLM_PROMPT_MIN_SCORE", "0.05"))
+        self.prompt_ambiguity_ratio = float(os.getenv("LLM_PROMPT_AMBIGUITY_RATIO", "0.9"))
+        self._pruned_configs = {}
+        self._pruned_configs_version = None
+        self._prompt_stats_lock = threading.Lock()
+        self.prompt_stats = {'pruned': 0, 'full': 0, 'pruned_instruction_chars': 0, 'full_instruction_chars': 0}
+
+        # Answers are constrained to the ClassificationResponse schema; cut-off answers get one continuation call
+        self.max_output_tokens = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "1024"))
+        self.response_schema_enabled = os.getenv("LLM_RESPONSE_SCHEMA", "true").lower() in ('1', 'true', 'yes')
+        self.continuation_enabled = os.getenv("LLM_CONTINUATION", "true").lower() in ('1', 'true', 'yes')
+        self._response_stats_lock = threading.Lock()
+        self.response_stats = {'responses': 0, 'truncated': 0, 'continuations': 0, 'continuations_recovered': 0}
+
+        # Rate limits, retries, adaptive concurrency and the circuit breaker for every async call
+        self.governor = Governor()
+
+        # Optional micro-batching: classifications arriving within a few milliseconds share one request
+        self.batcher = None
+        if os.getenv("LLM_BATCH_ENABLED", "false").lower() in ('1', 'true', 'yes'):
+            self.batcher = MicroBatcher(
+                self._call_gemini_batch, self._call_gemini_async,
+                max_items=int(os.getenv("LLM_BATCH_MAX_ITEMS", "8")),
+                max_wait=float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "20")) / 1000)
+
+        # Where requests go: "live" (Gemini), "record" (Gemini, answers saved for replay), or offline
+        # "replay" (recorded answers) and "synthetic" (generated answers), for load tests without quota or network
+        self.backend_mode = os.getenv("LLM_BACKEND", "live").lower()
+        self.backend = create_backend(self.backend_mode, self._get_client, self.model_name)
+
+        # Optional cached context holding the static system instruction: "gemini", "local" (offline backends
+        # only, its names mean nothing to Gemini) or "off"
+        context_cache_mode = os.getenv("GEMINI_CONTEXT_CACHE", "off").lower()
+        context_cache_ttl = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+        self.context_cache = None
+        if context_cache_mode == "gemini" and not self.live_answers:
+            logger.warning("Gemini context cache is not used by the offline LLM backends")
+        elif context_cache_mode == "gemini":
+            self.context_cache = GeminiContextCache(self._get_client, self.model_name, context_cache_ttl)
+        elif context_cache_mode == "local" and self.live_answers:
+            logger.warning("Local context cache is only used by the offline LLM backends, sending the system instruction inline")
+        elif context_cache_mode == "local":
+            self.context_cache = LocalContextCache(context_cache_ttl)
 
-    def _call_gemini(self, email_content):
-        """Calls Google's Gemini API"""
+    @property
+    def live_answers(self) -> bool:
+        """Whether answers come from Gemini, rather than being replayed or generated offline"""
+        return self.backend_mode in ('live', 'record')
+
+    def start(self):
+        """Creates the long-lived Gemini client so the first request does not pay for it"""
+        if self.google_api_key and self.live_answers:
+            self._get_client()
+
+    async def aclose(self):
+        """Closes the pooled connections held by the Gemini client"""
+        if self._transports is None:
+            return
+        transport, async_transport = self._transports
+        transport.close()
+        await async_transport.aclose()
+        self._client = None
+        self._transports = None
+
+    def _get_client(self):
         if not self.google_api_key:
             raise ValueError("GOOGLE_API_KEY is missing.")
-        
-        client = genai.Client(api_key=self.google_api_key)
 
-        generation_config=genai.types.GenerateContentConfig(
-        system_instruction=self.get_system_instruction(),
-        response_mime_type='application/json',
-        candidate_count=1, # Number of response versions to return
-        stop_sequences=['x'],
-        max_output_tokens=500,
-        temperature=0)
-        print(self.get_system_instruction())
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # the connection pools live in transports created here, so they can be closed without
+                    # reaching into the SDK's httpx clients; the SSL settings match the SDK's defaults
+                    limits = httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry)
+                    ssl_context = ssl.create_default_context(
+                        cafile=os.environ.get('SSL_CERT_FILE', certifi.where()), capath=os.environ.get('SSL_CERT_DIR'))
+                    transport = httpx.HTTPTransport(verify=ssl_context, limits=limits)
+                    async_transport = httpx.AsyncHTTPTransport(verify=ssl_context, limits=limits)
+                    timeout = httpx.Timeout(self.request_timeout, connect=self.connect_timeout)
+                    http_options = genai.types.HttpOptions(
+                        base_url=self.base_url,
+                        timeout=int(self.request_timeout * 1000),
+                        client_args={'transport': transport, 'timeout': timeout, 'verify': ssl_context},
+                        async_client_args={'transport': async_transport, 'timeout': timeout, 'verify': ssl_context})
+                    self._client = genai.Client(api_key=self.google_api_key, http_options=http_options)
+                    self._transports = (transport, async_transport)
+        return self._client
+
+    async def _get_generation_config_async(self, request_types=None):
+        """Like _get_generation_config, with the instruction in the cached context when one is configured"""
+        cached_content = None
+        if not request_types:
+            cached_content = await self._get_cached_context(DataStore.REQUEST_TYPES_VERSION)
+        return self._get_generation_config(request_types, cached_content)
+
+    def _get_generation_config(self, request_types=None, cached_content=None):
+        version = DataStore.REQUEST_TYPES_VERSION
+        if request_types:
+            return self._get_pruned_generation_config(version, tuple(request_types))
+        # Only rebuild the config when the request types have changed or the cached context was re-registered
+        if (self._generation_config is None or self._generation_config_version != version
+                or self._generation_config.cached_content != cached_content):
+            self._generation_config=self._new_generation_config(
+            None if cached_content else self.get_system_instruction(), cached_content)
+            self._generation_config_version = version
+        self._count_prompt('full', self._generation_config.system_instruction or self.get_system_instruction())
+        return self._generation_config
+
+    def _get_pruned_generation_config(self, version, request_types):
+        """Config whose system instruction only lists the given request types, compiled once per set of types"""
+        if self._pruned_configs_version != version:
+            self._pruned_configs = {}
+            self._pruned_configs_version = version
+        key = tuple(sorted(request_types))
+        config = self._pruned_configs.get(key)
+        if config is None:
+            # a few hundred distinct candidate sets at most in practice; drop the oldest beyond that
+            if len(self._pruned_configs) >= 512:
+                self._pruned_configs.pop(next(iter(self._pruned_configs)))
+            config = self._new_generation_config(self._build_system_instruction(request_types))
+            self._pruned_configs[key] = config
+        self._count_prompt('pruned', config.system_instruction)
+        return config
+
+    def _new_generation_config(self, system_instruction, cached_content=None):
+        return genai.types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            cached_content=cached_content,
+            response_mime_type='application/json',
+            response_schema=ClassificationResponse if self.response_schema_enabled else None,
+            candidate_count=1, # Number of response versions to return
+            max_output_tokens=self.max_output_tokens,
+            temperature=0)
+
+    def select_request_types(self, ranking):
+        """
+        Pick the request types to list in the prompt from a ranking of (request type, similarity).
+
+        Returns:
+            The top-k request types, or None to send the full list (pruning disabled, nothing to
+            prune, or a ranking too weak or too flat to trust)
+        """
+        if self.prompt_top_k <= 0 or len(DataStore.REQUEST_TYPES) <= self.prompt_top_k or not ranking:
+            return None
+        top_score = ranking[0][1]
+        if top_score < self.prompt_min_score:
+            return None
+        if len(ranking) > self.prompt_top_k and ranking[self.prompt_top_k][1] >= top_score * self.prompt_ambiguity_ratio:
+            return None
+        return [request_type for request_type, _ in ranking[:self.prompt_top_k] if request_type in DataStore.REQUEST_TYPES]
+
+    def _count_prompt(self, kind, instruction):
+        with self._prompt_stats_lock:
+            self.prompt_stats[kind] += 1
+            self.prompt_stats[f'{kind}_instruction_chars'] += len(instruction)
+
+    def get_prompt_stats(self):
+        with self._prompt_stats_lock:
+            stats = dict(self.prompt_stats)
+        for kind in ('pruned', 'full'):
+            count = stats.pop(f'{kind}_instruction_chars')
+            stats[f'avg_{kind}_instruction_chars'] = round(count / stats[kind]) if stats[kind] else None
+        return stats
 
-        response = client.models.generate_content(model="gemini-2.0-flash", contents=email_content,config=generation_config)
+    async def _get_cached_context(self, version):
+        """Returns the cached content name for the current instruction, or None to send it inline"""
+        if self.context_cache is None:
+            return None
+        try:
+            return await self.context_cache.get_or_register(version, self.get_system_instruction())
+        except Exception as e:
+            # e.g. the instruction is below the model's minimum cacheable size
+            logger.warning(f"Could not register cached context, sending system instruction inline: {str(e)}")
+            return None
+
+    def _call_gemini(self, email_content, request_types=None):
+        """Calls Google's Gemini API, listing only request_types in the prompt when given (always inline)"""
+        response = self.backend.generate_sync(email_content, self._get_generation_config(request_types))
 
         return response.text
+
+    async def _call_gemini_async(self, email_content, request_types=None):
+        """Calls Google's Gemini API through the async client without blocking the event loop"""
+        config = await self._get_generation_config_async(request_types)
+
+        response = await self.governor.call(
+            lambda: self.backend.generate(email_content, config),
+            self._estimate_tokens(email_content, config))
+
+        return await self._complete_response(email_content, config, response)
+
+    async def _complete_response(self, email_content, config, response):
+        """
+        Returns the response text, asking once for the rest of an answer that was cut off
+        (max output tokens reached, or JSON that only parses after repair) instead of resending the email
+        """
+        text = response.text or ''
+        truncated = bool(response.candidates) and response.candidates[0].finish_reason == genai.types.FinishReason.MAX_TOKENS
+        if not truncated and self._is_complete(text):
+            self._count_response('responses')
+            return text
+        self._count_response('responses', 'truncated')
+        if not self.continuation_enabled:
+            return text
+
+        # the schema would force a fresh JSON object, so the continuation is requested as plain text
+        continuation_config = config.model_copy(update={'response_mime_type': None, 'response_schema': None})
+        contents = [
+            genai.types.Content(role='user', parts=[genai.types.Part(text=email_content)]),
+            genai.types.Content(role='model', parts=[genai.types.Part(text=text)]),
+            genai.types.Content(role='user', parts=[genai.types.Part(text=CONTINUATION_INSTRUCTION)]),
+        ]
+        self._count_response('continuations')
+        try:
+            continuation = await self.governor.call(
+                lambda: self.backend.generate(contents, continuation_config),
+                self._estimate_tokens(email_content + text, config))
+        except Exception as e:
+            logger.warning(f"Continuation call failed, using the cut-off answer: {str(e)}")
+            return text
+        rest = jsonconverter.FENCE_PATTERN.sub('', (continuation.text or '').strip())
+        # the model sometimes starts over instead of continuing
+        for candidate in (text + rest, rest):
+            if self._is_complete(candidate):
+                self._count_response('continuations_recovered')
+                return candidate
+        return text
+
+    @staticmethod
+    def _is_complete(text):
+        try:
+            return not jsonconverter.parse_json(text)[1]
+        except ValueError:
+            return False
+
+    def _count_response(self, *keys):
+        with self._response_stats_lock:
+            for key in keys:
+                self.response_stats[key] += 1
+
+    def get_response_stats(self):
+        """Truncation and continuation counts, with the parse outcomes of all LLM answers"""
+        with self._response_stats_lock:
+            stats = dict(self.response_stats)
+        parse_stats = jsonconverter.get_parse_stats()
+        # every answer that still could not be parsed cost a full LLM call for nothing
+        return {**stats, **parse_stats, 'wasted_calls': parse_stats['failed']}
     
+    async def call_gemini(self, email_content, request_types=None):
+        """Classifies one email, through the micro-batcher when batching is enabled"""
+        if self.batcher is not None:
+            return await self.batcher.submit(email_content, request_types)
+        return await self._call_gemini_async(email_content, request_types)
+
+    async def _call_gemini_batch(self, items):
+        """Sends several emails as one request; the answer is a JSON array keyed by item id"""
+        # one prompt for the batch, so it lists the candidates of every item (or everything if any item needs it)
+        request_types = None
+        if all(item.request_types for item in items):
+            request_types = list(dict.fromkeys(name for item in items for name in item.request_types))
+        config = await self._get_generation_config_async(request_types)
+        update = {'max_output_tokens': config.max_output_tokens * len(items)}
+        if config.response_schema is not None:
+            update['response_schema'] = list[BatchClassificationResponse]
+        config = config.model_copy(update=update)
+
+        contents = [BATCH_INSTRUCTION.format(count=len(items))]
+        for item in items:
+            contents.append(f"=== EMAIL id={item.item_id} ===\n{item.content}")
+
+        contents = "\n\n".join(contents)
+
+        response = await self.governor.call(
+            lambda: self.backend.generate(contents, config),
+            self._estimate_tokens(contents, config))
+
+        return response.text
+
+    def _estimate_tokens(self, email_content, config):
+        """Rough tokens a call uses against the tokens-per-minute limit: prompt at ~4 chars per token plus the output cap"""
+        instruction = config.system_instruction or self.get_system_instruction()
+        return (len(email_content) + len(instruction)) // 4 + (config.max_output_tokens or 0)
+
     def get_system_instruction(self):
+        version = DataStore.REQUEST_TYPES_VERSION
+        if self._system_instruction is None or self._system_instruction_version != version:
+            self._system_instruction = self._build_system_instruction()
+            self._system_instruction_version = version
+            logger.info(f"Compiled system instruction for request types version {version}")
+        return self._system_instruction
+
+    def _build_system_instruction(self, request_types=None):
         role= DataStore.ROLE
         loan_servicing_requests=DataStore.REQUEST_TYPES
-        context_info=""
+        if request_types is not None:
+            loan_servicing_requests={name: loan_servicing_requests[name] for name in request_types if name in loan_servicing_requests}
+        context_info=[]
         for request_type, details in loan_servicing_requests.items():
-           context_info += f"Request Type: {request_type}\n"
-           context_info += f"Description: {details['description']}\n"
-    
-           if "sub_requests" in details:
-            context_info += "Sub Requests:\n"
-            for sub_request, sub_description in details["sub_requests"].items():
-                context_info += f"- {sub_request}: {sub_description}\n"
-    
-        context_info += "\n"
-        return role+ "\n\n"+context_info
+            context_info.append(f"Request Type: {request_type}\n")
+            context_info.append(f"Description: {details['description']}\n")
+
+            if "sub_requests" in details:
+                context_info.append("Sub Requests:\n")
+                for sub_request, sub_description in details["sub_requests"].items():
+                    context_info.append(f"- {sub_request}: {sub_description}\n")
+
+        context_info.append("\n")
+        return role+ "\n\n"+"".join(context_info)
 
 model = LLMService()
 
@@ -0,0 +1,148 @@
+import json
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Sequence
+from utils import jsonconverter
+from .ResponseSchema import BatchClassificationResponse
+
+logger = logging.getLogger(__name__)
+
+# an entry missing any of these was cut off or garbled and is retried on its own. extracted_fields is
+# left out: without the response schema the prompt asks for extra fields, not for that list
+REQUIRED_FIELDS = tuple(name for name in BatchClassificationResponse.model_fields if name != 'extracted_fields')
+
+
+@dataclass
+class BatchItem:
+    item_id: str
+    content: str
+    request_types: Optional[Sequence[str]]
+    future: asyncio.Future
+
+
+class MicroBatcher:
+    """
+    Collects classifications submitted within max_wait seconds (or until
+    max_items are pending) and sends them as one request, so the system
+    instruction and the per-call latency are paid once per batch. The batch
+    answer is a JSON array of objects keyed by "id"; each caller receives its
+    own object as JSON text. Items missing from the answer or answered
+    incompletely, and every item of a batch whose call failed, are retried on
+    their own.
+    """
+
+    def __init__(self, send_batch: Callable[[List[BatchItem]], Awaitable[str]],
+                 send_one: Callable[[str, Optional[Sequence[str]]], Awaitable[str]],
+                 max_items: int = 8, max_wait: float = 0.02):
+        """
+        Args:
+            send_batch: Coroutine function sending several items as one request, returning the raw response
+            send_one: Coroutine function sending a single item (content, request types), returning the raw response
+            max_items: Flush as soon as this many items are pending
+            max_wait: Seconds the first pending item waits for others before the batch is sent
+        """
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._pending: List[BatchItem] = []
+        self._timer = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {'batches': 0, 'batched_items': 0, 'single_calls': 0, 'retried_items': 0, 'failed_batches': 0,
+                       'incomplete_items': 0}
+
+    async def submit(self, content: str, request_types: Optional[Sequence[str]] = None) -> str:
+        """Queue one classification and wait for its raw response text."""
+        loop = asyncio.get_running_loop()
+        self._next_id += 1
+        item = BatchItem(str(self._next_id), content, request_types, loop.create_future())
+        self._pending.append(item)
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await item.future
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch_size'] = round(stats['batched_items'] / stats['batches'], 2) if stats['batches'] else None
+        return stats
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if items:
+            asyncio.ensure_future(self._run(items))
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    async def _run(self, items: List[BatchItem]):
+        if len(items) == 1:
+            self._count('single_calls')
+            await self._run_one(items[0])
+            return
+
+        self._count('batches')
+        self._count('batched_items', len(items))
+        results = {}
+        try:
+            results = self._parse(await self.send_batch(items))
+        except Exception as e:
+            self._count('failed_batches')
+            logger.warning(f"Batch of {len(items)} classifications failed, retrying them one by one: {str(e)}")
+
+        retries = []
+        for item in items:
+            result = results.get(item.item_id)
+            if result is None:
+                retries.append(item)
+            elif not item.future.done():
+                item.future.set_result(json.dumps(result))
+        if retries:
+            self._count('retried_items', len(retries))
+            await asyncio.gather(*(self._run_one(item) for item in retries))
+
+    async def _run_one(self, item: BatchItem):
+        try:
+            result = await self.send_one(item.content, item.request_types)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def _parse(self, raw: str) -> dict:
+        """Map item id to its result object; anything unusable or incomplete is left out and retried."""
+        try:
+            answer, repaired = jsonconverter.parse_json(raw)
+        except ValueError as e:
+            logger.warning(f"Could not parse batch response: {str(e)}")
+            return {}
+        if isinstance(answer, dict):
+            # some answers wrap the array, e.g. {"results": [...]}
+            answer = next((value for value in answer.values() if isinstance(value, list)), [])
+        entries = answer if isinstance(answer, list) else []
+        if repaired and entries:
+            # a cut-off array keeps the entries before the cut, but the last one was closed by the
+            # repair and may have lost fields or list items that still looked complete
+            entries = entries[:-1]
+            self._count('incomplete_items')
+        results = {}
+        for entry in entries:
+            if not isinstance(entry, dict) or 'id' not in entry:
+                continue
+            if not all(field in entry for field in REQUIRED_FIELDS) or not entry.get('request_type'):
+                self._count('incomplete_items')
+                continue
+            entry = dict(entry)
+            results[str(entry.pop('id'))] = entry
+        return results
@@ -0,0 +1,23 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+# Typed shape of a classification answer, passed to Gemini as the response schema so the
+# output is constrained to valid JSON with these fields, in this order
+
+
+class ExtractedField(BaseModel):
+    name: str = Field(description="Name of a field extracted from the email, e.g. deal_name or amount")
+    value: str = Field(description="Value of the field as written in the email")
+
+
+class ClassificationResponse(BaseModel):
+    request_type: str = Field(description="The request type that best classifies the email, from the predefined list")
+    sub_request_type: str = Field(description="The sub request type of the chosen request type, or an empty string")
+    confidence_score: float = Field(description="Certainty of the classification, from 0 to 1")
+    summary: str = Field(description="A brief summary of the request in the email")
+    priority: str = Field(description="Urgency of the request: High, Medium or Low")
+    extracted_fields: List[ExtractedField] = Field(description="Other important fields extracted from the email")
+
+
+class BatchClassificationResponse(ClassificationResponse):
+    id: str = Field(description="Id of the email this classification is for")
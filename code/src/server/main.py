@@ -1,18 +1,22 @@
-from fastapi import FastAPI, UploadFile, File,Request
+from fastapi import FastAPI, UploadFile, File,Request, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
+from typing import List
 import os
-import shutil
 import json
+import tarfile
+import zipfile
 from llm.LLMService import model
 import llm.DataStore as DataStore
-from utils import jsonconverter
-from services.document_processing_service import process_email_file
+from services.execution_service import executor
+from services.blob_service import blob_store
+from services.classification_service import classify_upload, classify_batch, expand_uploads, get_cache_stats
+from services.local_classifier_service import local_classifier
+from services.job_service import job_queue, QueueFullError
 from filereader.FileReaderAPI import read_file
 from fastapi.middleware.cors import CORSMiddleware
 
-UPLOAD_DIR = "uploads"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Get current script's directory
 REQUEST_TYPES_FILE_PATH = os.path.join(BASE_DIR, "request_types.json")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 origins = [
     "http://localhost:3000",  # React dev server
@@ -35,11 +39,26 @@ app.add_middleware(
 if os.path.exists(REQUEST_TYPES_FILE_PATH):
     with open(REQUEST_TYPES_FILE_PATH, "r") as f:
         DataStore.REQUEST_TYPES = json.load(f)
+        DataStore.bump_version()
         print("set")
 else:
     print("hnkjnjkni")
     DataStore.REQUEST_TYPES=REQUEST_TYPES = {}
 
+@app.on_event("startup")
+def start_llm_client():
+    model.start()
+    local_classifier.start()
+    job_queue.start()
+    # clean up blobs left behind by requests that didn't finish
+    blob_store.gc()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    await job_queue.stop()
+    await model.aclose()
+    executor.shutdown()
+
 # hello world route
 @app.get("/")
 async def root():
@@ -48,25 +67,68 @@ async def root():
 # route to handle call to ai model
 @app.post("/classify")
 async def classify_document(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    
-    # temporarily saving the file in a folder
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # work on the upload's spooled file directly rather than copying it
+    return await classify_upload(file.filename, file.file)
 
-    # reading the content passed from input file
-    decoded_content = "".join(process_email_file(file_path))
-    # decoded_content = read_file(file)
 
-    resp = model._call_gemini(decoded_content)
+# route to classify many files, or zip/tar archives of files, streaming results as NDJSON
+@app.post("/classify/batch")
+async def classify_documents(files: List[UploadFile] = File(...)):
+    uploads = [(file.filename, await file.read()) for file in files]
+    try:
+        items = await executor.run_io_bound(expand_uploads, uploads)
+    except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(classify_batch(items), media_type="application/x-ndjson")
+
 
-    # passing the decoded file conten to our LLM model
-    response = "JSON response could not be parsed"
+# route to queue a file for classification, returns a job id immediately
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    data = await file.read()
     try:
-        response = jsonconverter.get_response_string(resp)
-    except:
-        print("error occured while processing json response")
-    return {"filename": file.filename, "content": decoded_content, "response": response}
+        job = await job_queue.submit(file.filename, data)
+    except QueueFullError as e:
+        return JSONResponse(status_code=429, content={"message": str(e)}, headers={"Retry-After": "5"})
+    return {**job.to_dict(), "queue_depth": job_queue.depth}
+
+
+# route to get the status of a job
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job.to_dict(), "events": job.events}
+
+
+# route to get the result of a finished job
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == 'failed':
+        # the request was fine; the job's own failure is reported in its state
+        return JSONResponse(status_code=409, content=job.to_dict())
+    if not job.finished:
+        return JSONResponse(status_code=202, content=job.to_dict())
+    return job.result
+
+
+# route to stream the progress of a job as server-sent events
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_queue.events(job), media_type="text/event-stream")
+
+
+# route to expose classification cache hit/miss counts
+@app.get("/cache/stats")
+async def cache_stats():
+    return get_cache_stats()
 
 
 # route to add/update request types
@@ -74,6 +136,7 @@ async def classify_document(file: UploadFile = File(...)):
 async def add_request_type(req:Request):
     new_request=await req.json()
     DataStore.REQUEST_TYPES.update(new_request)
+    DataStore.bump_version()
     save_request_types()
     return {"message":"Request Type Succesfully updated"}
 
@@ -83,6 +146,7 @@ async def add_request_type(req:Request):
 async def add_request_type(request_type:str):
     request_type.lower()
     del DataStore.REQUEST_TYPES[request_type]
+    DataStore.bump_version()
     save_request_types()
     return {"message":"Request Type Succesfully deleted"}
 
@@ -0,0 +1,134 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+from dotenv import load_dotenv
+from services.cache_service import hash_bytes, hash_stream
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Content-addressed store for uploads that have to be on disk.
+
+    Each blob is written once under blobs/<sha256>. Every user of a blob gets
+    its own hard link under refs/, so the link count of the blob file is its
+    reference count, shared by every process using the same directory. When
+    the last reference is released the blob is deleted.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_ref_age: Optional[float] = None):
+        """
+        Initialize the blob store.
+
+        Args:
+            root: Directory holding the store (defaults to BLOB_STORE_DIR or "uploads")
+            max_ref_age: Seconds after which gc() treats a reference as leaked by a
+                crashed request (defaults to BLOB_REF_MAX_AGE_SECONDS or 3600)
+        """
+        load_dotenv()
+        self.root = root or os.getenv("BLOB_STORE_DIR", "uploads")
+        self.max_ref_age = max_ref_age or float(os.getenv("BLOB_REF_MAX_AGE_SECONDS", "3600"))
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.ref_dir = os.path.join(self.root, "refs")
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        for directory in (self.blob_dir, self.ref_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, data: Union[bytes, BinaryIO], digest: Optional[str] = None) -> str:
+        """
+        Store data (if not already stored) and take a reference to it.
+
+        Args:
+            data: Bytes or a binary file object positioned at the start of the content
+            digest: sha256 hex digest of the content, if already known
+
+        Returns:
+            Path of the reference, readable until release() is called with it
+        """
+        if digest is None:
+            digest = hash_bytes(data) if isinstance(data, bytes) else hash_stream(data)[0]
+        blob_path = os.path.join(self.blob_dir, digest)
+        ref_path = os.path.join(self.ref_dir, f"{digest}.{uuid.uuid4().hex}")
+
+        while True:
+            if not os.path.exists(blob_path):
+                self._write(blob_path, data)
+            try:
+                os.link(blob_path, ref_path)
+                return ref_path
+            except FileNotFoundError:
+                # the last reference was released between the write and the link; write it again
+                continue
+
+    def release(self, ref_path: str):
+        """Drop a reference, deleting the blob when it was the last one."""
+        digest = os.path.basename(ref_path).split('.', 1)[0]
+        try:
+            os.unlink(ref_path)
+        except FileNotFoundError:
+            return
+        self._delete_if_unreferenced(os.path.join(self.blob_dir, digest))
+
+    @contextmanager
+    def hold(self, data: Union[bytes, BinaryIO], digest: Optional[str] = None) -> Iterator[str]:
+        """Context manager around acquire()/release()."""
+        ref_path = self.acquire(data, digest)
+        try:
+            yield ref_path
+        finally:
+            self.release(ref_path)
+
+    def gc(self) -> int:
+        """
+        Remove references older than max_ref_age (left behind by crashed requests),
+        unreferenced blobs and stale temporary files.
+
+        Returns:
+            Number of files removed
+        """
+        removed = 0
+        cutoff = time.time() - self.max_ref_age
+        for directory in (self.ref_dir, self.tmp_dir):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    # refs share the blob's inode, whose ctime is updated whenever a reference is linked
+                    if os.path.getctime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        for name in os.listdir(self.blob_dir):
+            removed += self._delete_if_unreferenced(os.path.join(self.blob_dir, name))
+        if removed:
+            logger.info(f"Blob store garbage collection removed {removed} files")
+        return removed
+
+    def _write(self, blob_path: str, data: Union[bytes, BinaryIO]):
+        # write to a temporary name and rename, so readers never see a partial blob
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        with open(tmp_path, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                data.seek(0)
+                shutil.copyfileobj(data, f)
+        os.replace(tmp_path, blob_path)
+
+    @staticmethod
+    def _delete_if_unreferenced(blob_path: str) -> int:
+        try:
+            if os.stat(blob_path).st_nlink == 1:
+                os.unlink(blob_path)
+                return 1
+        except FileNotFoundError:
+            pass
+        return 0
+
+
+blob_store = BlobStore()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from cachetools import TTLCache
+from dotenv import load_dotenv
+import llm.DataStore as DataStore
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCacheTier:
+    """
+    On-disk cache tier backed by SQLite, shared by every uvicorn worker
+    pointing at the same database file.
+    """
+
+    def __init__(self, db_path: str, namespace: str, max_entries: int, ttl_seconds: float):
+        """
+        Initialize the SQLite tier.
+
+        Args:
+            db_path: Path to the SQLite database file
+            namespace: Name separating this cache's rows from other caches in the same file
+            max_entries: Maximum number of rows kept for this namespace
+            ttl_seconds: Age after which rows are treated as expired
+        """
+        self.db_path = db_path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now))
+            self._writes_since_eviction += 1
+            # Evicting on every write would scan the table each time, so do it in batches
+            if self._writes_since_eviction >= 100:
+                self._evict(now)
+                self._writes_since_eviction = 0
+
+    def _evict(self, now: float):
+        self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+            (self.namespace, now - self.ttl_seconds))
+        self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+
+class TieredCache:
+    """
+    Cache with an in-memory LRU tier (with TTL) in front of an optional SQLite tier.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 1024, ttl_seconds: float = 86400,
+                 db_path: Optional[str] = None, max_db_entries: int = 100000):
+        """
+        Initialize the cache.
+
+        Args:
+            namespace: Name of the cache, used in stats and to share a SQLite file
+            max_entries: Maximum number of entries in the in-memory tier
+            ttl_seconds: Time to live of an entry in both tiers
+            db_path: Path to the SQLite database, or None to keep the cache in memory only
+            max_db_entries: Maximum number of entries in the SQLite tier
+        """
+        self.namespace = namespace
+        self._memory = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._disk = SQLiteCacheTier(db_path, namespace, max_db_entries, ttl_seconds) if db_path else None
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0}
+
+    @property
+    def disk_enabled(self) -> bool:
+        """Whether lookups can reach the SQLite tier, which blocks for up to its busy timeout"""
+        return self._disk is not None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._stats['memory_hits'] += 1
+                return value
+
+        if self._disk is not None:
+            try:
+                value = self._disk.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Error reading {self.namespace} cache from disk: {str(e)}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._memory[key] = value
+                    self._stats['disk_hits'] += 1
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._stats['sets'] += 1
+
+        if self._disk is not None:
+            try:
+                self._disk.set(key, value)
+            except sqlite3.Error as e:
+                logger.error(f"Error writing {self.namespace} cache to disk: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['disk_enabled'] = self.disk_enabled
+        return stats
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_stream(f: BinaryIO, chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+    """Hash a binary file object in chunks, returning the hex digest and the size in bytes."""
+    digest = hashlib.sha256()
+    size = 0
+    f.seek(0)
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return digest.hexdigest(), size
+
+
+def hash_text(text: str) -> str:
+    """Hash text after normalizing case and whitespace so formatting differences still match."""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+_request_types_fingerprint = (None, None)
+
+def request_types_fingerprint() -> str:
+    """
+    Short hash of the current request types. Unlike REQUEST_TYPES_VERSION it is
+    stable across restarts and workers, so it is safe to use in disk cache keys.
+    """
+    global _request_types_fingerprint
+    version = DataStore.REQUEST_TYPES_VERSION
+    if _request_types_fingerprint[0] != version:
+        payload = json.dumps(DataStore.REQUEST_TYPES, sort_keys=True)
+        _request_types_fingerprint = (version, hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16])
+    return _request_types_fingerprint[1]
+
+
+def _build_cache(namespace: str) -> TieredCache:
+    load_dotenv()
+    return TieredCache(
+        namespace,
+        max_entries=int(os.getenv("CLASSIFICATION_CACHE_SIZE", "1024")),
+        ttl_seconds=float(os.getenv("CLASSIFICATION_CACHE_TTL", "86400")),
+        db_path=os.getenv("CLASSIFICATION_CACHE_DB") or None,
+        max_db_entries=int(os.getenv("CLASSIFICATION_CACHE_DB_MAX_ENTRIES", "100000")))
+
+
+# keyed by hash of the uploaded bytes + request types fingerprint
+file_cache = _build_cache("classification_file")
+# keyed by hash of the normalized LLM input + request types fingerprint
+text_cache = _build_cache("classification_text")
@@ -0,0 +1,321 @@
+import os
+import io
+import json
+import queue
+import asyncio
+import logging
+import tarfile
+import zipfile
+import functools
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+import llm.DataStore as DataStore
+from llm.LLMService import model
+from utils import jsonconverter
+from services.document_processing_service import process_email_file_with_stats
+from services.ocr_service import OCRStats
+from services.execution_service import executor
+from services.cache_service import TieredCache, file_cache, text_cache, hash_bytes, hash_stream, hash_text, request_types_fingerprint
+from services.blob_service import blob_store
+from services.map_reduce_service import ChunkParseError, classify_chunks
+from services.local_classifier_service import local_classifier
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# uploads up to this size are sent to the extraction workers in memory, larger ones through the blob store
+UPLOAD_INLINE_MAX_BYTES = int(os.getenv("UPLOAD_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# how often extraction progress events are picked up from the worker processes
+PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", "0.05"))
+
+# file types that can be classified on their own, including members of uploaded archives
+CLASSIFIABLE_EXTENSIONS = ('.eml', '.pdf', '.doc', '.docx')
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "5000"))
+# total size of a batch once archives are expanded, checked against the sizes archives declare before reading
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(1024 * 1024 * 1024)))
+BATCH_EXTRACTION_CONCURRENCY = int(os.getenv("BATCH_EXTRACTION_CONCURRENCY", str(executor.cpu_workers)))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# OCR totals reported back by the extraction workers
+ocr_stats = OCRStats()
+
+
+async def classify_upload(filename: str, data: Union[bytes, BinaryIO],
+                          extraction_limit: Optional[asyncio.Semaphore] = None,
+                          llm_limit: Optional[asyncio.Semaphore] = None,
+                          progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Run an uploaded file through extraction and the LLM, reusing earlier results
+    for identical files or identical extracted text.
+
+    Args:
+        filename: Name of the uploaded file
+        data: Raw bytes of the uploaded file, or its binary file object (e.g. UploadFile.file)
+        extraction_limit: Optional semaphore bounding concurrent extractions
+        llm_limit: Optional semaphore bounding concurrent LLM calls
+        progress: Optional callable receiving per-stage progress events
+
+    Returns:
+        Dict with the filename, the text sent to the LLM and the parsed response
+    """
+    version = DataStore.REQUEST_TYPES_VERSION
+    # answers of the offline LLM backends are cached apart from real ones
+    fingerprint = f"{request_types_fingerprint()}:{model.backend_mode}"
+    if isinstance(data, bytes):
+        digest = hash_bytes(data)
+        size = len(data)
+    else:
+        digest, size = await executor.run_io_bound(hash_stream, data)
+    file_key = f"{digest}:{fingerprint}"
+
+    report = progress or (lambda event: None)
+
+    cached = await _cache_get(file_cache, file_key)
+    if cached is not None:
+        logger.info(f"Classification cache hit for file {filename}")
+        report({'stage': 'cache_hit'})
+        return {"filename": filename, **cached}
+
+    async with extraction_limit or nullcontext():
+        # reading the content passed from input file (parsing and OCR run in the process pool)
+        report({'stage': 'extraction_started'})
+        if size <= UPLOAD_INLINE_MAX_BYTES:
+            if not isinstance(data, bytes):
+                data = await executor.run_io_bound(_read_upload, data)
+            text_chunks = await _extract(data, filename, progress)
+        else:
+            # large uploads go to the workers as a path instead of being pickled
+            ref_path = await executor.run_io_bound(blob_store.acquire, data, digest)
+            try:
+                text_chunks = await _extract(ref_path, filename, progress)
+            finally:
+                await executor.run_io_bound(blob_store.release, ref_path)
+    decoded_content = "\n\n".join(text_chunks)
+
+    text_key = f"{hash_text(decoded_content)}:{fingerprint}"
+    cached = await _cache_get(text_cache, text_key)
+    if cached is not None:
+        logger.info(f"Classification cache hit for content of {filename}")
+        report({'stage': 'cache_hit'})
+        await _cache_set(file_cache, file_key, cached)
+        return {"filename": filename, **cached}
+
+    # routine emails are classified locally when the local classifier is confident enough
+    local_result = await executor.run_io_bound(local_classifier.classify, decoded_content)
+    if local_classifier.route(local_result, filename) == 'local':
+        report({'stage': 'local_classified'})
+        return await _store_result(file_key, text_key, version, filename,
+                             {"content": decoded_content, "response": local_classifier.to_response(local_result)})
+
+    # only the request types most similar to the email go into the prompt, so its size doesn't grow with the taxonomy
+    request_types = model.select_request_types(local_result['ranking'] if local_result else None)
+    call = functools.partial(model.call_gemini, request_types=request_types)
+    if request_types:
+        logger.info(f"Prompt for {filename} lists {len(request_types)} of {len(DataStore.REQUEST_TYPES)} request types: "
+                    f"{', '.join(request_types)}")
+
+    response = "JSON response could not be parsed"
+    map_reduce = len(text_chunks) > 1
+    async with llm_limit or nullcontext():
+        report({'stage': 'llm_started', 'chunks': len(text_chunks)} if map_reduce else {'stage': 'llm_started'})
+        try:
+            if map_reduce:
+                # documents over the token budget: classify the chunks concurrently and merge the answers
+                merged = await classify_chunks(text_chunks, call)
+            else:
+                resp = await call(decoded_content)
+        except ChunkParseError as e:
+            # like an unparsable single answer below
+            logger.error(f"Map-reduce classification of {filename} failed: {str(e)}")
+            return _fallback(filename, decoded_content, local_result, response, report)
+        except Exception as e:
+            # the circuit breaker is open or retries were exhausted (for every chunk, when map-reducing)
+            if not local_classifier.can_fall_back(local_result):
+                raise
+            logger.error(f"LLM classification of {filename} failed: {str(e)}")
+            return _fallback(filename, decoded_content, local_result, response, report)
+        finally:
+            report({'stage': 'llm_done'})
+
+    if map_reduce:
+        response = merged
+    else:
+        # passing the decoded file conten to our LLM model
+        try:
+            response = jsonconverter.get_response_string(resp)
+        except ValueError:
+            logger.warning(f"LLM response for {filename} could not be parsed as JSON")
+            return _fallback(filename, decoded_content, local_result, response, report)
+
+    # the local classifier only learns from real LLM answers
+    if isinstance(response, dict) and model.live_answers:
+        await executor.run_io_bound(local_classifier.record_llm_result, decoded_content, local_result, response, filename)
+
+    return await _store_result(file_key, text_key, version, filename, {"content": decoded_content, "response": response})
+
+
+def _fallback(filename: str, decoded_content: str, local_result: Optional[Dict[str, Any]], response: Any,
+              report: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Answer with the local classifier's best guess when the LLM is unavailable, if it
+    is above the local classifier's confidence threshold; otherwise with the error response.
+    The result is not cached, so the email is classified by the LLM once it recovers.
+    """
+    if not local_classifier.can_fall_back(local_result):
+        return {"filename": filename, "content": decoded_content, "response": response}
+    logger.warning(f"Falling back to the local classifier for {filename}")
+    report({'stage': 'local_fallback'})
+    return {"filename": filename, "content": decoded_content,
+            "response": local_classifier.to_response(local_result, classified_by='local_fallback')}
+
+
+async def _store_result(file_key: str, text_key: str, version: int, filename: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    # only cache results for the request types they were classified against
+    if version == DataStore.REQUEST_TYPES_VERSION:
+        await _cache_set(file_cache, file_key, result)
+        await _cache_set(text_cache, text_key, result)
+    return {"filename": filename, **result}
+
+
+async def _cache_get(cache: TieredCache, key: str) -> Optional[Any]:
+    # the SQLite tier can wait on its busy timeout, so lookups that may reach it run on an I/O thread
+    if cache.disk_enabled:
+        return await executor.run_io_bound(cache.get, key)
+    return cache.get(key)
+
+
+async def _cache_set(cache: TieredCache, key: str, value: Any):
+    if cache.disk_enabled:
+        await executor.run_io_bound(cache.set, key, value)
+    else:
+        cache.set(key, value)
+
+
+def _read_upload(upload: BinaryIO) -> bytes:
+    upload.seek(0)
+    return upload.read()
+
+
+async def _extract(source: Union[str, bytes], filename: str,
+                   progress: Optional[Callable[[Dict[str, Any]], None]]) -> List[str]:
+    """Run extraction in the process pool, relaying its progress events and stats back to this process."""
+    if progress is None:
+        text_chunks, stats = await executor.run_cpu_bound(process_email_file_with_stats, source, None, filename)
+        ocr_stats.merge(stats['ocr'])
+        return text_chunks
+
+    progress_queue = await executor.run_io_bound(executor.manager.Queue)
+
+    async def relay():
+        # poll without blocking rather than park an I/O thread on get() for the whole extraction
+        while True:
+            try:
+                event = progress_queue.get_nowait()
+            except queue.Empty:
+                await asyncio.sleep(PROGRESS_POLL_SECONDS)
+                continue
+            if event is None:
+                break
+            progress(event)
+
+    relay_task = asyncio.create_task(relay())
+    try:
+        text_chunks, stats = await executor.run_cpu_bound(process_email_file_with_stats, source, progress_queue, filename)
+        ocr_stats.merge(stats['ocr'])
+        return text_chunks
+    finally:
+        await executor.run_io_bound(progress_queue.put, None)
+        await relay_task
+
+
+def expand_uploads(uploads: List[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """
+    Expand zip and tar archives into their classifiable members.
+
+    Member counts and declared sizes are checked against BATCH_MAX_FILES and
+    BATCH_MAX_BYTES before each member is read, so an archive bomb is rejected
+    without being decompressed.
+
+    Args:
+        uploads: List of (filename, bytes) pairs as uploaded
+
+    Returns:
+        List of (filename, bytes) pairs to classify
+
+    Raises:
+        ValueError: If the batch exceeds the file count or size limit
+    """
+    items = []
+    total_bytes = 0
+
+    def add(name, size, read):
+        nonlocal total_bytes
+        if len(items) >= BATCH_MAX_FILES:
+            raise ValueError(f"Batch exceeds the limit of {BATCH_MAX_FILES} files")
+        total_bytes += size
+        if total_bytes > BATCH_MAX_BYTES:
+            raise ValueError(f"Batch exceeds the limit of {BATCH_MAX_BYTES} bytes")
+        data = read()
+        # readers stop at the declared size, but don't trust it for the total
+        total_bytes += len(data) - size
+        items.append((name, data))
+
+    for filename, data in uploads:
+        lower_name = filename.lower()
+        if lower_name.endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and member.filename.lower().endswith(CLASSIFIABLE_EXTENSIONS):
+                        add(member.filename, member.file_size, functools.partial(archive.read, member))
+        elif lower_name.endswith(('.tar', '.tar.gz', '.tgz')):
+            with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith(CLASSIFIABLE_EXTENSIONS):
+                        add(member.name, member.size, lambda member=member: archive.extractfile(member).read())
+        else:
+            add(filename, len(data), lambda data=data: data)
+    return items
+
+
+async def classify_batch(items: List[Tuple[str, bytes]]) -> AsyncIterator[str]:
+    """
+    Classify many files concurrently, pipelining extraction and LLM calls
+    under separate concurrency limits.
+
+    Args:
+        items: List of (filename, bytes) pairs
+
+    Yields:
+        One NDJSON line per file, in completion order
+    """
+    extraction_limit = asyncio.Semaphore(BATCH_EXTRACTION_CONCURRENCY)
+    llm_limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def classify_item(index, filename, data):
+        try:
+            result = await classify_upload(filename, data, extraction_limit, llm_limit)
+        except Exception as e:
+            logger.error(f"Error classifying {filename} in batch: {str(e)}")
+            result = {"filename": filename, "error": str(e)}
+        return {"index": index, **result}
+
+    tasks = [asyncio.create_task(classify_item(i, filename, data)) for i, (filename, data) in enumerate(items)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield json.dumps(await task) + "\n"
+    finally:
+        # client disconnected before the batch finished
+        for task in tasks:
+            task.cancel()
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    return {"file": file_cache.stats(), "text": text_cache.stats(), "ocr": ocr_stats.to_dict(),
+            "local_classifier": local_classifier.stats(), "prompt": model.get_prompt_stats(),
+            "batching": model.batcher.stats() if model.batcher else None, "llm": model.governor.stats(),
+            "responses": model.get_response_stats(),
+            "backend": {"mode": model.backend_mode, **model.backend.stats()}}
@@ -1,18 +1,26 @@
 import os
 import re
+import time
+import io
 import email
 import logging
-import tempfile
 import pytesseract
 from email import policy
 from email.parser import BytesParser
 from email.message import EmailMessage
-from typing import Dict, List, Tuple, Any, Optional, Union
+from typing import Dict, List, Tuple, Any, Optional, Union, Callable, BinaryIO
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import fitz  # PyMuPDF for PDF processing
-import docx2txt  # for Word document processing
 from PIL import Image
 import numpy as np
-import requests
+from dotenv import load_dotenv
+from services.ocr_service import OCRService, OCRStats, ocr_service as default_ocr_service
+from services.spreadsheet_service import SpreadsheetLimits, extract_spreadsheet
+from services.eml_stream_service import EmlStreamLimits, parse_eml_stream
+from filereader.ReaderRegistry import readers, sniff_format, format_from_filename
+from services.token_budget_service import TokenBudget, TokenBudgetAssembler
+from utils.htmlconverter import clean_email_body
 
 # Configure logging
 logging.basicConfig(
@@ -21,23 +29,104 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class ExtractionResult:
+    """
+    Text extracted from a document in a single pass, so header detection
+    and the plain-document fallback can share it.
+    """
+    page_texts: List[str] = field(default_factory=list)
+    ocr_pages: List[int] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    ocr_cache_hits: int = 0
+    error: Optional[str] = None
+    
+    @property
+    def text(self) -> str:
+        """Full text of the document, or the error message if extraction failed"""
+        return self.error if self.error else "\n".join(self.page_texts)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pages': len(self.page_texts),
+            'ocr_pages': list(self.ocr_pages),
+            'ocr_cache_hits': self.ocr_cache_hits,
+            'timings': dict(self.timings),
+            'error': self.error
+        }
+
+
+def _source_name(source: Union[str, bytes, BinaryIO], name: Optional[str] = None) -> str:
+    """Name used in logs and progress events for a document given as a path, bytes or a file object"""
+    if name:
+        return name
+    return os.path.basename(source) if isinstance(source, str) else 'attachment'
+
+
+def _data_size(source: Union[str, bytes, BinaryIO]) -> int:
+    """Size in bytes of a document given as a path, bytes or a binary file object"""
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    if isinstance(source, bytes):
+        return len(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _read_data(data: Union[str, bytes, Any]) -> bytes:
+    """Document bytes, reading them from a path or a file object (e.g. a spooled buffer) if needed"""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        with open(data, 'rb') as f:
+            return f.read()
+    data.seek(0)
+    return data.read()
+
+
 class EmailProcessor:
     """
     Class for processing emails and their attachments from various input formats.
     Supports .eml files, PDFs containing email content, and .doc/.docx files.
     """
     
-    def __init__(self, ocr_enabled: bool = True, ocr_lang: str = 'eng'):
+    def __init__(self, ocr_enabled: bool = True, ocr_lang: str = 'eng',
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 ocr_service: Optional[OCRService] = None,
+                 attachment_workers: Optional[int] = None,
+                 attachment_timeout: Optional[float] = None,
+                 attachment_budget: Optional[float] = None):
         """
         Initialize the email processor.
         
         Args:
             ocr_enabled: Whether to use OCR for image-based content in PDFs
             ocr_lang: Language for OCR processing
+            progress_callback: Optional callable receiving progress events (e.g. OCR page n of m)
+            ocr_service: OCR process pool used for scanned pages and images (defaults to the shared one sized by OCR_WORKERS)
+            attachment_workers: Attachments of one email processed concurrently (EMAIL_ATTACHMENT_WORKERS)
+            attachment_timeout: Seconds a single attachment may take before it is skipped (ATTACHMENT_TIMEOUT_SECONDS)
+            attachment_budget: Seconds all attachments of one email may take together (EMAIL_ATTACHMENT_BUDGET_SECONDS)
         """
+        load_dotenv()
         self.ocr_enabled = ocr_enabled
         self.ocr_lang = ocr_lang
-        # Define allowed attachment types for processing
+        self.progress_callback = progress_callback
+        self.ocr_service = ocr_service or default_ocr_service
+        self.attachment_workers = attachment_workers or int(os.getenv("EMAIL_ATTACHMENT_WORKERS", "4"))
+        self.attachment_timeout = attachment_timeout or float(os.getenv("ATTACHMENT_TIMEOUT_SECONDS", "60"))
+        self.attachment_budget = attachment_budget or float(os.getenv("EMAIL_ATTACHMENT_BUDGET_SECONDS", "180"))
+        # caps on sheets/rows/columns/characters for spreadsheet attachments (EXCEL_* settings)
+        self.spreadsheet_limits = SpreadsheetLimits.from_env()
+        # .eml files at least this large are parsed in streaming mode with the EML_* size limits
+        self.eml_streaming_threshold = int(os.getenv("EML_STREAMING_THRESHOLD_BYTES", str(10 * 1024 * 1024)))
+        self.eml_limits = EmlStreamLimits.from_env()
+        # OCR totals across the input and all its attachments
+        self.ocr_stats = OCRStats()
+        # Handlers per format as returned by sniff_format
         self.allowed_attachment_types = {
             'pdf': self.process_pdf_file,
             'doc': self.process_word_file,
@@ -48,56 +137,98 @@ class EmailProcessor:
             'png': self.process_image_file,
             'jpg': self.process_image_file,
             'jpeg': self.process_image_file,
+            'tif': self.process_image_file,
+            'tiff': self.process_image_file,
+            'bmp': self.process_image_file,
+            'eml': self.process_email_attachment,
         }
+        # image attachments are batched into a single OCR call per email
+        self.image_attachment_types = {'png', 'jpg', 'jpeg', 'tif', 'tiff', 'bmp'}
         logger.info("Email processor initialized")
     
-    def process_input(self, file_path: str) -> Dict[str, Any]:
+    def report_progress(self, stage: str, **details):
+        """
+        Send a progress event to the progress callback, if any.
+        
+        Args:
+            stage: Name of the processing stage
+            **details: Extra event fields (e.g. page and pages for OCR)
+        """
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback({'stage': stage, **details})
+        except Exception as e:
+            logger.warning(f"Error reporting progress for stage {stage}: {str(e)}")
+    
+    def process_input(self, source: Union[str, bytes, BinaryIO], filename: Optional[str] = None) -> Dict[str, Any]:
         """
         Determines file type and routes to appropriate processor.
         
         Args:
-            file_path: Path to the input file
+            source: Path to the input file, its bytes, or a binary file object (e.g. an upload's spooled file)
+            filename: Name of the input file, used for its type; required unless source is a path
             
         Returns:
             Dict containing processed email data with attachments
         """
-        file_extension = os.path.splitext(file_path)[1].lower().replace('.', '')
+        file_path = filename or _source_name(source)
+        # route on the content rather than the name, so misnamed files reach the right handler
+        try:
+            file_extension = sniff_format(source, file_path)
+        except OSError:
+            # unreadable path; let the handler for its extension report the error
+            file_extension = format_from_filename(file_path)
         
         logger.info(f"Processing input file: {file_path} (type: {file_extension})")
         
         if file_extension == 'eml':
-            return self.process_eml_file(file_path)
-        elif file_extension == 'pdf':
-            # For PDFs, it is either email content or a regular document
-            email_data = self.extract_email_from_pdf(file_path)
-            if email_data:
-                return email_data
-            else:
+            return self.process_eml_file(source)
+        
+        # PDF and Word handlers work on a path or on bytes
+        if not isinstance(source, (str, bytes)):
+            source = _read_data(source)
+        
+        if file_extension == 'pdf':
+            # For PDFs, it is either email content or a regular document; extract once and reuse the text
+            extraction = self.extract_pdf(source, file_path)
+            email_data = self.extract_email_from_pdf(source, extraction)
+            if not email_data:
                 # Process as attachment
-                text_content = self.process_pdf_file(file_path)
-                return {
-                    'email_body': text_content,
+                email_data = {
+                    'email_body': extraction.text,
                     'subject': os.path.basename(file_path),
                     'from': '',
                     'to': '',
                     'date': '',
                     'attachments': []
                 }
+            email_data['extraction'] = extraction.stats()
+            return email_data
         elif file_extension in ['doc', 'docx']:
             # For Word docs, check if it contains email content
-            text_content = self.process_word_file(file_path)
-            email_data = self.extract_email_from_text(text_content)
-            if email_data:
-                return email_data
-            else:
-                return {
-                    'email_body': text_content,
+            extraction = self.extract_word(source, file_path)
+            email_data = self.extract_email_from_text(extraction.text)
+            if not email_data:
+                email_data = {
+                    'email_body': extraction.text,
                     'subject': os.path.basename(file_path),
                     'from': '',
                     'to': '',
                     'date': '',
                     'attachments': []
                 }
+            email_data['extraction'] = extraction.stats()
+            return email_data
+        elif file_extension in self.allowed_attachment_types:
+            return {
+                'email_body': self.allowed_attachment_types[file_extension](source, file_path),
+                'subject': os.path.basename(file_path),
+                'from': '',
+                'to': '',
+                'date': '',
+                'attachments': []
+            }
         else:
             logger.warning(f"Unsupported file type: {file_extension}")
             return {
@@ -109,20 +240,30 @@ class EmailProcessor:
                 'attachments': []
             }
     
-    def process_eml_file(self, file_path: str) -> Dict[str, Any]:
+    def process_eml_file(self, source: Union[str, bytes, BinaryIO]) -> Dict[str, Any]:
         """
         Process .eml file and extract email content and attachments.
         
         Args:
-            file_path: Path to the .eml file
+            source: Path to the .eml file, its bytes, or a binary file object
             
         Returns:
             Dict containing email data and processed attachments
         """
+        file_path = _source_name(source, 'email')
         try:
+            if _data_size(source) >= self.eml_streaming_threshold:
+                return self.process_eml_file_streaming(source)
+            
             logger.info(f"Processing .eml file: {file_path}")
-            with open(file_path, 'rb') as f:
-                msg = BytesParser(policy=policy.default).parse(f)
+            if isinstance(source, bytes):
+                msg = BytesParser(policy=policy.default).parsebytes(source)
+            elif isinstance(source, str):
+                with open(source, 'rb') as f:
+                    msg = BytesParser(policy=policy.default).parse(f)
+            else:
+                source.seek(0)
+                msg = BytesParser(policy=policy.default).parse(source)
             
             # Extract basic email metadata
             email_data = {
@@ -134,70 +275,38 @@ class EmailProcessor:
                 'attachments': []
             }
             
-            def extract_text_from_part(part):
-                """Extract text content from an email part."""
-                if part.get_content_type() == 'text/plain':
-                    return part.get_content()
-                elif part.get_content_type() == 'text/html':
-                    # convert HTML to plain text if no plain text found
-                    return part.get_content()
-                return ''
-
-            def process_nested_multipart(multipart_msg):
-                """Extract mail body when attachment is present"""
-                body_text = ''
-        
-                for part in multipart_msg.iter_parts():
-                    content_type = part.get_content_type()
+            # Prefer the plain text body (also inside nested multiparts), fall back to HTML
+            body_part = msg.get_body(preferencelist=('plain', 'html'))
+            if body_part is not None:
+                self.set_email_body(email_data, body_part.get_content(), body_part.get_content_type())
+            
+            # Collect attachments in memory and extract them concurrently
+            attachments = []
+            for part in msg.iter_attachments():
+                attachment_name = part.get_filename()
+                try:
+                    if not attachment_name:
+                        continue
                     
-                    # Check for text parts
-                    if content_type.startswith('text/'):
-                        part_text = extract_text_from_part(part)
-                        if part_text and not body_text:
-                            body_text = part_text
+                    data = part.get_payload(decode=True)
+                    if data is None and part.get_content_type() == 'message/rfc822':
+                        # an attached email is a parsed message rather than an encoded payload
+                        data = part.get_content().as_bytes()
+                    attachment_format = sniff_format(data, attachment_name)
                     
-                    # Handle nested multipart
-                    elif content_type.startswith('multipart/'):
-                        nested_body = process_nested_multipart(part)
-                        if nested_body and not body_text:
-                            body_text = nested_body
-
-                    return body_text
-
-            if msg.is_multipart():
-                email_data['email_body'] = process_nested_multipart(msg)
-            else:
-                email_data['email_body'] = msg.get_content()
+                    if attachment_format not in self.allowed_attachment_types:
+                        continue
+                    
+                    attachments.append({
+                        'filename': attachment_name,
+                        'content_type': part.get_content_type(),
+                        'format': attachment_format,
+                        'data': data
+                    })
+                except Exception as e:
+                    logger.error(f"Error processing attachment {attachment_name}: {str(e)}")
             
-            # Process attachments
-            with tempfile.TemporaryDirectory() as temp_dir:
-                for part in msg.iter_attachments():
-                    try:
-                        attachment_name = part.get_filename()
-                        if not attachment_name:
-                            continue
-                            
-                        attachment_ext = os.path.splitext(attachment_name)[1].lower().replace('.', '')
-                        
-                        if attachment_ext not in self.allowed_attachment_types:
-                            continue
-                        
-                        # Save attachment to temp file
-                        temp_attachment_path = os.path.join(temp_dir, attachment_name)
-                        with open(temp_attachment_path, 'wb') as f:
-                            f.write(part.get_payload(decode=True))
-                        
-                        process_func = self.allowed_attachment_types.get(attachment_ext)
-                        if process_func:
-                            attachment_text = process_func(temp_attachment_path)
-                            
-                            email_data['attachments'].append({
-                                'filename': attachment_name,
-                                'content_type': part.get_content_type(),
-                                'extracted_text': attachment_text
-                            })
-                    except Exception as e:
-                        logger.error(f"Error processing attachment {attachment_name}: {str(e)}")
+            email_data['attachments'] = self.process_attachments(attachments)
             
             return email_data
         
@@ -213,26 +322,163 @@ class EmailProcessor:
                 'attachments': []
             }
     
-    def extract_email_from_pdf(self, file_path: str) -> Optional[Dict[str, Any]]:
+    def process_eml_file_streaming(self, source: Union[str, bytes, BinaryIO]) -> Dict[str, Any]:
+        """
+        Process a large .eml file with bounded memory. Parts are decoded
+        incrementally into spooled buffers, and parts over the per-attachment
+        or per-message limits are skipped and listed under 'skipped_attachments'.
+        
+        Args:
+            source: Path to the .eml file, its bytes, or a binary file object
+            
+        Returns:
+            Dict containing email data and processed attachments
+        """
+        logger.info(f"Processing .eml file in streaming mode: {_source_name(source, 'email')}")
+        
+        # every named attachment is decoded (up to the size limit) so its format can be sniffed from the content
+        parsed = parse_eml_stream(io.BytesIO(source) if isinstance(source, bytes) else source, self.eml_limits)
+        try:
+            email_data = {
+                **parsed.headers,
+                'email_body': '',
+                'attachments': [],
+                'skipped_attachments': parsed.skipped
+            }
+            self.set_email_body(email_data, parsed.body_text, parsed.body_content_type or 'text/plain')
+            
+            attachments = []
+            for part in parsed.attachments:
+                attachment_format = sniff_format(part.buffer, part.filename)
+                if attachment_format in self.allowed_attachment_types:
+                    attachments.append({
+                        'filename': part.filename,
+                        'content_type': part.content_type,
+                        'format': attachment_format,
+                        # read lazily by the attachment workers so only the attachments being processed are in memory
+                        'data': part.buffer
+                    })
+            email_data['attachments'] = self.process_attachments(attachments)
+            return email_data
+        finally:
+            parsed.close()
+    
+    def set_email_body(self, email_data: Dict[str, Any], body: str, content_type: str):
+        """
+        Store the cleaned body (HTML converted to text, quoted history collapsed,
+        signature removed) and how many characters the cleanup removed.
+        """
+        text, cleanup = clean_email_body(body, content_type)
+        email_data['email_body'] = text
+        email_data['body_cleanup'] = cleanup
+        if cleanup['chars_removed']:
+            logger.info(f"Email body cleanup removed {cleanup['chars_removed']} of {cleanup['original_chars']} characters "
+                        f"(html {cleanup['html_chars_removed']}, quoted {cleanup['quoted_chars_removed']}, "
+                        f"signature {cleanup['signature_chars_removed']})")
+    
+    def process_attachments(self, attachments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Extract text from attachments concurrently, straight from their bytes.
+        Images are OCR'd together as one batch. An attachment running longer than
+        attachment_timeout, or still pending when the email's attachment_budget
+        runs out, is reported with an error text instead of holding up the email.
+        
+        Args:
+            attachments: Dicts with filename, content_type, format (as returned by sniff_format) and data (bytes or a binary file object)
+            
+        Returns:
+            List of dicts with filename, content_type, format and extracted_text, in attachment order
+        """
+        results = [{'filename': attachment['filename'], 'content_type': attachment['content_type'],
+                    'format': attachment['format'], 'extracted_text': None}
+                   for attachment in attachments]
+        if not attachments:
+            return []
+        
+        # each task covers one or more attachments and returns one text per attachment
+        tasks = []
+        image_indices = [i for i, attachment in enumerate(attachments) if attachment['format'] in self.image_attachment_types]
+        if image_indices:
+            tasks.append((image_indices, lambda: self.process_image_files([_read_data(attachments[i]['data']) for i in image_indices])))
+        for i, attachment in enumerate(attachments):
+            if i not in image_indices:
+                process_func = self.allowed_attachment_types[attachment['format']]
+                tasks.append(([i], lambda func=process_func, data=attachment['data'], name=attachment['filename']: [func(_read_data(data), name)]))
+        
+        started_at = {}
+        
+        def run_task(task_id):
+            started_at[task_id] = time.monotonic()
+            return tasks[task_id][1]()
+        
+        def fail(task_id, message):
+            for i in tasks[task_id][0]:
+                results[i]['extracted_text'] = f"Error extracting text from attachment: {message}"
+                logger.warning(f"Attachment {attachments[i]['filename']}: {message}")
+        
+        pool = ThreadPoolExecutor(max_workers=min(self.attachment_workers, len(tasks)), thread_name_prefix="attachment")
+        email_deadline = time.monotonic() + self.attachment_budget
+        try:
+            futures = {pool.submit(run_task, task_id): task_id for task_id in range(len(tasks))}
+            pending = set(futures)
+            done_count = 0
+            while pending:
+                now = time.monotonic()
+                if now >= email_deadline:
+                    for future in pending:
+                        fail(futures[future], f"attachment budget of {self.attachment_budget:g}s for this email exceeded")
+                    break
+                
+                expired = {future for future in pending
+                           if futures[future] in started_at and now - started_at[futures[future]] >= self.attachment_timeout}
+                for future in expired:
+                    fail(futures[future], f"timed out after {self.attachment_timeout:g}s")
+                pending -= expired
+                
+                # wake up for the next deadline; tasks that haven't started yet can't expire before now + timeout
+                deadlines = [email_deadline, now + self.attachment_timeout]
+                deadlines += [started_at[futures[future]] + self.attachment_timeout for future in pending if futures[future] in started_at]
+                done, pending = wait(pending, timeout=max(0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    task_id = futures[future]
+                    try:
+                        for i, text in zip(tasks[task_id][0], future.result()):
+                            results[i]['extracted_text'] = text
+                    except Exception as e:
+                        logger.error(f"Error processing attachment {attachments[tasks[task_id][0][0]]['filename']}: {str(e)}")
+                    done_count += len(tasks[task_id][0])
+                    self.report_progress('attachments', done=done_count, total=len(attachments))
+        finally:
+            # don't wait for attachments that timed out; their threads finish in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        # attachments whose handler raised are left out, as before
+        return [result for result in results if result['extracted_text'] is not None]
+    
+    def extract_email_from_pdf(self, source: Union[str, bytes], extraction: Optional[ExtractionResult] = None) -> Optional[Dict[str, Any]]:
         """
         Extract email content from a PDF.
         Uses regex to identify email components.
         
         Args:
-            file_path: Path to PDF file
+            source: Path to PDF file or its bytes
+            extraction: Result of extract_pdf for this file, if already available
             
         Returns:
             Dict with email data if email format detected, None otherwise
         """
         try:
-            # Extract text from PDF
-            pdf_text = self.process_pdf_file(file_path)
+            # Extract text from PDF unless the caller already did
+            if extraction is None:
+                extraction = self.extract_pdf(source)
+            pdf_text = extraction.text
             
             # Try to extract email components from the text
             return self.extract_email_from_text(pdf_text)
         
         except Exception as e:
-            logger.error(f"Error extracting email from PDF {file_path}: {str(e)}")
+            logger.error(f"Error extracting email from PDF {_source_name(source)}: {str(e)}")
             return None
     
     def extract_email_from_text(self, text: str) -> Optional[Dict[str, Any]]:
@@ -274,149 +520,253 @@ class EmailProcessor:
             }
         return None
     
-    def process_pdf_file(self, file_path: str) -> str:
+    def process_pdf_file(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
         """
         Extract text from PDF file, using OCR if needed.
         
         Args:
-            file_path: Path to PDF file
+            source: Path to PDF file or its bytes
+            name: Name of the file, for logs and progress events
             
         Returns:
             Extracted text content
         """
+        return self.extract_pdf(source, name).text
+    
+    def extract_pdf(self, source: Union[str, bytes], name: Optional[str] = None) -> ExtractionResult:
+        """
+        Extract per-page text from PDF file, using OCR for pages with little or no text.
+        
+        Args:
+            source: Path to PDF file or its bytes
+            name: Name of the file, for logs and progress events
+            
+        Returns:
+            ExtractionResult with page texts, OCR'd pages and timings
+        """
+        result = ExtractionResult()
+        start_time = time.perf_counter()
+        file_path = _source_name(source, name)
         try:
             logger.info(f"Processing PDF file: {file_path}")
             
-            if not os.path.exists(file_path):
+            if isinstance(source, str) and not os.path.exists(source):
                 logger.error(f"PDF file does not exist: {file_path}")
-                return f"Error: PDF file does not exist"
+                result.error = f"Error: PDF file does not exist"
+                return result
             
-            if os.path.getsize(file_path) == 0:
+            if (os.path.getsize(source) if isinstance(source, str) else len(source)) == 0:
                 logger.error(f"PDF file is empty: {file_path}")
-                return f"Error: PDF file is empty"
+                result.error = f"Error: PDF file is empty"
+                return result
         
-            text_content = []
+            text_content = result.page_texts
             
             # Open the PDF
             try:
-                pdf_document = fitz.open(file_path)
+                if isinstance(source, str):
+                    pdf_document = fitz.open(source)
+                else:
+                    pdf_document = fitz.open(stream=source, filetype="pdf")
             except fitz.FileDataError:
                 logger.error(f"Not a valid PDF file: {file_path}")
-                return "Error: Not a valid PDF file"
+                result.error = "Error: Not a valid PDF file"
+                return result
             except fitz.EmptyFileError:
                 logger.error(f"PDF file is empty: {file_path}")
-                return "Error: PDF file is empty"
+                result.error = "Error: PDF file is empty"
+                return result
             except Exception as e:
                 logger.error(f"PyMuPDF error opening file {file_path}: {str(e)}")
             
+            ocr_page_nums = result.ocr_pages
             for page_num in range(len(pdf_document)):
                 page = pdf_document[page_num]
                 
                 # Try to extract text directly
                 page_text = page.get_text()
                 
-                # If page has little or no text, try OCR if enabled
+                # If page has little or no text, queue it for OCR if enabled
                 if len(page_text.strip()) < 50 and self.ocr_enabled:
-                    logger.info(f"Using OCR for page {page_num} of {file_path}")
-                    # Convert page to image
-                    pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    
-                    # Apply OCR
-                    page_text = pytesseract.image_to_string(img, lang=self.ocr_lang)
+                    ocr_page_nums.append(page_num)
                 
                 text_content.append(page_text)
+            result.timings['text_layer'] = time.perf_counter() - start_time
+            
+            if ocr_page_nums:
+                logger.info(f"Using OCR for {len(ocr_page_nums)} of {len(pdf_document)} pages of {file_path}")
+                
+                def on_page_done(done, total):
+                    self.report_progress('ocr', file=os.path.basename(file_path), page=done, pages=total)
+                
+                # OCR pages in parallel across the OCR process pool, results come back in page order
+                ocr_start_time = time.perf_counter()
+                ocr_results = self.ocr_service.ocr_pdf_pages(source, ocr_page_nums, self.ocr_lang, on_page_done)
+                settings = self.ocr_service.settings_for(self.ocr_lang)
+                for page_num, page_result in zip(ocr_page_nums, ocr_results):
+                    text_content[page_num] = page_result['text']
+                    result.ocr_cache_hits += page_result['cache_hit']
+                    self.ocr_stats.record_page(page_result, settings)
+                result.timings['ocr'] = time.perf_counter() - ocr_start_time
             
-            return "\n".join(text_content)
-        
         except Exception as e:
             logger.error(f"Error processing PDF file {file_path}: {str(e)}")
-            return f"Error extracting text from PDF: {str(e)}"
+            result.error = f"Error extracting text from PDF: {str(e)}"
+        
+        result.timings['total'] = time.perf_counter() - start_time
+        return result
     
-    def process_word_file(self, file_path: str) -> str:
+    def process_word_file(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
         """
         Extract text from Word document.
         
         Args:
-            file_path: Path to Word file (.doc or .docx)
+            source: Path to Word file (.doc or .docx) or its bytes
+            name: Name of the file, for logs
             
         Returns:
             Extracted text content
         """
+        return self.extract_word(source, name).text
+    
+    def extract_word(self, source: Union[str, bytes], name: Optional[str] = None) -> ExtractionResult:
+        """
+        Extract text from Word document as a single-page ExtractionResult.
+        
+        Args:
+            source: Path to Word file (.doc or .docx) or its bytes
+            name: Name of the file, for logs
+            
+        Returns:
+            ExtractionResult with the document text and timings
+        """
+        result = ExtractionResult()
+        start_time = time.perf_counter()
+        file_path = _source_name(source, name)
         try:
             logger.info(f"Processing Word file: {file_path}")
-            text = docx2txt.process(file_path)
-            return text
+            result.page_texts.append(readers.get('docx')(_read_data(source)))
         except Exception as e:
             logger.error(f"Error processing Word file {file_path}: {str(e)}")
-            return f"Error extracting text from Word document: {str(e)}"
+            result.error = f"Error extracting text from Word document: {str(e)}"
+        result.timings['total'] = time.perf_counter() - start_time
+        return result
     
-    def process_text_file(self, file_path: str) -> str:
+    def process_text_file(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
         """
         Extract text from plain text file.
         
         Args:
-            file_path: Path to text file
+            source: Path to text file or its bytes
+            name: Name of the file, for logs
             
         Returns:
             File content
         """
+        file_path = _source_name(source, name)
         try:
             logger.info(f"Processing text file: {file_path}")
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            if not isinstance(source, str):
+                return source.decode('utf-8', errors='replace')
+            with open(source, 'r', encoding='utf-8', errors='replace') as f:
                 return f.read()
         except Exception as e:
             logger.error(f"Error processing text file {file_path}: {str(e)}")
             return f"Error extracting text from file: {str(e)}"
     
-    def process_excel_file(self, file_path: str) -> str:
+    def process_email_attachment(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
+        """
+        Extract text from an attached email: its headers and cleaned body.
+        The attached email's own attachments are not opened.
+        
+        Args:
+            source: Path to the .eml file or its bytes
+            name: Name of the file, for logs
+            
+        Returns:
+            Headers and body text of the attached email
+        """
+        file_path = _source_name(source, name)
+        try:
+            logger.info(f"Processing attached email: {file_path}")
+            if isinstance(source, str):
+                with open(source, 'rb') as f:
+                    source = f.read()
+            msg = BytesParser(policy=policy.default).parsebytes(source)
+            lines = [f"{header}: {msg[header]}" for header in ('From', 'To', 'Date', 'Subject') if msg.get(header)]
+            body_part = msg.get_body(preferencelist=('plain', 'html'))
+            if body_part is not None:
+                body, _ = clean_email_body(body_part.get_content(), body_part.get_content_type())
+                lines += ['', body]
+            return "\n".join(lines)
+        except Exception as e:
+            logger.error(f"Error processing attached email {file_path}: {str(e)}")
+            return f"Error extracting text from attached email: {str(e)}"
+    
+    def process_excel_file(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
         """
         Extract text from Excel file.
         
         Args:
-            file_path: Path to Excel file
+            source: Path to Excel file or its bytes
+            name: Name of the file, for logs
             
         Returns:
             Extracted text representation of spreadsheet
         """
+        file_path = _source_name(source, name)
         try:
             logger.info(f"Processing Excel file: {file_path}")
-            
-            return f"[Excel content extracted from {os.path.basename(file_path)}]"
+            return extract_spreadsheet(source, self.spreadsheet_limits)
         except Exception as e:
             logger.error(f"Error processing Excel file {file_path}: {str(e)}")
             return f"Error extracting text from Excel file: {str(e)}"
     
-    def process_image_file(self, file_path: str) -> str:
+    def process_image_file(self, source: Union[str, bytes], name: Optional[str] = None) -> str:
         """
         Extract text from image using OCR.
         
         Args:
-            file_path: Path to image file
+            source: Path to image file or its bytes
+            name: Name of the file, unused (kept for a uniform handler signature)
             
         Returns:
             Extracted text from image
         """
-        url = 'https://api.ocr.space/parse/image'
-        payload = {
-            'apikey': "K85757301188957",
-            'isOverlayRequired': 'false'
-        }
-        try:
-            
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(url, files=files, data=payload)
-            response.raise_for_status()
-            result = response.json()
-            if result['IsErroredOnProcessing']:
-                return f"Error: {result['ErrorMessage']}"
-            else:
-                return result['ParsedResults'][0]['ParsedText']
+        return self.process_image_files([source])[0]
+    
+    def process_image_files(self, sources: List[Union[str, bytes]]) -> List[str]:
+        """
+        Extract text from several images with one batch of OCR work, so the
+        images of an email are recognized in parallel.
+        
+        Args:
+            sources: Paths to image files or their bytes
             
+        Returns:
+            Extracted text for each image, in the order of sources
+        """
+        if not sources:
+            return []
+        try:
+            logger.info(f"Running OCR on {len(sources)} image(s)")
+            settings = self.ocr_service.settings_for(self.ocr_lang)
+            results = self.ocr_service.ocr_images(sources, self.ocr_lang)
         except Exception as e:
-            logger.error(f"Error processing image file {file_path}: {str(e)}")
-            return f"Error extracting text from image: {str(e)}"
+            logger.error(f"Error processing {len(sources)} image file(s): {str(e)}")
+            return [f"Error extracting text from image: {str(e)}"] * len(sources)
+
+        texts = []
+        for result in results:
+            # a failed image doesn't take the text of the other images with it
+            if isinstance(result, Exception):
+                logger.error(f"Error processing image file: {str(result)}")
+                texts.append(f"Error extracting text from image: {str(result)}")
+                continue
+            self.ocr_stats.record_page(result, settings)
+            texts.append(result['text'])
+        self.report_progress('ocr', images=len(sources))
+        return texts
 
 
 class DocumentProcessor:
@@ -424,14 +774,17 @@ class DocumentProcessor:
     Class for pre-processing extracted text before passing to LLM.
     """
     
-    def __init__(self, max_chunk_size: int = 4000):
+    def __init__(self, max_chunk_size: int = 4000, token_budget: Optional[TokenBudget] = None):
         """
         Initialize document processor.
         
         Args:
             max_chunk_size: Maximum size of text chunks for LLM processing
+            token_budget: Token limits for the LLM input (defaults to the LLM_*_TOKENS settings)
         """
         self.max_chunk_size = max_chunk_size
+        self.assembler = TokenBudgetAssembler(token_budget)
+        self.token_stats: Dict[str, Any] = {}
         logger.info("Document processor initialized")
     
     def preprocess_text(self, text: str) -> str:
@@ -524,35 +877,70 @@ class DocumentProcessor:
             email_data: Processed email data with attachments
             
         Returns:
-            List of text chunks ready for LLM
+            List of text chunks ready for LLM, each within the token budget. There is one
+            chunk unless the document is over budget and map-reduce is enabled.
         """
-        # Combine email and attachments
-        combined_text = self.combine_email_with_attachments(email_data)
-        
-        # Chunk if necessary (shouldn't be needed for email mostly)
-        chunks = self.chunk_text(combined_text)
+        # Combine email and attachments within the token budget, so the prompt size is bounded
+        combined_text, self.token_stats = self.assembler.assemble(email_data, self.preprocess_text)
+        chunks = [combined_text]
+        if self.assembler.budget.map_reduce and (self.token_stats['truncated_sections'] or self.token_stats['omitted_sections']):
+            # over budget: split into chunks that are classified concurrently and merged
+            chunks, self.token_stats = self.assembler.assemble_chunks(email_data, self.preprocess_text)
+        logger.info(f"LLM input: {self.token_stats['output_tokens']} of {self.token_stats['input_tokens']} tokens kept "
+                    f"in {self.token_stats['chunks']} chunks "
+                    f"(budget {self.token_stats['budget_tokens']}, {self.token_stats['truncated_sections']} sections truncated, "
+                    f"{self.token_stats['omitted_sections']} omitted, "
+                    f"{self.token_stats['duplicate_chars_removed']} duplicate characters removed)")
         
         return chunks
 
 
 # This is the function that will be called in router
-def process_email_file(file_path: str) -> List[str]:
+def process_email_file(source: Union[str, bytes, BinaryIO], progress_queue: Optional[Any] = None,
+                       filename: Optional[str] = None) -> List[str]:
     """
     Process an email file and prepare it for LLM processing.
     
     Args:
-        file_path: Path to the email file (.eml, .pdf, .doc)
+        source: Path to the email file (.eml, .pdf, .doc), its bytes, or a binary file object
+        progress_queue: Optional queue (e.g. a multiprocessing manager queue) receiving progress events
+        filename: Name of the file, used for its type; required unless source is a path
         
     Returns:
         List of text chunks ready for LLM processing
     """
-    email_processor = EmailProcessor(ocr_enabled=True)
+    text_chunks, _ = process_email_file_with_stats(source, progress_queue, filename)
+    return text_chunks
+
+
+def process_email_file_with_stats(source: Union[str, bytes, BinaryIO], progress_queue: Optional[Any] = None,
+                                  filename: Optional[str] = None) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Same as process_email_file, but also returns processing stats
+    (OCR pages, cache hits and time saved) so the caller can aggregate them.
+    
+    Args:
+        source: Path to the email file (.eml, .pdf, .doc), its bytes, or a binary file object
+        progress_queue: Optional queue (e.g. a multiprocessing manager queue) receiving progress events
+        filename: Name of the file, used for its type; required unless source is a path
+        
+    Returns:
+        Tuple of the text chunks ready for LLM processing and a stats dict
+    """
+    progress_callback = progress_queue.put if progress_queue is not None else None
+    email_processor = EmailProcessor(ocr_enabled=True, progress_callback=progress_callback)
     document_processor = DocumentProcessor()
     
     # Extract email content and attachments
-    email_data = email_processor.process_input(file_path)
+    email_data = email_processor.process_input(source, filename)
+    email_processor.report_progress('parsed', attachments=len(email_data.get('attachments', [])),
+                                    skipped_attachments=email_data.get('skipped_attachments', []),
+                                    body_chars_removed=email_data.get('body_cleanup', {}).get('chars_removed', 0))
     
     # Prepare for LLM processing
     text_chunks = document_processor.prepare_for_llm(email_data)
     
-    return text_chunks
\ No newline at end of file
+    stats = {'ocr': email_processor.ocr_stats.to_dict(), 'tokens': document_processor.token_stats}
+    if 'body_cleanup' in email_data:
+        stats['body_cleanup'] = email_data['body_cleanup']
+    return text_chunks, stats
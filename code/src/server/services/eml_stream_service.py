@@ -0,0 +1,318 @@
+import os
+import re
+import binascii
+import logging
+import tempfile
+from email import policy
+from email.parser import BytesHeaderParser
+from dataclasses import dataclass, field
+from contextlib import nullcontext
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# lines are read in pieces of at most this size, so a message without line breaks can't be read in one go
+READ_CHUNK_SIZE = 64 * 1024
+MAX_HEADER_BYTES = 256 * 1024
+
+
+class MessageTooLargeError(Exception):
+    """Raised when more than the per-message limit has been read."""
+
+
+@dataclass
+class EmlStreamLimits:
+    """Size limits for streaming .eml parsing."""
+    max_message_bytes: int = 200 * 1024 * 1024
+    max_attachment_bytes: int = 25 * 1024 * 1024
+    max_body_bytes: int = 1024 * 1024
+    spool_max_memory: int = 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "EmlStreamLimits":
+        load_dotenv()
+        return cls(
+            max_message_bytes=int(os.getenv("EML_MAX_MESSAGE_BYTES", str(200 * 1024 * 1024))),
+            max_attachment_bytes=int(os.getenv("EML_MAX_ATTACHMENT_BYTES", str(25 * 1024 * 1024))),
+            max_body_bytes=int(os.getenv("EML_MAX_BODY_BYTES", str(1024 * 1024))),
+            spool_max_memory=int(os.getenv("EML_SPOOL_MAX_MEMORY", str(1024 * 1024))))
+
+
+@dataclass
+class StreamedPart:
+    """A decoded attachment, held in memory up to spool_max_memory and on disk beyond that."""
+    filename: str
+    content_type: str
+    size: int
+    buffer: BinaryIO
+
+    def read(self) -> bytes:
+        self.buffer.seek(0)
+        return self.buffer.read()
+
+
+@dataclass
+class StreamedEmail:
+    headers: Dict[str, str] = field(default_factory=dict)
+    body_text: str = ''
+    body_content_type: Optional[str] = None
+    attachments: List[StreamedPart] = field(default_factory=list)
+    skipped: List[Dict[str, Any]] = field(default_factory=list)
+    bytes_read: int = 0
+
+    def close(self):
+        for part in self.attachments:
+            part.buffer.close()
+
+
+class _LineReader:
+    """Reads a file line by line in bounded pieces, enforcing the per-message limit."""
+
+    def __init__(self, f: BinaryIO, max_bytes: int):
+        self.f = f
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        # whether the next piece starts a new line (boundaries only count at line starts)
+        self.at_line_start = True
+
+    def readline(self) -> Tuple[bytes, bool]:
+        line_start = self.at_line_start
+        piece = self.f.readline(READ_CHUNK_SIZE)
+        self.bytes_read += len(piece)
+        if self.bytes_read > self.max_bytes:
+            raise MessageTooLargeError(f"message exceeds {self.max_bytes} bytes")
+        self.at_line_start = piece.endswith(b'\n')
+        return piece, line_start
+
+
+class _PartDecoder:
+    """Incrementally decodes a base64, quoted-printable or identity body into a spooled buffer."""
+
+    def __init__(self, encoding: str, limit: int, spool_max_memory: int):
+        self.encoding = encoding
+        self.limit = limit
+        self.size = 0
+        self.overflow = False
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_memory)
+        self._carry = b''
+        self._pending_eol = b''
+
+    def feed(self, piece: bytes):
+        if self.overflow:
+            return
+        if self.encoding == 'base64':
+            data = self._carry + re.sub(rb'[^A-Za-z0-9+/=]', b'', piece)
+            usable = len(data) - len(data) % 4
+            self._carry = data[usable:]
+            decoded = binascii.a2b_base64(data[:usable]) if usable else b''
+        else:
+            # the line break before a boundary belongs to the boundary, so hold it back
+            data = self._pending_eol + piece
+            stripped = data.rstrip(b'\r\n')
+            self._pending_eol = data[len(stripped):]
+            decoded = stripped
+            if self.encoding == 'quoted-printable':
+                data = self._carry + stripped
+                # don't split an escape sequence or soft line break across pieces
+                split = data.rfind(b'=', max(0, len(data) - 2))
+                if split != -1:
+                    data, self._carry = data[:split], data[split:]
+                else:
+                    self._carry = b''
+                decoded = binascii.a2b_qp(data)
+        self._write(decoded)
+
+    def finish(self):
+        if self.overflow:
+            return
+        if self.encoding == 'base64' and self._carry:
+            self._write(binascii.a2b_base64(self._carry + b'=' * (-len(self._carry) % 4)))
+        elif self.encoding == 'quoted-printable' and self._carry:
+            self._write(binascii.a2b_qp(self._carry))
+
+    def _write(self, decoded: bytes):
+        self.size += len(decoded)
+        if self.size > self.limit:
+            # stop keeping data for oversized parts, but keep reading so parsing can continue
+            self.overflow = True
+            self.buffer.close()
+            return
+        self.buffer.write(decoded)
+
+
+class EmlStreamParser:
+    """
+    Parses an .eml file line by line without building the message in memory.
+    Each part is decoded into its own spooled buffer as it is read; oversized
+    parts are skipped and recorded with a reason.
+    """
+
+    def __init__(self, limits: Optional[EmlStreamLimits] = None,
+                 accept_attachment: Optional[Callable[[str, str], bool]] = None):
+        """
+        Args:
+            limits: Size limits (defaults to the EML_* settings)
+            accept_attachment: Called with (filename, content type); attachments it rejects are not decoded
+        """
+        self.limits = limits or EmlStreamLimits.from_env()
+        self.accept_attachment = accept_attachment or (lambda filename, content_type: True)
+        self._header_parser = BytesHeaderParser(policy=policy.default)
+
+    def parse(self, source: Union[str, BinaryIO]) -> StreamedEmail:
+        result = StreamedEmail()
+        self._body_candidates: Dict[str, str] = {}
+        file_path = source if isinstance(source, str) else 'email'
+        with (open(source, 'rb') if isinstance(source, str) else nullcontext(source)) as f:
+            if not isinstance(source, str):
+                f.seek(0)
+            reader = _LineReader(f, self.limits.max_message_bytes)
+            try:
+                headers, _ = self._read_headers(reader, [])
+                for name in ('Subject', 'From', 'To', 'Date'):
+                    result.headers[name.lower()] = str(headers.get(name, ''))
+                self._parse_entity(reader, headers, [], result)
+            except MessageTooLargeError as e:
+                logger.warning(f"Stopped parsing {file_path}: {str(e)}")
+                result.skipped.append({'filename': None, 'content_type': None,
+                                       'reason': f"message size limit of {self.limits.max_message_bytes} bytes reached, remaining parts not read"})
+            result.bytes_read = reader.bytes_read
+
+        # prefer the plain text body, fall back to HTML
+        for content_type in ('text/plain', 'text/html'):
+            if content_type in self._body_candidates:
+                result.body_text = self._body_candidates[content_type]
+                result.body_content_type = content_type
+                break
+        return result
+
+    def _read_headers(self, reader: _LineReader, boundaries: List[bytes]):
+        header_bytes = bytearray()
+        while True:
+            piece, line_start = reader.readline()
+            if not piece:
+                return self._header_parser.parsebytes(bytes(header_bytes)), ('eof', None)
+            if line_start:
+                if piece in (b'\r\n', b'\n'):
+                    break
+                term = self._match_boundary(piece, boundaries)
+                if term:
+                    return self._header_parser.parsebytes(bytes(header_bytes)), term
+            # oversized header blocks are truncated rather than kept in memory
+            if len(header_bytes) < MAX_HEADER_BYTES:
+                header_bytes += piece
+        return self._header_parser.parsebytes(bytes(header_bytes)), None
+
+    @staticmethod
+    def _match_boundary(piece: bytes, boundaries: List[bytes]):
+        if not piece.startswith(b'--'):
+            return None
+        # innermost boundary first
+        for boundary in reversed(boundaries):
+            if piece.startswith(b'--' + boundary):
+                rest = piece[len(boundary) + 2:]
+                return ('close' if rest.startswith(b'--') else 'open', boundary)
+        return None
+
+    def _skip_until_boundary(self, reader: _LineReader, boundaries: List[bytes]):
+        while True:
+            piece, line_start = reader.readline()
+            if not piece:
+                return ('eof', None)
+            if line_start:
+                term = self._match_boundary(piece, boundaries)
+                if term:
+                    return term
+
+    def _parse_entity(self, reader: _LineReader, headers, boundaries: List[bytes], result: StreamedEmail):
+        """Parse the body of an entity whose headers were just read; returns the boundary line that ended it."""
+        if headers.get_content_maintype() == 'multipart' and headers.get_param('boundary'):
+            boundary = headers.get_param('boundary').encode('utf-8', errors='replace')
+            inner = boundaries + [boundary]
+            # skip the preamble
+            term = self._skip_until_boundary(reader, inner)
+            while term[0] == 'open' and term[1] == boundary:
+                part_headers, term = self._read_headers(reader, inner)
+                if term is None:
+                    term = self._parse_entity(reader, part_headers, inner, result)
+            if term[0] == 'close' and term[1] == boundary:
+                # skip the epilogue
+                term = self._skip_until_boundary(reader, boundaries)
+            return term
+        return self._parse_leaf(reader, headers, boundaries, result)
+
+    def _parse_leaf(self, reader: _LineReader, headers, boundaries: List[bytes], result: StreamedEmail):
+        content_type = headers.get_content_type()
+        filename = headers.get_filename()
+        disposition = headers.get_content_disposition()
+        encoding = str(headers.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+
+        decoder = None
+        if filename or disposition == 'attachment':
+            if filename and self.accept_attachment(filename, content_type):
+                decoder = _PartDecoder(encoding, self.limits.max_attachment_bytes, self.limits.spool_max_memory)
+        elif headers.get_content_maintype() == 'text' and content_type not in self._body_candidates:
+            decoder = _PartDecoder(encoding, self.limits.max_body_bytes, self.limits.spool_max_memory)
+
+        try:
+            while True:
+                piece, line_start = reader.readline()
+                if not piece:
+                    term = ('eof', None)
+                    break
+                if line_start:
+                    term = self._match_boundary(piece, boundaries)
+                    if term:
+                        break
+                if decoder:
+                    decoder.feed(piece)
+        except MessageTooLargeError:
+            if decoder:
+                decoder.buffer.close()
+            if filename:
+                result.skipped.append({'filename': filename, 'content_type': content_type,
+                                       'reason': f"message size limit of {self.limits.max_message_bytes} bytes reached"})
+            raise
+
+        if decoder is None:
+            return term
+        decoder.finish()
+
+        if decoder.overflow:
+            if filename or disposition == 'attachment':
+                reason = f"attachment exceeds {self.limits.max_attachment_bytes} bytes"
+                result.skipped.append({'filename': filename, 'content_type': content_type, 'reason': reason})
+                logger.warning(f"Skipped attachment {filename}: {reason}")
+            else:
+                result.skipped.append({'filename': None, 'content_type': content_type,
+                                       'reason': f"body part exceeds {self.limits.max_body_bytes} bytes"})
+            return term
+
+        if filename or disposition == 'attachment':
+            result.attachments.append(StreamedPart(filename, content_type, decoder.size, decoder.buffer))
+        else:
+            decoder.buffer.seek(0)
+            data = decoder.buffer.read()
+            decoder.buffer.close()
+            try:
+                text = data.decode(headers.get_content_charset() or 'utf-8', errors='replace')
+            except LookupError:
+                text = data.decode('utf-8', errors='replace')
+            self._body_candidates[content_type] = text
+        return term
+
+
+def parse_eml_stream(source: Union[str, BinaryIO], limits: Optional[EmlStreamLimits] = None,
+                     accept_attachment: Optional[Callable[[str, str], bool]] = None) -> StreamedEmail:
+    """
+    Parse an .eml file with bounded memory.
+
+    Args:
+        source: Path to the .eml file or a binary file object
+        limits: Size limits (defaults to the EML_* settings)
+        accept_attachment: Called with (filename, content type); attachments it rejects are not decoded
+
+    Returns:
+        StreamedEmail with headers, body text, spooled attachments and skipped parts
+    """
+    return EmlStreamParser(limits, accept_attachment).parse(source)
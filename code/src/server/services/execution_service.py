@@ -0,0 +1,124 @@
+import os
+import asyncio
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# size of the extraction pool this process is a worker of, None outside the pool
+_extraction_pool_size: Optional[int] = None
+
+
+def _init_extraction_worker(pool_size: int):
+    global _extraction_pool_size
+    _extraction_pool_size = pool_size
+
+
+def extraction_pool_size() -> Optional[int]:
+    """Size of the extraction pool when called from one of its workers, None otherwise"""
+    return _extraction_pool_size
+
+
+class ExecutionService:
+    """
+    Owns the worker pools used to keep blocking work off the event loop.
+
+    I/O-bound work (LLM calls, file writes) runs on a thread pool, while
+    CPU-bound work (PDF parsing, OCR, Word extraction) runs on a process pool
+    so it does not compete with the event loop for the GIL.
+    """
+
+    def __init__(self, io_workers: Optional[int] = None, cpu_workers: Optional[int] = None):
+        """
+        Initialize the execution service. Pools are created lazily on first use.
+
+        Args:
+            io_workers: Size of the thread pool for I/O-bound calls
+                (defaults to LLM_THREAD_POOL_SIZE or 16)
+            cpu_workers: Size of the process pool for CPU-bound extraction
+                (defaults to EXTRACTION_PROCESS_POOL_SIZE or the CPU count)
+        """
+        load_dotenv()
+
+        self.io_workers = io_workers or int(os.getenv("LLM_THREAD_POOL_SIZE", "16"))
+        self.cpu_workers = cpu_workers or int(os.getenv("EXTRACTION_PROCESS_POOL_SIZE", str(os.cpu_count() or 1)))
+        self._thread_pool = None
+        self._process_pool = None
+        self._manager = None
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="io-worker")
+            logger.info(f"Started I/O thread pool with {self.io_workers} workers")
+        return self._thread_pool
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, initializer=_init_extraction_worker,
+                                                     initargs=(self.cpu_workers,))
+            logger.info(f"Started extraction process pool with {self.cpu_workers} workers")
+        return self._process_pool
+
+    @property
+    def manager(self):
+        """Multiprocessing manager used to create queues that can be passed to process pool workers"""
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    async def run_io_bound(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking I/O-bound callable on the thread pool.
+
+        Args:
+            func: Callable to run
+            *args, **kwargs: Arguments passed to the callable
+
+        Returns:
+            The callable's return value
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.thread_pool, functools.partial(func, *args, **kwargs))
+
+    async def run_cpu_bound(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a CPU-bound callable on the process pool.
+        The callable and its arguments must be picklable.
+
+        Args:
+            func: Module-level callable to run
+            *args, **kwargs: Arguments passed to the callable
+
+        Returns:
+            The callable's return value
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.process_pool, functools.partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM while rendering a page); start a fresh pool for later requests
+            logger.error("Extraction process pool is broken, recreating it")
+            self._process_pool = None
+            raise
+
+    def shutdown(self):
+        """Shut down both pools and the manager, waiting for running work to finish."""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+            self._process_pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+executor = ExecutionService()
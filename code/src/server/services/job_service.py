@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from services.classification_service import classify_upload
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its configured depth."""
+
+
+class Job:
+    """
+    A single classification job and the progress events recorded for it.
+    """
+
+    def __init__(self, filename: str, data: bytes):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.data = data
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def add_event(self, event: Dict[str, Any]):
+        event = {**event, 'time': time.time()}
+        self.events.append(event)
+        self.updated_at = event['time']
+        for subscriber in self._subscribers:
+            subscriber.put_nowait(event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'stage': self.events[-1]['stage'] if self.events else None,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    """
+    In-process job queue drained by a fixed number of asyncio workers.
+    Submissions beyond the configured depth are delayed up to a timeout and then rejected.
+    """
+
+    FINAL_STAGES = ('completed', 'failed')
+
+    def __init__(self, max_depth: Optional[int] = None, workers: Optional[int] = None,
+                 submit_wait: Optional[float] = None, max_retained: Optional[int] = None):
+        """
+        Initialize the job queue.
+
+        Args:
+            max_depth: Maximum number of queued (not yet running) jobs (JOB_QUEUE_MAX_DEPTH)
+            workers: Number of jobs processed concurrently (JOB_WORKERS)
+            submit_wait: Seconds a submission waits for space before being rejected (JOB_SUBMIT_WAIT_SECONDS)
+            max_retained: Number of finished jobs kept for status/result lookups (JOB_RETENTION)
+        """
+        load_dotenv()
+        self.max_depth = max_depth or int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.submit_wait = submit_wait if submit_wait is not None else float(os.getenv("JOB_SUBMIT_WAIT_SECONDS", "0"))
+        self.max_retained = max_retained or int(os.getenv("JOB_RETENTION", "1000"))
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the workers. Must be called from the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started job queue with {self.workers} workers and max depth {self.max_depth}")
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, filename: str, data: bytes) -> Job:
+        """
+        Queue a file for classification.
+
+        Args:
+            filename: Name of the uploaded file
+            data: Raw bytes of the uploaded file
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If the queue stays full for longer than submit_wait
+        """
+        job = Job(filename, data)
+        # record the job before queueing it so a worker can't pick it up first
+        self.jobs[job.id] = job
+        job.add_event({'stage': 'queued', 'queue_depth': self.depth})
+        try:
+            if self.submit_wait > 0:
+                await asyncio.wait_for(self._queue.put(job), timeout=self.submit_wait)
+            else:
+                self._queue.put_nowait(job)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            del self.jobs[job.id]
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+
+        self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def events(self, job: Job) -> AsyncIterator[str]:
+        """
+        Stream a job's progress events as server-sent events, starting with
+        the events recorded so far and ending when the job finishes.
+        """
+        # subscribe and snapshot together so no event is missed or sent twice
+        subscriber = asyncio.Queue()
+        job._subscribers.append(subscriber)
+        recorded = list(job.events)
+        try:
+            for event in recorded:
+                yield self._format_event(event)
+            finished = bool(recorded) and recorded[-1]['stage'] in self.FINAL_STAGES
+            while not finished:
+                event = await subscriber.get()
+                yield self._format_event(event)
+                finished = event['stage'] in self.FINAL_STAGES
+        finally:
+            job._subscribers.remove(subscriber)
+
+    @staticmethod
+    def _format_event(event: Dict[str, Any]) -> str:
+        return f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                job.status = 'running'
+                job.add_event({'stage': 'started', 'worker': worker_id})
+                job.result = await classify_upload(job.filename, job.data, progress=job.add_event)
+                job.status = 'completed'
+                job.add_event({'stage': 'completed'})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = 'failed'
+                job.add_event({'stage': 'failed', 'error': str(e)})
+            finally:
+                job.data = None
+                self._queue.task_done()
+
+    def _evict_finished(self):
+        while len(self.jobs) > self.max_retained:
+            oldest_id = next((job_id for job_id, job in self.jobs.items() if job.finished), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
+
+
+job_queue = JobQueue()
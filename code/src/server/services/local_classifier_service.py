@@ -0,0 +1,390 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+import llm.DataStore as DataStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: examples file writes are only serialized within this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+STOP_WORDS = frozenset("""
+a an and are as at be been but by for from has have i if in into is it its of on or our please regards
+that the their this to was we were will with you your dear hi hello thanks thank team kind best subject
+""".split())
+# amounts, dates and reference numbers change from one routine email to the next, so they are matched as placeholders
+DATE_WORDS = frozenset("""
+january february march april may june july august september october november december
+jan feb mar apr jun jul aug sep sept oct nov dec monday tuesday wednesday thursday friday saturday sunday
+""".split())
+# the metadata lines added by the token budget assembler carry no signal about the request
+METADATA_PATTERN = re.compile(r'^(?:=== .* ===|From: .*|To: .*|Date: .*)$', re.MULTILINE)
+SUBJECT_PATTERN = re.compile(r'^Subject: (.*)$', re.MULTILINE)
+
+
+def _normalize(word: str) -> str:
+    if any(char.isdigit() for char in word):
+        return '<num>'
+    return '<date>' if word in DATE_WORDS else word
+
+
+def tokenize(text: str) -> List[str]:
+    words = [_normalize(word) for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS and len(word) > 1]
+    # word bigrams catch phrases such as "ongoing fee" or "loan increase"
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class _Index:
+    """TF-IDF vectors of the reference documents, with an inverted index for scoring."""
+
+    def __init__(self, documents: List[Tuple[Counter, Tuple[str, str], Dict[str, Any]]]):
+        self.labels = [label for _, label, _ in documents]
+        self.meta = [meta for _, _, meta in documents]
+        document_frequency = Counter()
+        for counts, _, _ in documents:
+            document_frequency.update(counts.keys())
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.default_idf = math.log(1 + total) + 1
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc_id, (counts, _, _) in enumerate(documents):
+            self._post(doc_id, counts)
+
+    def add(self, counts: Counter, label: Tuple[str, str], meta: Dict[str, Any]):
+        """Index one more document, weighted with the current idf."""
+        self.labels.append(label)
+        self.meta.append(meta)
+        self._post(len(self.labels) - 1, counts)
+
+    def _post(self, doc_id: int, counts: Counter):
+        for term, weight in self.vectorize(counts).items():
+            self.postings.setdefault(term, []).append((doc_id, weight))
+
+    def vectorize(self, counts: Counter) -> Dict[str, float]:
+        # sublinear tf, l2 normalized
+        vector = {term: (1 + math.log(count)) * self.idf.get(term, self.default_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def scores(self, counts: Counter) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term, weight in self.vectorize(counts).items():
+            for doc_id, doc_weight in self.postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * doc_weight
+        return scores
+
+
+class LocalClassifier:
+    """
+    CPU-only first-stage classifier. Emails are compared by TF-IDF cosine
+    similarity with the request type descriptions and with past emails the LLM
+    classified confidently; the request type of the most similar document wins.
+    Only results at or above the confidence threshold, and clearly ahead of the
+    best other request type, skip the LLM.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, examples_file: Optional[str] = None):
+        """
+        Initialize the classifier.
+
+        Args:
+            threshold: Confidence needed to skip the LLM (defaults to LOCAL_CLASSIFIER_THRESHOLD or 0.85)
+            examples_file: JSONL file the labeled examples are kept in, shared by every server process
+                through a lock file next to it and compacted to the newest max_examples once it holds
+                twice as many (defaults to LOCAL_CLASSIFIER_EXAMPLES_FILE; empty, the default, keeps them
+                in memory only)
+        """
+        load_dotenv()
+        # with the fast path disabled, the ranking is still used to prune the prompt
+        self.enabled = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() in ('1', 'true', 'yes')
+        self.threshold = threshold if threshold is not None else float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+        self.min_margin = float(os.getenv("LOCAL_CLASSIFIER_MIN_MARGIN", "0.1"))
+        # fraction of fast-path decisions also sent to the LLM, to keep measuring agreement
+        self.audit_rate = float(os.getenv("LOCAL_CLASSIFIER_AUDIT_RATE", "0.05"))
+        self.label_min_confidence = float(os.getenv("LOCAL_CLASSIFIER_LABEL_MIN_CONFIDENCE", "0.8"))
+        self.max_examples = int(os.getenv("LOCAL_CLASSIFIER_MAX_EXAMPLES", "5000"))
+        self.max_chars = int(os.getenv("LOCAL_CLASSIFIER_MAX_CHARS", "4000"))
+        # new examples are indexed straight away; the idf weights are recomputed after this many
+        self.refit_every = int(os.getenv("LOCAL_CLASSIFIER_REFIT_EVERY", "500"))
+        self.examples_file = examples_file if examples_file is not None \
+            else os.getenv("LOCAL_CLASSIFIER_EXAMPLES_FILE", "")
+
+        self._lock = threading.Lock()
+        self._examples: List[Dict[str, Any]] = []
+        self._examples_loaded = False
+        self._file_lines = 0
+        self._index: Optional[_Index] = None
+        self._index_version = None
+        self._pending = 0
+        self._added = 0
+        self._rebuilding = False
+        self._stats = {'local': 0, 'escalated': 0, 'audited': 0, 'agreed': 0, 'disagreed': 0,
+                       'escalated_agreed': 0, 'examples_added': 0}
+
+    def start(self):
+        """Builds the index in the background so the first request does not pay for it"""
+        threading.Thread(target=self._get_index, daemon=True).start()
+
+    def classify(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify text locally.
+
+        Returns:
+            Dict with request_type, sub_request_type, confidence_score, the margin over
+            the next request type and the ranking of all request types with any
+            similarity, or None if there is nothing to compare against
+        """
+        start_time = time.perf_counter()
+        index = self._get_index()
+        counts = Counter(tokenize(self._prepare(text)))
+        if index is None or not counts:
+            return None
+
+        # best score per request type, and the document it came from
+        best: Dict[str, Tuple[float, int]] = {}
+        for doc_id, score in index.scores(counts).items():
+            request_type = index.labels[doc_id][0]
+            if score > best.get(request_type, (0.0, -1))[0]:
+                best[request_type] = (score, doc_id)
+        if not best:
+            return None
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)
+        request_type, (score, doc_id) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+
+        subject = SUBJECT_PATTERN.search(text)
+        return {
+            'request_type': request_type,
+            'sub_request_type': index.labels[doc_id][1],
+            'confidence_score': round(min(score, 1.0), 3),
+            'summary': subject.group(1).strip() if subject else '',
+            'priority': index.meta[doc_id].get('priority'),
+            'margin': round(score - runner_up, 3),
+            'matched': index.meta[doc_id].get('source'),
+            'ranking': [(name, round(best_score, 4)) for name, (best_score, _) in ranked],
+            'seconds': round(time.perf_counter() - start_time, 4),
+        }
+
+    def should_skip_llm(self, result: Optional[Dict[str, Any]]) -> bool:
+        return self.enabled and bool(result) and result['confidence_score'] >= self.threshold and result['margin'] >= self.min_margin
+
+    def can_fall_back(self, result: Optional[Dict[str, Any]]) -> bool:
+        """Whether the result is confident enough to answer with when the LLM is unavailable"""
+        return bool(result) and result['confidence_score'] >= self.threshold
+
+    def route(self, result: Optional[Dict[str, Any]], filename: str = '') -> str:
+        """
+        Decide how to classify an email given its local result, and log the decision.
+
+        Returns:
+            'local' to use the local result, 'llm' to escalate, or 'audit' for a local
+            result sampled to go to the LLM anyway so agreement keeps being measured
+        """
+        if self.should_skip_llm(result):
+            decision = 'audit' if random.random() < self.audit_rate else 'local'
+        else:
+            decision = 'llm'
+        with self._lock:
+            self._stats['local' if decision == 'local' else 'audited' if decision == 'audit' else 'escalated'] += 1
+        if result:
+            logger.info(f"Local classifier routed {filename or 'email'} to {decision}: {result['request_type']} / "
+                        f"{result['sub_request_type']} (confidence {result['confidence_score']}, margin {result['margin']}, "
+                        f"threshold {self.threshold}, {result['seconds'] * 1000:.1f} ms)")
+        return decision
+
+    @staticmethod
+    def to_response(result: Dict[str, Any], classified_by: str = 'local') -> Dict[str, Any]:
+        """The local result in the shape of an LLM response."""
+        return {
+            'request_type': result['request_type'],
+            'sub_request_type': result['sub_request_type'],
+            'confidence_score': result['confidence_score'],
+            'summary': result['summary'],
+            'priority': result['priority'],
+            'classified_by': classified_by,
+        }
+
+    def record_llm_result(self, text: str, local_result: Optional[Dict[str, Any]], response: Dict[str, Any],
+                          filename: str = ''):
+        """
+        Compare the LLM's answer with the local one, and keep confident LLM answers
+        as labeled examples for later emails.
+        """
+        request_type = self._canonical_type(response.get('request_type'))
+        if local_result:
+            agreed = request_type == local_result['request_type']
+            with self._lock:
+                self._stats['agreed' if agreed else 'disagreed'] += 1
+                if agreed and not self.should_skip_llm(local_result):
+                    self._stats['escalated_agreed'] += 1
+            logger.info(f"Local classifier {'agreed' if agreed else 'disagreed'} with the LLM for {filename or 'email'}: "
+                        f"local {local_result['request_type']} ({local_result['confidence_score']}), "
+                        f"LLM {response.get('request_type')} ({response.get('confidence_score')})")
+
+        try:
+            confidence = float(response.get('confidence_score', 0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if request_type is None or confidence < self.label_min_confidence:
+            return
+        self.add_example(text, request_type, str(response.get('sub_request_type') or ''),
+                         {'priority': response.get('priority'), 'confidence': confidence})
+
+    def add_example(self, text: str, request_type: str, sub_request_type: str, meta: Optional[Dict[str, Any]] = None):
+        example = {'text': self._prepare(text), 'request_type': request_type, 'sub_request_type': sub_request_type,
+                   'added_at': time.time(), **(meta or {})}
+        self._load_examples()
+        with self._lock:
+            self._examples.append(example)
+            del self._examples[:-self.max_examples]
+            self._pending += 1
+            self._added += 1
+            self._stats['examples_added'] += 1
+            document = self._document(example)
+            if self._index is not None and self._index_version == DataStore.REQUEST_TYPES_VERSION \
+                    and document[1][0] is not None:
+                self._index.add(*document)
+        if self.examples_file:
+            try:
+                self._save_example(example)
+            except OSError as e:
+                logger.warning(f"Could not save labeled example to {self.examples_file}: {str(e)}")
+
+    def _save_example(self, example: Dict[str, Any]):
+        with self._file_lock():
+            with open(self.examples_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(example) + "\n")
+            with self._lock:
+                self._file_lines += 1
+                compact = self._file_lines > 2 * self.max_examples
+            if compact and os.path.isfile(self.examples_file):
+                # only the newest max_examples are ever loaded, so drop the rest
+                with open(self.examples_file, encoding='utf-8') as f:
+                    lines = f.readlines()[-self.max_examples:]
+                tmp_path = f"{self.examples_file}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                os.replace(tmp_path, self.examples_file)
+                with self._lock:
+                    self._file_lines = len(lines)
+                logger.info(f"Compacted {self.examples_file} to the newest {len(lines)} labeled examples")
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the examples file across processes, held on a separate file so compaction can replace it"""
+        with open(f"{self.examples_file}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            examples = len(self._examples)
+        compared = stats['agreed'] + stats['disagreed']
+        decided = stats['local'] + stats['audited'] + stats['escalated']
+        return {**stats, 'examples': examples, 'threshold': self.threshold,
+                'local_ratio': round(stats['local'] / decided, 3) if decided else 0.0,
+                'agreement_rate': round(stats['agreed'] / compared, 3) if compared else None}
+
+    def _prepare(self, text: str) -> str:
+        return METADATA_PATTERN.sub('', text[:self.max_chars]).strip()
+
+    def _canonical_type(self, request_type: Optional[str]) -> Optional[str]:
+        if not request_type:
+            return None
+        by_lower = {name.lower().strip(): name for name in DataStore.REQUEST_TYPES}
+        return by_lower.get(str(request_type).lower().strip())
+
+    def _load_examples(self):
+        if self._examples_loaded:
+            return
+        with self._lock:
+            if self._examples_loaded:
+                return
+            if self.examples_file and os.path.exists(self.examples_file):
+                with self._file_lock(), open(self.examples_file, encoding='utf-8') as f:
+                    for line in f:
+                        self._file_lines += 1
+                        try:
+                            self._examples.append(json.loads(line))
+                        except ValueError:
+                            continue
+                del self._examples[:-self.max_examples]
+                logger.info(f"Loaded {len(self._examples)} labeled examples from {self.examples_file}")
+            self._examples_loaded = True
+
+    def _get_index(self) -> Optional[_Index]:
+        self._load_examples()
+        if self._index is None or self._index_version != DataStore.REQUEST_TYPES_VERSION:
+            # the labels depend on the request types, so this rebuild has to finish before classifying
+            self._rebuild()
+        elif self._pending >= self.refit_every and not self._rebuilding:
+            # refreshing the idf weights can take seconds with many examples; keep using the current index meanwhile
+            with self._lock:
+                start, self._rebuilding = not self._rebuilding, True
+            if start:
+                threading.Thread(target=self._rebuild, daemon=True).start()
+        return self._index
+
+    def _rebuild(self):
+        try:
+            version = DataStore.REQUEST_TYPES_VERSION
+            with self._lock:
+                examples = list(self._examples)
+                added = self._added
+                self._pending = 0
+            index = self._build(examples)
+            with self._lock:
+                # examples added during the build only went into the previous index
+                if index is not None and self._added > added:
+                    for example in self._examples[-(self._added - added):]:
+                        document = self._document(example)
+                        if document[1][0] is not None:
+                            index.add(*document)
+                self._index, self._index_version = index, version
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _document(self, example: Dict[str, Any]) -> Tuple[Counter, Tuple[str, str], Dict[str, Any]]:
+        return (Counter(tokenize(example['text'])),
+                (self._canonical_type(example.get('request_type')), example.get('sub_request_type', '')),
+                {'source': 'example', 'priority': example.get('priority')})
+
+    def _build(self, examples: List[Dict[str, Any]]) -> Optional[_Index]:
+        start_time = time.perf_counter()
+        documents = []
+        for request_type, details in DataStore.REQUEST_TYPES.items():
+            description = f"{request_type} {details.get('description', '')}"
+            sub_requests = details.get('sub_requests') or {}
+            if not sub_requests:
+                documents.append((Counter(tokenize(description)), (request_type, ''), {'source': 'description'}))
+            for sub_request, sub_description in sub_requests.items():
+                documents.append((Counter(tokenize(f"{description} {sub_request} {sub_description}")),
+                                  (request_type, sub_request), {'source': 'description'}))
+        for example in examples:
+            document = self._document(example)
+            # examples of request types that have since been removed are ignored
+            if document[1][0] is not None:
+                documents.append(document)
+        if not documents:
+            return None
+        index = _Index(documents)
+        logger.info(f"Local classifier indexed {len(documents)} documents in {time.perf_counter() - start_time:.2f}s")
+        return index
+
+
+local_classifier = LocalClassifier()
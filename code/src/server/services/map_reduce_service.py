@@ -0,0 +1,135 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+from dotenv import load_dotenv
+from utils import jsonconverter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# concurrent LLM calls for the chunks of one document
+MAP_REDUCE_CONCURRENCY = int(os.getenv("LLM_MAP_REDUCE_CONCURRENCY", "8"))
+
+PRIORITY_RANK = {'low': 0, 'normal': 1, 'medium': 1, 'high': 2, 'urgent': 3, 'critical': 3}
+CLASSIFICATION_FIELDS = ('request_type', 'sub_request_type', 'confidence_score', 'summary', 'priority')
+
+
+class ChunkParseError(ValueError):
+    """The LLM answered for some chunks, but none of the answers could be parsed."""
+
+
+async def classify_chunks(chunks: List[str], call: Callable[[str], Awaitable[str]],
+                          concurrency: int = MAP_REDUCE_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Classify each chunk of a document concurrently and merge the answers.
+
+    Args:
+        chunks: Text chunks, each small enough for one LLM call
+        call: Coroutine function sending one chunk to the LLM and returning its raw response
+        concurrency: Maximum number of chunks in flight
+
+    Returns:
+        The merged response
+
+    Raises:
+        Exception: The first LLM call's error, if the call failed for every chunk
+        ChunkParseError: If no chunk returned a parsable response
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify(chunk):
+        async with semaphore:
+            return await call(chunk)
+
+    raw_responses = await asyncio.gather(*(classify(chunk) for chunk in chunks), return_exceptions=True)
+    responses = []
+    for i, raw in enumerate(raw_responses):
+        if isinstance(raw, Exception):
+            logger.warning(f"LLM call for chunk {i+1} of {len(chunks)} failed: {str(raw)}")
+            continue
+        try:
+            response = jsonconverter.get_response_string(raw)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Could not parse the response for chunk {i+1} of {len(chunks)}: {str(e)}")
+            continue
+        if isinstance(response, list):
+            response = next((item for item in response if isinstance(item, dict)), None)
+        if isinstance(response, dict):
+            responses.append(response)
+    if not responses:
+        failures = [raw for raw in raw_responses if isinstance(raw, Exception)]
+        if len(failures) == len(chunks):
+            raise failures[0]
+        raise ChunkParseError(f"none of the {len(chunks)} chunk responses could be parsed")
+    return merge_chunk_responses(responses, len(chunks))
+
+
+def _confidence(response: Dict[str, Any]) -> float:
+    try:
+        return float(response.get('confidence_score', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _vote(responses: List[Dict[str, Any]], key: str) -> Dict[Any, float]:
+    votes: Dict[Any, float] = {}
+    for response in responses:
+        # a chunk without a confidence still gets a small say
+        votes[response.get(key)] = votes.get(response.get(key), 0.0) + max(_confidence(response), 0.01)
+    return votes
+
+
+def merge_chunk_responses(responses: List[Dict[str, Any]], total_chunks: int) -> Dict[str, Any]:
+    """
+    Merge per-chunk classifications into one response: request_type and
+    sub_request_type are chosen by a vote weighted by confidence_score, the
+    priority is the highest any chunk reported, and other extracted fields are
+    combined, preferring the values of more confident chunks.
+
+    Args:
+        responses: Parsed per-chunk responses
+        total_chunks: Number of chunks sent, including ones without a usable response
+
+    Returns:
+        The merged response, with a 'map_reduce' entry describing the vote
+    """
+    votes = _vote(responses, 'request_type')
+    request_type = max(votes, key=votes.get)
+    agreeing = [response for response in responses if response.get('request_type') == request_type]
+    sub_votes = _vote(agreeing, 'sub_request_type')
+    sub_request_type = max(sub_votes, key=sub_votes.get)
+    best = max(agreeing, key=_confidence)
+
+    # mean confidence of the agreeing chunks, scaled down by how contested the vote was
+    agreement = votes[request_type] / sum(votes.values())
+    confidence = sum(_confidence(response) for response in agreeing) / len(agreeing) * agreement
+
+    priorities = [response.get('priority') for response in responses if response.get('priority')]
+    priority = max(priorities, key=lambda value: PRIORITY_RANK.get(str(value).lower(), -1)) if priorities else None
+
+    merged: Dict[str, Any] = {
+        'request_type': request_type,
+        'sub_request_type': sub_request_type,
+        'confidence_score': round(confidence, 3),
+        'summary': best.get('summary', ''),
+        'priority': priority,
+    }
+    for response in sorted(responses, key=_confidence, reverse=True):
+        for key, value in response.items():
+            if key in CLASSIFICATION_FIELDS:
+                continue
+            if key not in merged or merged[key] in (None, '', [], {}):
+                merged[key] = value
+            elif isinstance(merged[key], list) and isinstance(value, list):
+                merged[key] = merged[key] + [item for item in value if item not in merged[key]]
+            elif isinstance(merged[key], dict) and isinstance(value, dict):
+                merged[key] = {**value, **merged[key]}
+
+    merged['map_reduce'] = {
+        'chunks': total_chunks,
+        'classified': len(responses),
+        'votes': {str(key): round(weight, 3) for key, weight in votes.items()},
+    }
+    return merged
@@ -0,0 +1,478 @@
+import io
+import os
+import time
+import hashlib
+import functools
+import logging
+import threading
+from dataclasses import dataclass
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import fitz  # PyMuPDF for PDF processing
+import pytesseract
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from services.cache_service import TieredCache
+from services.blob_service import blob_store
+from services.execution_service import extraction_pool_size
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OCRSettings:
+    """OCR options sent along with every page to the pool workers."""
+    lang: str = 'eng'
+    adaptive: bool = True
+    low_dpi: int = 150
+    high_dpi: int = 300
+    min_confidence: float = 60.0
+    image_max_dimension: int = 2500
+    image_binarize: bool = True
+
+
+# per-process OCR cache; pool workers build their own after fork rather than sharing the parent's SQLite connection
+_ocr_cache = None
+_ocr_cache_pid = None
+
+
+def get_ocr_cache() -> TieredCache:
+    global _ocr_cache, _ocr_cache_pid
+    if _ocr_cache is None or _ocr_cache_pid != os.getpid():
+        load_dotenv()
+        _ocr_cache = TieredCache(
+            "ocr",
+            max_entries=int(os.getenv("OCR_CACHE_SIZE", "2048")),
+            ttl_seconds=float(os.getenv("OCR_CACHE_TTL", str(30 * 86400))),
+            db_path=os.getenv("OCR_CACHE_DB") or os.getenv("CLASSIFICATION_CACHE_DB") or None,
+            max_db_entries=int(os.getenv("OCR_CACHE_DB_MAX_ENTRIES", "200000")))
+        _ocr_cache_pid = os.getpid()
+    return _ocr_cache
+
+
+def _open_pdf(source: Union[str, bytes]) -> fitz.Document:
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+# the PDF this pool worker last rendered pages of, kept open for the document's next pages:
+# ((path, mtime, size), document). A released blob's disk space is freed once the worker moves on.
+_shared_pdf = (None, None)
+
+
+def _open_shared_pdf(path: str) -> fitz.Document:
+    global _shared_pdf
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _shared_pdf[0] != key:
+        if _shared_pdf[1] is not None:
+            _shared_pdf[1].close()
+        _shared_pdf = (key, fitz.open(path))
+    return _shared_pdf[1]
+
+
+def _render_page(page, dpi: int) -> Image.Image:
+    pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def _image_key(img: Image.Image, settings: OCRSettings) -> str:
+    digest = hashlib.sha256(img.tobytes())
+    digest.update(f"{img.size}:{img.mode}:{settings.lang}:{settings.adaptive}:{settings.min_confidence}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _ocr_with_confidence(img: Image.Image, lang: str) -> Tuple[str, float]:
+    """
+    Run tesseract once and return the text with the mean word confidence (0-100).
+    """
+    data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
+
+
+def ocr_pdf_page(source: Union[str, bytes], page_num: int, settings: OCRSettings) -> Dict[str, Any]:
+    """
+    Render a single PDF page and run tesseract on it, reusing cached text for
+    pages that render to an identical image.
+    Module-level so it can be sent to process pool workers.
+
+    In adaptive mode the page is first OCR'd at settings.low_dpi and only
+    re-rendered at settings.high_dpi when tesseract's mean confidence is
+    below settings.min_confidence.
+
+    Args:
+        source: Path to PDF file or its bytes
+        page_num: Zero-based page number
+        settings: OCR options
+
+    Returns:
+        Dict with the page text, cache_hit, dpi, confidence, seconds spent and seconds saved by the cache
+    """
+    start_time = time.perf_counter()
+    with _open_pdf(source) as pdf_document:
+        return _ocr_page(pdf_document[page_num], page_num, settings, start_time)
+
+
+def ocr_shared_pdf_page(path: str, page_num: int, settings: OCRSettings) -> Dict[str, Any]:
+    """
+    Like ocr_pdf_page, for the pages of one PDF file spread over the pool: each worker
+    opens the file once and keeps it open for the pages it gets after the first.
+    """
+    start_time = time.perf_counter()
+    return _ocr_page(_open_shared_pdf(path)[page_num], page_num, settings, start_time)
+
+
+def _ocr_page(page, page_num: int, settings: OCRSettings, start_time: float) -> Dict[str, Any]:
+    cache = get_ocr_cache()
+    first_dpi = settings.low_dpi if settings.adaptive else settings.high_dpi
+    img = _render_page(page, first_dpi)
+    key = _image_key(img, settings)
+
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, 'cache_hit': True, 'seconds': time.perf_counter() - start_time,
+                'seconds_saved': cached['seconds']}
+
+    if settings.adaptive:
+        text, confidence = _ocr_with_confidence(img, settings.lang)
+        dpi = first_dpi
+        if confidence < settings.min_confidence:
+            logger.info(f"OCR confidence {confidence:.0f} below {settings.min_confidence} for page {page_num}, retrying at {settings.high_dpi} DPI")
+            text, confidence = _ocr_with_confidence(_render_page(page, settings.high_dpi), settings.lang)
+            dpi = settings.high_dpi
+    else:
+        text = pytesseract.image_to_string(img, lang=settings.lang)
+        confidence = None
+        dpi = first_dpi
+
+    result = {'text': text, 'dpi': dpi, 'confidence': confidence, 'seconds': time.perf_counter() - start_time}
+    cache.set(key, result)
+    return {**result, 'cache_hit': False, 'seconds_saved': 0.0}
+
+
+def preprocess_image(img: Image.Image, max_dimension: int, binarize: bool) -> Image.Image:
+    """
+    Prepare a photo or screenshot for tesseract: grayscale, downscale so the
+    longest side is at most max_dimension, and optionally binarize with
+    Otsu's threshold.
+    """
+    img = ImageOps.exif_transpose(img).convert("L")
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    if binarize:
+        pixels = np.asarray(img)
+        histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+        total = pixels.size
+        weights = np.cumsum(histogram)
+        means = np.cumsum(histogram * np.arange(256))
+        # between-class variance for every threshold, pick the maximum
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = (means[-1] * weights / total - means) ** 2 / (weights * (total - weights))
+        # a single-colour image (e.g. a blank scan) has no threshold to pick
+        if not np.isnan(variance).all():
+            threshold = int(np.nanargmax(variance))
+            img = img.point(lambda value: 255 if value > threshold else 0, mode="1")
+    return img
+
+
+def ocr_image_file(source: Union[str, bytes], settings: OCRSettings) -> Dict[str, Any]:
+    """
+    Preprocess an image file and run tesseract on it, reusing cached text for identical images.
+    Module-level so it can be sent to process pool workers.
+
+    Args:
+        source: Path to image file or its bytes
+        settings: OCR options
+
+    Returns:
+        Dict with the same fields as ocr_pdf_page (dpi is None for images)
+    """
+    start_time = time.perf_counter()
+    cache = get_ocr_cache()
+    with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as original:
+        img = preprocess_image(original, settings.image_max_dimension, settings.image_binarize)
+    key = _image_key(img, settings)
+
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, 'cache_hit': True, 'seconds': time.perf_counter() - start_time,
+                'seconds_saved': cached['seconds']}
+
+    text, confidence = _ocr_with_confidence(img, settings.lang)
+    result = {'text': text, 'dpi': None, 'confidence': confidence, 'seconds': time.perf_counter() - start_time}
+    cache.set(key, result)
+    return {**result, 'cache_hit': False, 'seconds_saved': 0.0}
+
+
+class OCRSpaceClient:
+    """
+    Optional remote OCR backend (ocr.space) with a pooled session and timeouts.
+    """
+
+    URL = 'https://api.ocr.space/parse/image'
+
+    def __init__(self, api_key: str, timeout: float = 30, pool_size: int = 10):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def ocr_image_file(self, source: Union[str, bytes], name: str = 'image') -> str:
+        payload = {
+            'apikey': self.api_key,
+            'isOverlayRequired': 'false'
+        }
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                response = self.session.post(self.URL, files={'file': f}, data=payload, timeout=self.timeout)
+        else:
+            response = self.session.post(self.URL, files={'file': (name, source)}, data=payload, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+        if result['IsErroredOnProcessing']:
+            return f"Error: {result['ErrorMessage']}"
+        return result['ParsedResults'][0]['ParsedText']
+
+
+class OCRStats:
+    """
+    Running totals of OCR work, used to report cache hit ratio and time saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pages = 0
+        self.cache_hits = 0
+        self.high_dpi_retries = 0
+        self.seconds = 0.0
+        self.seconds_saved = 0.0
+
+    def record_page(self, page_result: Dict[str, Any], settings: OCRSettings):
+        with self._lock:
+            self.pages += 1
+            self.seconds += page_result['seconds']
+            if page_result['cache_hit']:
+                self.cache_hits += 1
+                self.seconds_saved += page_result['seconds_saved']
+            elif settings.adaptive and page_result['dpi'] == settings.high_dpi:
+                self.high_dpi_retries += 1
+
+    def merge(self, stats: Dict[str, Any]):
+        with self._lock:
+            self.pages += stats['pages']
+            self.cache_hits += stats['cache_hits']
+            self.high_dpi_retries += stats['high_dpi_retries']
+            self.seconds += stats['seconds']
+            self.seconds_saved += stats['seconds_saved']
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pages': self.pages,
+                'cache_hits': self.cache_hits,
+                'hit_ratio': round(self.cache_hits / self.pages, 4) if self.pages else 0.0,
+                'high_dpi_retries': self.high_dpi_retries,
+                'seconds': round(self.seconds, 3),
+                'seconds_saved': round(self.seconds_saved, 3),
+            }
+
+
+class OCRService:
+    """
+    Runs page-level and image OCR across a process pool so scanned multi-page PDFs
+    and emails with many image attachments use every core.
+    """
+
+    def __init__(self, workers: Optional[int] = None, settings: Optional[OCRSettings] = None):
+        """
+        Initialize the OCR service. The pool is created lazily on first use.
+
+        Args:
+            workers: Number of OCR processes (defaults to OCR_WORKERS or the CPU count); inside an
+                extraction worker this is shared among the extraction pool's workers
+            settings: Default OCR options (defaults to OCR_ADAPTIVE, OCR_LOW_DPI,
+                OCR_HIGH_DPI and OCR_MIN_CONFIDENCE)
+        """
+        load_dotenv()
+        self.workers = workers or int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+        self.settings = settings or OCRSettings(
+            adaptive=os.getenv("OCR_ADAPTIVE", "true").lower() in ("1", "true", "yes"),
+            low_dpi=int(os.getenv("OCR_LOW_DPI", "150")),
+            high_dpi=int(os.getenv("OCR_HIGH_DPI", "300")),
+            min_confidence=float(os.getenv("OCR_MIN_CONFIDENCE", "60")),
+            image_max_dimension=int(os.getenv("OCR_IMAGE_MAX_DIMENSION", "2500")),
+            image_binarize=os.getenv("OCR_IMAGE_BINARIZE", "true").lower() in ("1", "true", "yes"))
+        self._pool = None
+        # attachments of one email may start OCR from several threads at once
+        self._pool_lock = threading.Lock()
+
+        # "local" runs tesseract in the pool, "ocrspace" sends images to the ocr.space API
+        self.image_backend = os.getenv("IMAGE_OCR_BACKEND", "local").lower()
+        self.ocr_space_api_key = os.getenv("OCR_SPACE_API_KEY")
+        if self.image_backend == 'ocrspace' and not self.ocr_space_api_key:
+            logger.warning("IMAGE_OCR_BACKEND is ocrspace but OCR_SPACE_API_KEY is not set, using local OCR")
+            self.image_backend = 'local'
+        self._remote_client = None
+
+    @property
+    def pool_size(self) -> int:
+        """
+        Number of OCR processes this process may start. Every extraction worker gets its own
+        OCR pool, so inside one the cores are split among the extraction workers instead of
+        each of them starting a full pool.
+        """
+        extraction_workers = extraction_pool_size()
+        if extraction_workers is None:
+            return self.workers
+        return max(1, self.workers // extraction_workers)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+                # when this runs inside an extraction pool worker, atexit hooks never fire and the worker would
+                # wait forever on the OCR processes at exit; a multiprocessing finalizer runs before that wait.
+                # It must outrank the queue finalizers (priority 10) so the shutdown sentinels still get sent.
+                Finalize(self, OCRService._shutdown_pool, args=(self._pool,), exitpriority=100)
+                logger.info(f"Started OCR process pool with {self.pool_size} workers")
+            return self._pool
+
+    @property
+    def remote_client(self) -> OCRSpaceClient:
+        if self._remote_client is None:
+            self._remote_client = OCRSpaceClient(
+                api_key=self.ocr_space_api_key,
+                timeout=float(os.getenv("OCR_SPACE_TIMEOUT", "30")))
+        return self._remote_client
+
+    def settings_for(self, lang: str) -> OCRSettings:
+        return OCRSettings(lang, self.settings.adaptive, self.settings.low_dpi,
+                           self.settings.high_dpi, self.settings.min_confidence,
+                           self.settings.image_max_dimension, self.settings.image_binarize)
+
+    def ocr_images(self, sources: List[Union[str, bytes]], lang: str = 'eng') -> List[Dict[str, Any]]:
+        """
+        OCR a batch of image files (e.g. every image attached to one email) in parallel.
+
+        Args:
+            sources: Paths to image files or their bytes
+            lang: Language for OCR processing
+
+        Returns:
+            Result of ocr_image_file for each image, in the order of sources, or the
+            exception raised for that image so one bad image doesn't lose the others' text
+        """
+        if self.image_backend == 'ocrspace':
+            results = []
+            for source in sources:
+                start_time = time.perf_counter()
+                try:
+                    text = self.remote_client.ocr_image_file(source)
+                except Exception as e:
+                    results.append(e)
+                    continue
+                results.append({'text': text, 'dpi': None, 'confidence': None, 'cache_hit': False,
+                                'seconds': time.perf_counter() - start_time, 'seconds_saved': 0.0})
+            return results
+
+        settings = self.settings_for(lang)
+        return self._map(ocr_image_file, [(source, settings) for source in sources], return_exceptions=True)
+
+    def ocr_pdf_pages(self, source: Union[str, bytes], page_nums: List[int], lang: str = 'eng',
+                      on_page_done: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, Any]]:
+        """
+        OCR several pages of a PDF in parallel.
+
+        Args:
+            source: Path to PDF file or its bytes
+            page_nums: Zero-based page numbers to OCR
+            lang: Language for OCR processing
+            on_page_done: Optional callable receiving (pages done, pages total) as pages finish
+
+        Returns:
+            Result of ocr_pdf_page for each page, in the order of page_nums
+        """
+        settings = self.settings_for(lang)
+        if len(page_nums) <= 1 or self.pool_size <= 1:
+            # run right here by _map, nothing crosses a process boundary
+            return self._map(ocr_pdf_page, [(source, page_num, settings) for page_num in page_nums], on_page_done)
+        if isinstance(source, str):
+            return self._map(ocr_shared_pdf_page, [(source, page_num, settings) for page_num in page_nums], on_page_done)
+        # the workers read one copy on disk instead of getting the whole PDF pickled with every page
+        with blob_store.hold(source) as ref_path:
+            return self._map(ocr_shared_pdf_page, [(ref_path, page_num, settings) for page_num in page_nums], on_page_done)
+
+    def _map(self, func: Callable, args_list: List[tuple],
+             on_done: Optional[Callable[[int, int], None]] = None, return_exceptions: bool = False) -> List[Any]:
+        """
+        Run func over args_list on the pool, returning results in input order. With
+        return_exceptions, an item that fails gets its exception as the result instead
+        of failing the whole call; a broken pool is still raised.
+        """
+        def collect(get_result):
+            try:
+                return get_result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        # a pool round trip isn't worth it for a single item, and with a single OCR process the
+        # work runs right here (e.g. inside an extraction worker when there are as many of them as cores)
+        if len(args_list) <= 1 or self.pool_size <= 1:
+            results = []
+            for i, args in enumerate(args_list):
+                results.append(collect(functools.partial(func, *args)))
+                if on_done:
+                    on_done(i + 1, len(args_list))
+            return results
+
+        results = [None] * len(args_list)
+        try:
+            futures = {self.pool.submit(func, *args): i for i, args in enumerate(args_list)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = collect(future.result)
+                if on_done:
+                    on_done(done, len(args_list))
+        except BrokenProcessPool:
+            logger.error("OCR process pool is broken, recreating it")
+            with self._pool_lock:
+                self._pool = None
+            raise
+        return results
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            self._shutdown_pool(pool)
+
+    @staticmethod
+    def _shutdown_pool(pool: ProcessPoolExecutor):
+        pool.shutdown(wait=True)
+
+
+ocr_service = OCRService()
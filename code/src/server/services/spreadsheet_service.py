@@ -0,0 +1,166 @@
+import io
+import os
+import datetime
+import logging
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
+import openpyxl
+import xlrd
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+@dataclass
+class SpreadsheetLimits:
+    """Caps applied while streaming a workbook, so the rendering fits the LLM budget."""
+    max_sheets: int = 5
+    max_rows: int = 200
+    max_cols: int = 20
+    max_cell_chars: int = 60
+    max_chars: int = 12000
+
+    @classmethod
+    def from_env(cls) -> "SpreadsheetLimits":
+        load_dotenv()
+        return cls(
+            max_sheets=int(os.getenv("EXCEL_MAX_SHEETS", "5")),
+            max_rows=int(os.getenv("EXCEL_MAX_ROWS", "200")),
+            max_cols=int(os.getenv("EXCEL_MAX_COLS", "20")),
+            max_cell_chars=int(os.getenv("EXCEL_MAX_CELL_CHARS", "60")),
+            max_chars=int(os.getenv("EXCEL_MAX_CHARS", "12000")))
+
+
+def _format_cell(value: Any, max_chars: int) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        text = str(int(value)) if value.is_integer() else f"{value:.6g}"
+    elif isinstance(value, datetime.datetime):
+        text = value.date().isoformat() if value.time() == datetime.time() else value.isoformat(sep=' ')
+    elif isinstance(value, (datetime.date, datetime.time)):
+        text = value.isoformat()
+    else:
+        text = " ".join(str(value).split())
+    # keep the separator unambiguous
+    text = text.replace('|', '/')
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+def _render_rows(rows: Iterable[Tuple[Any, ...]], limits: SpreadsheetLimits, budget: int) -> Tuple[List[str], int, bool]:
+    """
+    Render up to limits.max_rows non-empty rows as pipe-separated lines without
+    consuming the rest of the iterator.
+
+    Returns:
+        The rendered lines, the number of characters used and whether rows were left out
+    """
+    lines = []
+    used = 0
+    for row in rows:
+        cells = [_format_cell(value, limits.max_cell_chars) for value in row[:limits.max_cols]]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+        if len(lines) >= limits.max_rows:
+            return lines, used, True
+        line = " | ".join(cells)
+        if used + len(line) + 1 > budget:
+            return lines, used, True
+        lines.append(line)
+        used += len(line) + 1
+    return lines, used, False
+
+
+def _iter_xlsx_sheets(data: Union[str, bytes], limits: SpreadsheetLimits) -> Iterator[Tuple[str, Optional[int], Optional[int], Iterator]]:
+    # read-only mode streams rows from the sheet XML instead of building the whole workbook
+    workbook = openpyxl.load_workbook(data if isinstance(data, str) else io.BytesIO(data),
+                                      read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets[:limits.max_sheets]:
+            # dimensions come from the sheet header and may be missing
+            rows = sheet.iter_rows(max_col=limits.max_cols, values_only=True)
+            yield sheet.title, sheet.max_row, sheet.max_column, rows
+    finally:
+        workbook.close()
+
+
+def _iter_xls_sheets(data: Union[str, bytes], limits: SpreadsheetLimits) -> Iterator[Tuple[str, Optional[int], Optional[int], Iterator]]:
+    # on_demand only parses a sheet when it is requested
+    if isinstance(data, str):
+        workbook = xlrd.open_workbook(data, on_demand=True)
+    else:
+        workbook = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        for index in range(min(workbook.nsheets, limits.max_sheets)):
+            sheet = workbook.sheet_by_index(index)
+
+            def rows(sheet=sheet):
+                for row_index in range(sheet.nrows):
+                    values = []
+                    for cell in sheet.row_slice(row_index, 0, min(sheet.ncols, limits.max_cols)):
+                        if cell.ctype == xlrd.XL_CELL_DATE:
+                            values.append(xlrd.xldate.xldate_as_datetime(cell.value, workbook.datemode))
+                        else:
+                            values.append(cell.value if cell.value != '' else None)
+                    yield tuple(values)
+
+            yield sheet.name, sheet.nrows, sheet.ncols, rows()
+            workbook.unload_sheet(index)
+    finally:
+        workbook.release_resources()
+
+
+def _is_xls(source: Union[str, bytes]) -> bool:
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            header = f.read(len(XLS_MAGIC))
+    else:
+        header = source[:len(XLS_MAGIC)]
+    return header == XLS_MAGIC
+
+
+def extract_spreadsheet(source: Union[str, bytes], limits: Optional[SpreadsheetLimits] = None) -> str:
+    """
+    Render a workbook as compact pipe-separated text, one block per sheet.
+    Rows are streamed and reading stops once the row, column, sheet or
+    character caps are reached, so time and memory stay flat for huge sheets.
+
+    Args:
+        source: Path to .xlsx/.xls file or its bytes
+        limits: Caps on sheets, rows, columns and characters (defaults to the EXCEL_* settings)
+
+    Returns:
+        Text rendering of the workbook
+    """
+    limits = limits or SpreadsheetLimits.from_env()
+    sheets = _iter_xls_sheets(source, limits) if _is_xls(source) else _iter_xlsx_sheets(source, limits)
+
+    blocks = []
+    remaining = limits.max_chars
+    sheet_count = 0
+    for title, row_count, col_count, rows in sheets:
+        sheet_count += 1
+        if remaining <= 0:
+            blocks.append(f"[Sheet: {title} omitted, character limit reached]")
+            continue
+        lines, used, truncated = _render_rows(rows, limits, remaining)
+        remaining -= used
+        if truncated and not lines:
+            # not even the first row fitted in what was left
+            blocks.append(f"[Sheet: {title} omitted, character limit reached]")
+            remaining = 0
+            continue
+
+        size = f"{row_count} rows x {col_count} columns" if row_count and col_count else "size unknown"
+        header = f"[Sheet: {title} ({size})]"
+        if truncated or (col_count or 0) > limits.max_cols:
+            header += f" showing first {len(lines)} rows, {min(col_count or limits.max_cols, limits.max_cols)} columns"
+        blocks.append("\n".join([header] + lines))
+
+    text = "\n\n".join(blocks)
+    logger.info(f"Rendered {sheet_count} sheet(s) as {len(text)} characters")
+    return text
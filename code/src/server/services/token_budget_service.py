@@ -0,0 +1,301 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# attachments of these formats are most likely to carry the request; the rest get budget after them
+ATTACHMENT_FORMAT_PRIORITY = ['pdf', 'docx', 'doc', 'txt', 'eml', 'xlsx', 'xls', 'png', 'jpg', 'tiff', 'bmp']
+# paragraphs shorter than this (greetings, "Thanks") are never treated as duplicates
+DEDUP_MIN_CHARS = 40
+TRUNCATION_MARKER = "[... truncated {tokens} tokens]"
+OMITTED_MARKER = "[omitted: token budget exhausted]"
+# only this many characters per budget token are tokenized; the rest of a longer section could never be sent,
+# so its token count is extrapolated
+MAX_CHARS_PER_TOKEN = 32
+# when splitting into chunks, a line is only split to fill a chunk with at least this many tokens left
+# (sections are single lines after preprocessing, so most chunk boundaries fall inside one)
+MIN_SPLIT_TOKENS = 64
+
+
+@dataclass
+class TokenBudget:
+    """Token limits for the text sent to the LLM."""
+    max_input_tokens: int = 8000
+    body_max_tokens: int = 4000
+    attachment_max_tokens: int = 2000
+    # documents over budget are split into up to max_chunks chunks of max_input_tokens, classified separately
+    map_reduce: bool = True
+    max_chunks: int = 8
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        load_dotenv()
+        return cls(
+            max_input_tokens=int(os.getenv("LLM_MAX_INPUT_TOKENS", "8000")),
+            body_max_tokens=int(os.getenv("LLM_BODY_MAX_TOKENS", "4000")),
+            attachment_max_tokens=int(os.getenv("LLM_ATTACHMENT_MAX_TOKENS", "2000")),
+            map_reduce=os.getenv("LLM_MAP_REDUCE", "true").lower() in ('1', 'true', 'yes'),
+            max_chunks=int(os.getenv("LLM_MAP_REDUCE_MAX_CHUNKS", "8")))
+
+
+class TokenCounter:
+    """
+    Counts and truncates text in tokens with a local `tokenizers` tokenizer,
+    loaded from TOKENIZER_FILE (a tokenizer.json) or TOKENIZER_NAME (a Hugging
+    Face hub id, cached locally after the first download). Without either, or
+    when loading fails, tokens are estimated as characters / TOKEN_CHARS_PER_TOKEN.
+    """
+
+    def __init__(self, tokenizer_file: Optional[str] = None, tokenizer_name: Optional[str] = None,
+                 chars_per_token: Optional[float] = None):
+        load_dotenv()
+        self.tokenizer_file = tokenizer_file or os.getenv("TOKENIZER_FILE", "")
+        self.tokenizer_name = tokenizer_name or os.getenv("TOKENIZER_NAME", "")
+        self.chars_per_token = chars_per_token or float(os.getenv("TOKEN_CHARS_PER_TOKEN", "4"))
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._tokenizer = self._load()
+                    self._loaded = True
+        return self._tokenizer
+
+    @property
+    def name(self) -> str:
+        if self.tokenizer is None:
+            return f"estimate ({self.chars_per_token:g} chars/token)"
+        return self.tokenizer_file or self.tokenizer_name
+
+    def _load(self):
+        if not self.tokenizer_file and not self.tokenizer_name:
+            return None
+        try:
+            from tokenizers import Tokenizer
+            if self.tokenizer_file:
+                return Tokenizer.from_file(self.tokenizer_file)
+            return Tokenizer.from_pretrained(self.tokenizer_name)
+        except Exception as e:
+            logger.warning(f"Could not load tokenizer {self.tokenizer_file or self.tokenizer_name}, "
+                           f"estimating tokens from characters: {str(e)}")
+            return None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return int(len(text) / self.chars_per_token + 0.999)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """
+        Cut text to at most max_tokens tokens.
+
+        Returns:
+            The kept text and the number of tokens cut off
+        """
+        total = self.count(text)
+        if total <= max_tokens:
+            return text, 0
+        if max_tokens <= 0:
+            return '', total
+        if self.tokenizer is None:
+            cut = int(max_tokens * self.chars_per_token)
+            # end on a word boundary when there is one nearby
+            space = text.rfind(' ', cut // 2, cut)
+            kept = text[:space if space != -1 else cut]
+            return kept, total - self.count(kept)
+        offsets = self.tokenizer.encode(text, add_special_tokens=False).offsets
+        return text[:offsets[max_tokens - 1][1]], total - max_tokens
+
+
+class TokenBudgetAssembler:
+    """
+    Builds the LLM input from an email and its attachments within a token budget.
+
+    Sections get budget in priority order: the body first, then attachments by
+    format (ATTACHMENT_FORMAT_PRIORITY), each capped at its per-section limit;
+    budget left over is then shared among the sections that were cut. Paragraphs
+    already seen in an earlier section (typically quoted replies repeated in
+    forwarded attachments) are dropped before counting.
+    """
+
+    def __init__(self, budget: Optional[TokenBudget] = None, counter: Optional[TokenCounter] = None):
+        self.budget = budget or TokenBudget.from_env()
+        self.counter = counter or token_counter
+
+    def assemble(self, email_data: Dict[str, Any], preprocess=lambda text: text) -> Tuple[str, Dict[str, Any]]:
+        """
+        Args:
+            email_data: Processed email data with attachments
+            preprocess: Applied to each section's text after deduplication
+
+        Returns:
+            The text for the LLM and a dict of token stats
+        """
+        header = self._header(email_data)
+
+        seen = set()
+        duplicate_chars = 0
+        sections = []
+        for index, (title, text, priority) in enumerate(self._sections(email_data)):
+            text, removed = self._deduplicate(text, seen)
+            duplicate_chars += removed
+            text = preprocess(text)
+            cap = self.budget.max_input_tokens * MAX_CHARS_PER_TOKEN
+            sendable = self.counter.count(text[:cap])
+            tokens = sendable if len(text) <= cap else int(sendable * len(text) / cap)
+            sections.append({'index': index, 'title': title, 'text': text[:cap], 'priority': priority,
+                             'tokens': tokens, 'sendable': sendable, 'is_body': index == 0})
+
+        # titles (and the marker for attachments left out) are always sent, so reserve them with the metadata
+        omitted_tokens = self.counter.count(OMITTED_MARKER)
+        remaining = self.budget.max_input_tokens - self.counter.count(header) \
+            - sum(self.counter.count(section['title']) + 1 + (0 if section['is_body'] else omitted_tokens)
+                  for section in sections)
+        by_priority = sorted(sections, key=lambda section: section['priority'])
+        for section in by_priority:
+            limit = self.budget.body_max_tokens if section['is_body'] else self.budget.attachment_max_tokens
+            section['allowed'] = max(0, min(section['sendable'], limit, remaining))
+            remaining -= section['allowed']
+        # share what is left among the sections that were cut, still in priority order
+        for section in by_priority:
+            if remaining <= 0:
+                break
+            extra = min(section['sendable'] - section['allowed'], remaining)
+            section['allowed'] += extra
+            remaining -= extra
+
+        parts = [header]
+        truncated = omitted = 0
+        for section in sections:
+            text = section['text']
+            if section['allowed'] < section['tokens']:
+                if section['allowed'] == 0 and not section['is_body']:
+                    text = OMITTED_MARKER
+                    omitted += 1
+                else:
+                    marker = TRUNCATION_MARKER.format(tokens=section['tokens'] - section['allowed'])
+                    # the marker itself comes out of the section's allowance
+                    allowed = max(0, section['allowed'] - self.counter.count(marker) - 1)
+                    text, _ = self.counter.truncate(text, allowed)
+                    text = f"{text} {marker}" if text else marker
+                    truncated += 1
+            parts.append(section['title'])
+            parts.append(text)
+
+        assembled = "\n".join(parts)
+        stats = {
+            'chunks': 1,
+            'tokenizer': self.counter.name,
+            'budget_tokens': self.budget.max_input_tokens,
+            'input_tokens': sum(section['tokens'] for section in sections),
+            'output_tokens': self.counter.count(assembled),
+            'truncated_sections': truncated,
+            'omitted_sections': omitted,
+            'duplicate_chars_removed': duplicate_chars,
+        }
+        return assembled, stats
+
+    def assemble_chunks(self, email_data: Dict[str, Any], preprocess=lambda text: text) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Like assemble, but with the budget multiplied by max_chunks and the result
+        split into chunks of at most max_input_tokens, each starting with the
+        email metadata so it can be classified on its own.
+
+        Returns:
+            The chunks for the LLM and a dict of token stats
+        """
+        header = self._header(email_data)
+        header_tokens = self.counter.count(header)
+        # every chunk repeats the header and a part line
+        chunk_tokens = self.budget.max_input_tokens - header_tokens - 10
+        # lines are kept whole where possible, so leave some slack in each chunk
+        chunks_budget = replace(self.budget,
+                                max_input_tokens=(chunk_tokens - MIN_SPLIT_TOKENS) * self.budget.max_chunks + header_tokens,
+                                body_max_tokens=self.budget.body_max_tokens * self.budget.max_chunks,
+                                attachment_max_tokens=self.budget.attachment_max_tokens * self.budget.max_chunks)
+        assembled, stats = TokenBudgetAssembler(chunks_budget, self.counter).assemble(email_data, preprocess)
+        content = assembled[len(header):].lstrip("\n")
+
+        pieces = []
+        current = []
+        current_tokens = 0
+        for line in content.split("\n"):
+            while True:
+                line_tokens = self.counter.count(line) + 1
+                room = chunk_tokens - current_tokens
+                if line_tokens <= room:
+                    current.append(line)
+                    current_tokens += line_tokens
+                    break
+                if current and room < MIN_SPLIT_TOKENS:
+                    # start a new chunk rather than fill the few tokens left in this one
+                    pieces.append("\n".join(current))
+                    current, current_tokens = [], 0
+                    continue
+                # fill the rest of this chunk with the start of the line
+                head, _ = self.counter.truncate(line, room - 1)
+                head = head or line[:1]
+                pieces.append("\n".join(current + [head]))
+                current, current_tokens = [], 0
+                line = line[len(head):].lstrip()
+        if current:
+            pieces.append("\n".join(current))
+        if len(pieces) > self.budget.max_chunks:
+            logger.warning(f"Dropping {len(pieces) - self.budget.max_chunks} chunks over LLM_MAP_REDUCE_MAX_CHUNKS")
+            pieces = pieces[:self.budget.max_chunks]
+
+        chunks = [f"{header}\n(part {i+1} of {len(pieces)})\n\n{piece}" for i, piece in enumerate(pieces)]
+        stats.update(chunks=len(chunks), budget_tokens=self.budget.max_input_tokens,
+                     output_tokens=sum(self.counter.count(chunk) for chunk in chunks))
+        return chunks, stats
+
+    @staticmethod
+    def _header(email_data: Dict[str, Any]) -> str:
+        return "\n".join([
+            "=== EMAIL METADATA ===",
+            f"From: {email_data.get('from', 'Unknown')}",
+            f"To: {email_data.get('to', 'Unknown')}",
+            f"Date: {email_data.get('date', 'Unknown')}",
+            f"Subject: {email_data.get('subject', 'Unknown')}",
+        ])
+
+    @staticmethod
+    def _sections(email_data: Dict[str, Any]) -> List[Tuple[str, str, Tuple[int, int]]]:
+        sections = [("\n=== EMAIL BODY ===", email_data.get('email_body', '') or '', (0, 0))]
+        for i, attachment in enumerate(email_data.get('attachments') or []):
+            file_format = attachment.get('format', '')
+            rank = ATTACHMENT_FORMAT_PRIORITY.index(file_format) if file_format in ATTACHMENT_FORMAT_PRIORITY \
+                else len(ATTACHMENT_FORMAT_PRIORITY)
+            sections.append((f"\n=== ATTACHMENT {i+1}: {attachment.get('filename', 'Unnamed')} ===",
+                             attachment.get('extracted_text', '') or '', (1 + rank, i)))
+        return sections
+
+    @staticmethod
+    def _deduplicate(text: str, seen: set) -> Tuple[str, int]:
+        kept = []
+        removed = 0
+        for paragraph in re.split(r'\n\s*\n', text):
+            normalized = " ".join(re.sub(r'^[>\s]+', '', paragraph, flags=re.MULTILINE).lower().split())
+            if len(normalized) >= DEDUP_MIN_CHARS:
+                key = hashlib.sha1(normalized.encode('utf-8')).digest()
+                if key in seen:
+                    removed += len(paragraph)
+                    continue
+                seen.add(key)
+            kept.append(paragraph)
+        return "\n\n".join(kept), removed
+
+
+token_counter = TokenCounter()
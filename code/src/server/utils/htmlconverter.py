@@ -0,0 +1,164 @@
+import os
+import re
+import logging
+from typing import Any, Dict, Tuple
+import lxml.html
+from lxml import etree
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# quoted history beyond this many characters is dropped (EMAIL_QUOTED_TEXT_MAX_CHARS, 0 drops it all)
+QUOTED_TEXT_MAX_CHARS = int(os.getenv("EMAIL_QUOTED_TEXT_MAX_CHARS", "500"))
+
+DROP_TAGS = ('script', 'style', 'head', 'title', 'noscript', 'template', 'svg', 'object', 'iframe', 'meta', 'link')
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'table', 'ul', 'ol', 'dl', 'dt', 'dd', 'blockquote', 'pre', 'hr',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article', 'header', 'footer', 'address'}
+CELL_TAGS = {'td', 'th'}
+HIDDEN_XPATH = ("//*[contains(translate(@style, ' ', ''), 'display:none')]"
+                " | //*[contains(translate(@style, ' ', ''), 'visibility:hidden')]")
+QUOTE_XPATH = ("//blockquote | //*[contains(@class, 'gmail_quote')] | //*[contains(@class, 'moz-cite-prefix')]"
+               " | //*[@id='divRplyFwdMsg'] | //*[@id='appendonsend']")
+SIGNATURE_XPATH = "//*[contains(@class, 'gmail_signature')] | //*[@id='Signature'] | //*[contains(@class, 'signature')]"
+INVISIBLE_CHARS = dict.fromkeys(map(ord, '​‌‍⁠﻿͏­'))
+
+REPLY_HEADER = re.compile(
+    r'^(?:On\s.{0,300}?wrote:|-{2,}\s*Original Message\s*-{2,}|From:\s.*\n(?:Sent|Date):\s)',
+    re.IGNORECASE | re.MULTILINE)
+# separator and header block of a forwarded message; the forwarded email is content, not quoted history
+FORWARD_HEADER = re.compile(
+    r'^(?:-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)[ \t]*\n(?:[ \t]*\n)?(?:[ \t]*[\w-]+:.*(?:\n|$))*',
+    re.IGNORECASE | re.MULTILINE)
+QUOTED_LINES = re.compile(r'(?:^>.*(?:\n|$))+', re.MULTILINE)
+# the standard "-- " delimiter only (a bare "--" is too often a separator in the content itself),
+# or the marker html_to_text puts before signature elements
+SIGNATURE_MARKER = '[Signature]'
+SIGNATURE_DELIMITER = re.compile(r'^(?:-- |\[Signature\])$', re.MULTILINE)
+MOBILE_SIGNATURE = re.compile(r'^Sent from my .{0,40}$', re.IGNORECASE | re.MULTILINE)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Convert an HTML email body to plain text: drops styles, scripts and hidden
+    markup (preheaders, tracking pixels) and keeps block structure as line breaks.
+    Quoted replies (blockquote, gmail/Outlook quote containers) are marked with
+    '>' so clean_email_body can collapse them like plain text quotes.
+    """
+    if not html.strip():
+        return ''
+    try:
+        document = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return html
+
+    for element in list(document.iter(etree.Comment, etree.ProcessingInstruction, *DROP_TAGS)):
+        if element.getparent() is not None:
+            element.drop_tree()
+    for element in document.xpath(HIDDEN_XPATH):
+        element.drop_tree()
+
+    # quotes and signatures are rendered on their own and put back as marked text
+    for element in document.xpath(SIGNATURE_XPATH):
+        _replace_with_text(element, f"{SIGNATURE_MARKER}\n{_render(element)}")
+    for element in document.xpath(QUOTE_XPATH):
+        if element.getparent() is None:
+            continue
+        quoted = _render(element)
+        if FORWARD_HEADER.match(quoted):
+            # gmail wraps forwarded messages in the same container as quotes
+            _replace_with_text(element, quoted)
+            continue
+        _replace_with_text(element, "\n".join('> ' + line for line in quoted.splitlines()))
+
+    return _render(document)
+
+
+def _render(element) -> str:
+    for child in element.iter():
+        if child.tag in BLOCK_TAGS:
+            child.tail = '\n' + (child.tail or '')
+            if child.tag != 'br':
+                child.text = '\n' + (child.text or '')
+        elif child.tag in CELL_TAGS:
+            child.tail = ' ' + (child.tail or '')
+    text = element.text_content().translate(INVISIBLE_CHARS)
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def _replace_with_text(element, text: str):
+    parent = element.getparent()
+    if parent is None:
+        return
+    replacement = lxml.html.Element('div')
+    replacement.text = text
+    replacement.tail = element.tail
+    parent.replace(element, replacement)
+
+
+def clean_email_body(body: str, content_type: str = 'text/plain',
+                     quoted_max_chars: int = QUOTED_TEXT_MAX_CHARS) -> Tuple[str, Dict[str, Any]]:
+    """
+    Reduce an email body to its own content: HTML is converted to text, quoted
+    reply chains are collapsed to at most quoted_max_chars and signatures are removed.
+
+    Args:
+        body: Body text or HTML
+        content_type: 'text/html' or 'text/plain'
+        quoted_max_chars: Characters of quoted history to keep
+
+    Returns:
+        The cleaned text and a dict with the characters removed per step
+    """
+    stats = {'original_chars': len(body), 'html_chars_removed': 0,
+             'quoted_chars_removed': 0, 'signature_chars_removed': 0}
+
+    text = body
+    if content_type == 'text/html':
+        text = html_to_text(body)
+        stats['html_chars_removed'] = len(body) - len(text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    # quoted history: either a reply header ("On ... wrote:", Outlook's "From:/Sent:") or '>' prefixed lines.
+    # The From:/Date: lines of a forwarded message's header block are not a reply header.
+    before = len(text)
+    forwards = [match.span() for match in FORWARD_HEADER.finditer(text)]
+    header = REPLY_HEADER.search(text)
+    while header and any(start <= header.start() < end for start, end in forwards):
+        header = REPLY_HEADER.search(text, header.end())
+    if header and text[:header.start()].strip():
+        text = text[:header.start()] + _collapse_quote(text[header.start():], quoted_max_chars)
+    text = QUOTED_LINES.sub(lambda match: _collapse_quote(match.group(0), quoted_max_chars) + '\n', text)
+    stats['quoted_chars_removed'] = max(0, before - len(text))
+
+    before = len(text)
+    text = MOBILE_SIGNATURE.sub('', text)
+    position = 0
+    while delimiter := SIGNATURE_DELIMITER.search(text, position):
+        if not text[:delimiter.start()].strip():
+            position = delimiter.end()
+            continue
+        # a signature ends where a forwarded message or collapsed quote starts; keep those
+        forward = FORWARD_HEADER.search(text, delimiter.end())
+        quote = text.find('[Quoted text', delimiter.end())
+        end = min([start for start in (forward.start() if forward else -1, quote) if start != -1], default=len(text))
+        text = text[:delimiter.start()] + ('\n' if end < len(text) else '') + text[end:]
+        position = delimiter.start()
+    stats['signature_chars_removed'] = max(0, before - len(text))
+
+    text = re.sub(r'\n{3,}', '\n\n', text).strip()
+    stats['final_chars'] = len(text)
+    stats['chars_removed'] = stats['original_chars'] - len(text)
+    return text, stats
+
+
+def _collapse_quote(quoted: str, max_chars: int) -> str:
+    lines = [line.lstrip('> ').rstrip() for line in quoted.splitlines()]
+    quoted = " ".join(line for line in lines if line)
+    if not quoted or max_chars <= 0:
+        return ''
+    if len(quoted) > max_chars:
+        quoted = quoted[:max_chars].rstrip() + '…'
+    return f"\n[Quoted text] {quoted}\n"
@@ -1,7 +1,122 @@
+import re
 import json
+import threading
+
+# how many cut points (commas) to try, from the end, when repairing truncated JSON
+REPAIR_MAX_ATTEMPTS = 32
+
+FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+CLOSERS = {'{': '}', '[': ']'}
+
+_stats_lock = threading.Lock()
+parse_stats = {'parsed': 0, 'repaired': 0, 'failed': 0}
+
 
 # to convert json string response to python dictionary data type
 def get_response_string(input: str):
-    cleaned_string = input.strip("```json").strip("```").strip()
-    response = json.loads(cleaned_string)
-    return response
\ No newline at end of file
+    """
+    Parse an LLM response as JSON, tolerating code fences, text around the JSON
+    and output cut off mid-value (the incomplete tail is dropped and open
+    strings, arrays and objects are closed).
+
+    Raises:
+        ValueError: If no JSON value can be recovered
+    """
+    try:
+        response, repaired = parse_json(input)
+    except ValueError:
+        _count('failed')
+        raise
+    _count('repaired' if repaired else 'parsed')
+    return _flatten_extracted_fields(response)
+
+
+def parse_json(text: str):
+    """
+    Returns:
+        (value, repaired), repaired being True when the text had to be truncated and closed
+
+    Raises:
+        ValueError: If no JSON value can be recovered
+    """
+    cleaned = FENCE_PATTERN.sub('', (text or '').strip())
+    start = min((i for i in (cleaned.find('{'), cleaned.find('[')) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("no JSON object or array in the response")
+    cleaned = cleaned[start:]
+    try:
+        # ignores anything after the value, e.g. a trailing explanation
+        return json.JSONDecoder().raw_decode(cleaned)[0], False
+    except ValueError:
+        pass
+    for candidate in _repair_candidates(cleaned):
+        try:
+            return json.loads(candidate), True
+        except ValueError:
+            continue
+    raise ValueError("response is not valid JSON and could not be repaired")
+
+
+def _repair_candidates(text: str):
+    """Yield closed-off versions of truncated JSON, the least truncated first."""
+    stack = []
+    in_string = escaped = False
+    cuts = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                # a complete value followed by junk that raw_decode rejected
+                yield text[:i + 1]
+                return
+        elif char == ',':
+            # everything before a comma is made of complete members
+            cuts.append((i, ''.join(reversed(stack))))
+
+    closers = ''.join(reversed(stack))
+    if not in_string:
+        yield text.rstrip() + closers
+    # drop the incomplete member rather than keep a half-written value such as a cut-off request type
+    for position, cut_closers in reversed(cuts[-REPAIR_MAX_ATTEMPTS:]):
+        yield text[:position] + cut_closers
+    if in_string:
+        yield text[:len(text) - 1 if escaped else len(text)] + '"' + closers
+
+
+def _flatten_extracted_fields(response):
+    """Schema-constrained answers list extra fields as [{"name", "value"}]; merge them into the top level."""
+    if isinstance(response, list):
+        return [_flatten_extracted_fields(item) for item in response]
+    if not isinstance(response, dict) or not isinstance(response.get('extracted_fields'), list):
+        return response
+    response = dict(response)
+    for field in response.pop('extracted_fields'):
+        if isinstance(field, dict) and field.get('name') and 'value' in field and field['name'] not in response:
+            response[field['name']] = field.get('value')
+    return response
+
+
+def _count(key):
+    with _stats_lock:
+        parse_stats[key] += 1
+
+
+def get_parse_stats():
+    with _stats_lock:
+        stats = dict(parse_stats)
+    total = sum(stats.values())
+    stats['failure_rate'] = round(stats['failed'] / total, 4) if total else None
+    return stats
@@ -0,0 +1,262 @@
+"""
+Generate a synthetic corpus of loan servicing emails for the benchmarks.
+
+Usage (from code/test):
+    python -m benchmark.corpus <out_dir> [--per-kind 10] [--seed 1] [--html-mb 2]
+
+Kinds, one sub-directory each:
+    plain_eml       text/plain .eml
+    multipart_eml   .eml with PDF, docx, png and xlsx attachments
+    scanned_pdf     PDF made only of page images (needs OCR)
+    huge_html_eml   .eml with a multi-megabyte HTML body, quoted thread and signature
+    email_pdf       an email printed to PDF
+    email_docx      an email saved as a Word document
+"""
+import io
+import os
+import sys
+import json
+import random
+import argparse
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import fitz
+import docx
+import openpyxl
+from PIL import Image, ImageDraw, ImageFont
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'server')
+REQUEST_TYPES_FILE = os.path.join(SERVER_DIR, 'request_types.json')
+
+KINDS = ('plain_eml', 'multipart_eml', 'scanned_pdf', 'huge_html_eml', 'email_pdf', 'email_docx')
+
+BANKS = ['Wells Fargo Bank', 'First National Bank', 'Harbor Trust', 'Summit Capital', 'Northwind Lending']
+BORROWERS = ['ABC Corp', 'Globex Industries', 'Initech LLC', 'Umbrella Holdings', 'Stark Manufacturing']
+FACILITIES = ['Term Loan A', 'Term Loan B', 'Revolving Credit Facility', 'Delayed Draw Term Loan']
+FILLER = ('Please note that all amounts are in USD unless stated otherwise. Kindly confirm receipt of this notice '
+          'and reach out to the agency desk with any questions regarding the transaction or the settlement date.')
+
+
+def load_request_types() -> Dict[str, Any]:
+    with open(REQUEST_TYPES_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class EmailFactory:
+    """Builds random but plausible servicing emails; the same seed gives the same corpus."""
+
+    def __init__(self, seed: int = 1, request_types: Dict[str, Any] = None):
+        self.rng = random.Random(seed)
+        self.request_types = request_types or load_request_types()
+
+    def fields(self) -> Dict[str, Any]:
+        rng = self.rng
+        request_type = rng.choice(list(self.request_types))
+        details = self.request_types[request_type]
+        sub_requests = details.get('sub_requests') or {'': ''}
+        sub_request = rng.choice(list(sub_requests))
+        amount = rng.randrange(10_000, 50_000_000, 1000)
+        date = datetime(2025, 1, 1, 9, tzinfo=timezone.utc) + timedelta(days=rng.randrange(365), minutes=rng.randrange(600))
+        return {
+            'request_type': request_type,
+            'sub_request_type': sub_request,
+            'bank': rng.choice(BANKS),
+            'borrower': rng.choice(BORROWERS),
+            'facility': rng.choice(FACILITIES),
+            'deal': f"DL-{rng.randrange(10000, 99999)}",
+            'amount': f"USD {amount:,.2f}",
+            'date': date,
+            'description': details['description'],
+            'sub_description': sub_requests[sub_request],
+        }
+
+    def subject(self, f: Dict[str, Any]) -> str:
+        return f"{f['request_type'].title()} - {f['sub_request_type'] or 'notice'} - {f['borrower']} {f['deal']}"
+
+    def body(self, f: Dict[str, Any], paragraphs: int = 3) -> str:
+        lines = [
+            "Dear Loan Agency Services,",
+            "",
+            f"{f['bank']} is writing regarding the {f['facility']} of {f['borrower']} (deal {f['deal']}). "
+            f"{f['sub_description']} The amount concerned is {f['amount']}, effective "
+            f"{f['date'].strftime('%d %B %Y')}.",
+        ]
+        for _ in range(paragraphs - 1):
+            lines += ["", f"{f['description']} {FILLER}"]
+        lines += ["", "Regards,", f"Servicing Team, {f['bank']}"]
+        return "\n".join(lines)
+
+    def headers(self, f: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            'From': f"servicing@{f['bank'].split()[0].lower()}.example.com",
+            'To': 'loan.agency@example.com',
+            'Subject': self.subject(f),
+            'Date': format_datetime(f['date']),
+        }
+
+    def message(self, f: Dict[str, Any]) -> EmailMessage:
+        message = EmailMessage()
+        for key, value in self.headers(f).items():
+            message[key] = value
+        return message
+
+    def printed_email(self, f: Dict[str, Any]) -> str:
+        """The email as it reads when printed or saved to a document."""
+        header_lines = [f"{key}: {value}" for key, value in self.headers(f).items()]
+        return "\n".join(header_lines) + "\n\n" + self.body(f)
+
+
+def text_pdf(text: str) -> bytes:
+    pdf = fitz.open()
+    lines = text.splitlines()
+    for start in range(0, max(len(lines), 1), 50):
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n".join(lines[start:start + 50]), fontsize=10)
+    return pdf.tobytes()
+
+
+def text_image(text: str, width: int = 1240, fmt: str = 'PNG') -> bytes:
+    """Text rendered on a white page, as a scanner would produce it."""
+    font = ImageFont.load_default(size=22)
+    wrapped = []
+    for line in text.splitlines() or ['']:
+        while len(line) > 90:
+            cut = line.rfind(' ', 0, 90)
+            cut = cut if cut > 0 else 90
+            wrapped.append(line[:cut])
+            line = line[cut:].lstrip()
+        wrapped.append(line)
+    image = Image.new('L', (width, max(1754, 60 + 32 * len(wrapped))), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(wrapped):
+        draw.text((60, 60 + 32 * i), line, fill=0, font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def scanned_pdf(text: str, pages: int = 2) -> bytes:
+    pdf = fitz.open()
+    page_image = text_image(text, fmt='JPEG')
+    for _ in range(pages):
+        page = pdf.new_page()
+        page.insert_image(page.rect, stream=page_image)
+    return pdf.tobytes()
+
+
+def word_document(text: str) -> bytes:
+    document = docx.Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def spreadsheet(f: Dict[str, Any], rng: random.Random, rows: int = 200) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Schedule'
+    sheet.append(['Deal', 'Borrower', 'Payment date', 'Principal', 'Interest', 'Fee'])
+    for i in range(rows):
+        sheet.append([f['deal'], f['borrower'], (f['date'] + timedelta(days=30 * i)).strftime('%Y-%m-%d'),
+                      rng.randrange(1000, 1_000_000), rng.randrange(100, 50_000), rng.randrange(0, 5000)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def huge_html(factory: EmailFactory, f: Dict[str, Any], target_bytes: int) -> str:
+    rng = factory.rng
+    parts = ['<html><head><style>', 'td { padding: 2px; } ' * 200, '</style>',
+             '<script>var tracking = "' + 'x' * 2000 + '";</script></head><body>',
+             '<div style="display:none">preheader ' + 'hidden ' * 200 + '</div>']
+    parts += [f"<p>{line}</p>" for line in factory.body(f).split("\n\n")]
+    parts.append('<table>')
+    size = sum(len(part) for part in parts)
+    while size < target_bytes:
+        row = (f"<tr><td>{f['deal']}</td><td>{rng.randrange(10**6)}</td><td>{f['borrower']}</td>"
+               f"<td>{rng.choice(FACILITIES)}</td><td>{FILLER[:rng.randrange(20, 120)]}</td></tr>")
+        parts.append(row)
+        size += len(row)
+    parts.append('</table>')
+    parts.append('<div class="gmail_signature">--<br>Servicing Team<br>' + f['bank'] + '<br>+1 555 0100</div>')
+    parts.append('<blockquote>On a previous date the agent wrote:<br>' + factory.body(factory.fields()) * 5 + '</blockquote>')
+    parts.append('</body></html>')
+    return "".join(parts)
+
+
+def make_document(kind: str, factory: EmailFactory, html_bytes: int) -> (str, bytes):
+    """Returns (extension, file bytes) for one document of the given kind."""
+    f = factory.fields()
+    if kind == 'plain_eml':
+        message = factory.message(f)
+        message.set_content(factory.body(f))
+        return 'eml', bytes(message)
+    if kind == 'multipart_eml':
+        message = factory.message(f)
+        message.set_content(factory.body(f, paragraphs=2))
+        message.add_attachment(text_pdf(factory.body(f, paragraphs=6)), maintype='application', subtype='pdf',
+                               filename='notice.pdf')
+        message.add_attachment(word_document(factory.body(f, paragraphs=4)), maintype='application',
+                               subtype='vnd.openxmlformats-officedocument.wordprocessingml.document',
+                               filename='instructions.docx')
+        message.add_attachment(text_image(factory.body(f, paragraphs=1)), maintype='image', subtype='png',
+                               filename='scan.png')
+        message.add_attachment(spreadsheet(f, factory.rng), maintype='application',
+                               subtype='vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                               filename='schedule.xlsx')
+        return 'eml', bytes(message)
+    if kind == 'scanned_pdf':
+        return 'pdf', scanned_pdf(factory.printed_email(f))
+    if kind == 'huge_html_eml':
+        message = factory.message(f)
+        message.set_content(huge_html(factory, f, html_bytes), subtype='html')
+        return 'eml', bytes(message)
+    if kind == 'email_pdf':
+        return 'pdf', text_pdf(factory.printed_email(f))
+    if kind == 'email_docx':
+        return 'docx', word_document(factory.printed_email(f))
+    raise ValueError(f"unknown corpus kind {kind!r}")
+
+
+def generate_corpus(out_dir: str, per_kind: int = 10, seed: int = 1, kinds: List[str] = None,
+                    html_mb: float = 2.0) -> Dict[str, int]:
+    """
+    Write per_kind documents of each kind under out_dir/<kind>/.
+
+    Returns:
+        Number of files written per kind
+    """
+    factory = EmailFactory(seed)
+    counts = {}
+    for kind in kinds or KINDS:
+        os.makedirs(os.path.join(out_dir, kind), exist_ok=True)
+        for i in range(per_kind):
+            extension, data = make_document(kind, factory, int(html_mb * 2**20))
+            with open(os.path.join(out_dir, kind, f"{kind}_{i:04d}.{extension}"), 'wb') as f:
+                f.write(data)
+        counts[kind] = per_kind
+    return counts
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic email corpus for the benchmarks")
+    parser.add_argument('out_dir')
+    parser.add_argument('--per-kind', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--kinds', help=f"comma separated subset of {','.join(KINDS)}")
+    parser.add_argument('--html-mb', type=float, default=2.0, help="size of the huge HTML bodies")
+    args = parser.parse_args(argv)
+
+    counts = generate_corpus(args.out_dir, args.per_kind, args.seed,
+                             args.kinds.split(',') if args.kinds else None, args.html_mb)
+    for kind, count in counts.items():
+        print(f"{kind:<16}{count:>6} files")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
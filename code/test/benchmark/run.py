@@ -0,0 +1,394 @@
+"""
+End-to-end benchmarks of the classification pipeline on a synthetic corpus:
+per-stage latency and throughput at several concurrency levels, saved as JSON
+so results can be compared between commits.
+
+Usage (from code/test):
+    python -m benchmark.run [--corpus <dir>] [--per-kind 5] [--concurrency 1,4,16] [--json results.json]
+    python -m benchmark.run --json new.json --compare old.json [--max-regression 20]
+
+Stages:
+    process_input       EmailProcessor.process_input on each file
+    prepare_for_llm     DocumentProcessor.prepare_for_llm on the extracted emails
+    system_instruction  LLMService.get_system_instruction, compiled (cold) and cached (warm)
+    classify            POST /classify through the FastAPI app, against the synthetic LLM backend
+
+The LLM is never called: LLM_BACKEND defaults to "synthetic" with --llm-latency-ms
+of simulated latency. Classification and OCR caches are disabled unless --with-caches,
+so repeated runs measure the same work.
+"""
+import io
+import os
+import re
+import sys
+import copy
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmark.corpus import KINDS, generate_corpus, load_request_types
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'server'))
+STAGES = ('process_input', 'prepare_for_llm', 'system_instruction', 'classify')
+# extraction failures (a broken PDF, OCR that could not run) are reported as text in place of the content
+EXTRACTION_ERROR = re.compile(r'^(?:Error extracting|Error processing|Error: ).*$', re.MULTILINE)
+
+
+def configure_environment(llm_latency_ms: float, with_caches: bool):
+    """Settings for the server modules; must run before they are imported. Explicit environment variables win."""
+    os.environ.setdefault('LLM_BACKEND', 'synthetic')
+    os.environ.setdefault('LLM_SIM_LATENCY', 'lognormal')
+    os.environ.setdefault('LLM_SIM_LATENCY_MS', str(llm_latency_ms))
+    # the local classifier would learn from the synthetic answers and skip the LLM for later files
+    os.environ.setdefault('LOCAL_CLASSIFIER_ENABLED', 'false')
+    if not with_caches:
+        os.environ.setdefault('CLASSIFICATION_CACHE_TTL', '0.000001')
+        os.environ.setdefault('OCR_CACHE_TTL', '0.000001')
+        os.environ.setdefault('CLASSIFICATION_CACHE_DB', '')
+        os.environ.setdefault('OCR_CACHE_DB', '')
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+
+
+def load_corpus(corpus_dir: str) -> List[Dict[str, Any]]:
+    corpus = []
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                corpus.append({'name': name, 'kind': os.path.basename(root), 'data': f.read()})
+    return corpus
+
+
+def corpus_is_empty(corpus_dir: str) -> bool:
+    return not any(files for _, _, files in os.walk(corpus_dir))
+
+
+def extraction_error(email_data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The first error the extraction reported in its output, or None if every part was extracted."""
+    if email_data is None:
+        return "no email could be extracted"
+    if email_data.get('error'):
+        return email_data['error']
+    texts = [email_data.get('email_body') or ''] + [attachment.get('extracted_text') or ''
+                                                    for attachment in email_data.get('attachments') or []]
+    for text in texts:
+        match = EXTRACTION_ERROR.search(text)
+        if match:
+            return match.group(0)[:200]
+    return None
+
+
+def summarize(latencies: List[float], wall_seconds: float, errors: int = 0) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds and throughput for one run."""
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3) if ordered else None
+
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_per_second': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3) if ordered else None,
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+
+
+def run_threaded(items: List[Any], work: Callable[[Any], Any], concurrency: int, kind_of: Callable[[Any], str],
+                 error_of: Callable[[Any], Optional[str]] = lambda result: None):
+    """
+    Run work on every item with concurrency threads; returns the summary and the results.
+    An item counts as an error when work raises or error_of finds an error in its result.
+    """
+    latencies, results, by_kind = [], [], {}
+    errors = 0
+
+    def timed(item):
+        start_time = time.perf_counter()
+        result = work(item)
+        return time.perf_counter() - start_time, result
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        futures = [(item, pool.submit(timed, item)) for item in items]
+        for item, future in futures:
+            try:
+                seconds, result = future.result()
+            except Exception as e:
+                print(f"  {kind_of(item)}: {type(e).__name__}: {e}")
+                errors += 1
+                results.append(None)
+                continue
+            results.append(result)
+            error = error_of(result)
+            if error:
+                print(f"  {kind_of(item)}: {error}")
+                errors += 1
+                continue
+            latencies.append(seconds)
+            by_kind.setdefault(kind_of(item), []).append(seconds)
+    summary = summarize(latencies, time.perf_counter() - start_time, errors)
+    summary['by_kind_p50_ms'] = {kind: round(statistics.median(values) * 1000, 3) for kind, values in sorted(by_kind.items())}
+    return summary, results
+
+
+def bench_process_input(corpus, levels):
+    from services.document_processing_service import EmailProcessor
+
+    rows, extracted = [], None
+    for concurrency in levels:
+        summary, results = run_threaded(
+            corpus, lambda item: EmailProcessor().process_input(item['data'], item['name']),
+            concurrency, lambda item: item['kind'], extraction_error)
+        rows.append({'concurrency': concurrency, **summary})
+        extracted = extracted or results
+    return rows, extracted
+
+
+def bench_prepare_for_llm(corpus, extracted, levels):
+    from services.document_processing_service import DocumentProcessor
+
+    items = [(item['kind'], email_data) for item, email_data in zip(corpus, extracted) if email_data is not None]
+    rows = []
+    for concurrency in levels:
+        # prepare_for_llm may annotate the email data, so every run gets a fresh copy
+        copies = [(kind, copy.deepcopy(email_data)) for kind, email_data in items]
+        summary, _ = run_threaded(copies, lambda item: DocumentProcessor().prepare_for_llm(item[1]),
+                                  concurrency, lambda item: item[0])
+        rows.append({'concurrency': concurrency, **summary})
+    return rows
+
+
+def bench_system_instruction(repeat: int = 50):
+    import llm.DataStore as DataStore
+    from llm.LLMService import model
+
+    cold, warm = [], []
+    # every compile prints a line
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            DataStore.bump_version()
+            start_time = time.perf_counter()
+            model.get_system_instruction()
+            cold.append(time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            model.get_system_instruction()
+            warm.append(time.perf_counter() - start_time)
+    return {
+        'request_types': len(DataStore.REQUEST_TYPES),
+        'instruction_chars': len(model.get_system_instruction()),
+        'cold_p50_ms': round(statistics.median(cold) * 1000, 4),
+        'warm_p50_us': round(statistics.median(warm) * 1e6, 3),
+    }
+
+
+async def _classify_level(client, corpus, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, by_kind = [], {}
+    errors = 0
+
+    async def classify(item):
+        nonlocal errors
+        async with semaphore:
+            start_time = time.perf_counter()
+            response = await client.post('/classify', files={'file': (item['name'], item['data'])})
+            seconds = time.perf_counter() - start_time
+        if response.status_code != 200:
+            errors += 1
+            print(f"  {item['name']}: HTTP {response.status_code}")
+            return
+        error = EXTRACTION_ERROR.search(response.json().get('content') or '')
+        if error:
+            errors += 1
+            print(f"  {item['name']}: {error.group(0)[:200]}")
+            return
+        latencies.append(seconds)
+        by_kind.setdefault(item['kind'], []).append(seconds)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(classify(item) for item in corpus))
+    summary = summarize(latencies, time.perf_counter() - start_time, errors)
+    summary['by_kind_p50_ms'] = {kind: round(statistics.median(values) * 1000, 3) for kind, values in sorted(by_kind.items())}
+    return summary
+
+
+async def bench_classify(corpus, levels):
+    import httpx
+    from main import app
+    from services.classification_service import get_cache_stats
+
+    rows = []
+    # runs the app's startup and shutdown handlers, as uvicorn would
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            for concurrency in levels:
+                rows.append({'concurrency': concurrency, **await _classify_level(client, corpus, concurrency)})
+        llm_stats = get_cache_stats()
+    return rows, {key: llm_stats.get(key) for key in ('llm', 'backend', 'responses', 'prompt')}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(corpus: List[Dict[str, Any]], levels: List[int], stages: List[str]) -> Dict[str, Any]:
+    import llm.DataStore as DataStore
+
+    # the stages before classify don't import main, which is what normally loads the request types
+    DataStore.REQUEST_TYPES = load_request_types()
+    DataStore.bump_version()
+    results: Dict[str, Any] = {}
+    extracted = None
+    if 'process_input' in stages or 'prepare_for_llm' in stages:
+        print("process_input ...")
+        rows, extracted = bench_process_input(corpus, levels)
+        if 'process_input' in stages:
+            results['process_input'] = rows
+    if 'prepare_for_llm' in stages:
+        print("prepare_for_llm ...")
+        results['prepare_for_llm'] = bench_prepare_for_llm(corpus, extracted, levels)
+    if 'system_instruction' in stages:
+        print("system_instruction ...")
+        results['system_instruction'] = bench_system_instruction()
+    if 'classify' in stages:
+        print("classify ...")
+        results['classify'], results['classify_llm_stats'] = asyncio.run(bench_classify(corpus, levels))
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> float:
+    """Print p50 latency and throughput changes against a baseline; returns the worst regression in percent."""
+    worst = 0.0
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    if baseline.get('corpus') != current.get('corpus'):
+        print("note: the baseline was run on a different corpus")
+    print(f"{'stage':<20}{'conc':>6}{'p50 ms':>12}{'change':>10}{'per s':>10}{'change':>10}")
+    for stage in STAGES:
+        old_rows = {row['concurrency']: row for row in baseline['stages'].get(stage) or [] if isinstance(row, dict)}
+        for row in current['stages'].get(stage) or []:
+            if not isinstance(row, dict) or row['concurrency'] not in old_rows:
+                continue
+            old = old_rows[row['concurrency']]
+            latency_change = _change(row['p50_ms'], old['p50_ms'])
+            throughput_change = _change(row['throughput_per_second'], old['throughput_per_second'])
+            worst = max(worst, latency_change or 0, -(throughput_change or 0))
+            print(f"{stage:<20}{row['concurrency']:>6}{str(row['p50_ms']):>12}{_percent(latency_change):>10}"
+                  f"{str(row['throughput_per_second']):>10}{_percent(throughput_change):>10}")
+    return worst
+
+
+def _change(new, old):
+    return (new - old) / old * 100 if new is not None and old else None
+
+
+def _percent(change):
+    return f"{change:+.1f}%" if change is not None else '-'
+
+
+def print_results(results: Dict[str, Any]):
+    stages = results['stages']
+    print(f"\n{'stage':<20}{'conc':>6}{'requests':>10}{'errors':>8}{'p50 ms':>12}{'p90 ms':>12}{'p99 ms':>12}{'per s':>10}")
+    for stage in ('process_input', 'prepare_for_llm', 'classify'):
+        for row in stages.get(stage) or []:
+            print(f"{stage:<20}{row['concurrency']:>6}{row['requests']:>10}{row['errors']:>8}{str(row['p50_ms']):>12}"
+                  f"{str(row['p90_ms']):>12}{str(row['p99_ms']):>12}{str(row['throughput_per_second']):>10}")
+    if 'system_instruction' in stages:
+        info = stages['system_instruction']
+        print(f"system_instruction: {info['request_types']} request types, {info['instruction_chars']} chars, "
+              f"cold {info['cold_p50_ms']} ms, warm {info['warm_p50_us']} us")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the classification pipeline on a synthetic corpus")
+    parser.add_argument('--corpus', help="corpus directory from benchmark.corpus, generated into it when missing or empty; "
+                                         "generated in a temp dir if omitted")
+    parser.add_argument('--per-kind', type=int, default=5, help="files per kind when generating the corpus")
+    parser.add_argument('--kinds', help=f"comma separated subset of {','.join(KINDS)}")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--concurrency', default='1,4,16', help="comma separated concurrency levels")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma separated subset of the stages")
+    parser.add_argument('--llm-latency-ms', type=float, default=200, help="median latency of the synthetic LLM")
+    parser.add_argument('--with-caches', action='store_true', help="keep the classification and OCR caches on")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results JSON of an earlier run to compare with")
+    parser.add_argument('--max-regression', type=float,
+                        help="with --compare, exit with status 1 if any p50 or throughput is this many percent worse")
+    args = parser.parse_args(argv)
+
+    configure_environment(args.llm_latency_ms, args.with_caches)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    stages = args.stages.split(',')
+    kinds = args.kinds.split(',') if args.kinds else None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = args.corpus or temp_dir
+        if corpus_is_empty(corpus_dir):
+            if args.corpus:
+                print(f"{corpus_dir} is missing or empty, generating a corpus of {args.per_kind} files per kind in it")
+            generate_corpus(corpus_dir, args.per_kind, args.seed, kinds)
+        corpus = [item for item in load_corpus(corpus_dir) if not kinds or item['kind'] in kinds]
+        if not corpus:
+            parser.error(f"no files of kinds {', '.join(kinds or KINDS)} in {corpus_dir}")
+
+        # the server resolves uploads and other working files relative to its own directory
+        os.chdir(SERVER_DIR)
+        started = time.perf_counter()
+        stage_results = run_benchmarks(corpus, levels, stages)
+
+    corpus_summary = {}
+    for item in corpus:
+        entry = corpus_summary.setdefault(item['kind'], {'files': 0, 'bytes': 0})
+        entry['files'] += 1
+        entry['bytes'] += len(item['data'])
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'concurrency': levels,
+            'llm_backend': os.environ['LLM_BACKEND'],
+            'llm_latency_ms': float(os.environ['LLM_SIM_LATENCY_MS']),
+            'caches': args.with_caches,
+            'seed': args.seed,
+            'total_seconds': round(time.perf_counter() - started, 2),
+        },
+        'corpus': corpus_summary,
+        'stages': stage_results,
+    }
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            worst = compare(results, json.load(f))
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"regression of {worst:.1f}% is over the allowed {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# the server modules are imported the way the server imports them (services.*, utils.*, llm.*)
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'server')
+sys.path.insert(0, os.path.abspath(SERVER_DIR))
+
+# importing services.blob_service creates the default store; keep it out of the working directory
+os.environ.setdefault('BLOB_STORE_DIR', os.path.join(tempfile.gettempdir(), 'gaied-test-uploads'))
@@ -0,0 +1,70 @@
+import time
+
+from services.document_processing_service import EmailProcessor
+
+
+def attachment(filename, file_format, data=b'data'):
+    return {'filename': filename, 'content_type': 'application/octet-stream', 'format': file_format, 'data': data}
+
+
+def processor(**options):
+    processor = EmailProcessor(ocr_enabled=False, **options)
+    processor.image_batches = []
+
+    def process_image_files(sources):
+        processor.image_batches.append(sources)
+        return [f"image {len(source)}" for source in sources]
+
+    processor.process_image_files = process_image_files
+    return processor
+
+
+def test_results_keep_attachment_order_and_images_share_one_batch():
+    email_processor = processor()
+
+    def handler(data, name):
+        # the first attachment finishes last
+        time.sleep(0.05 if name == 'a.txt' else 0)
+        return data.decode()
+
+    email_processor.allowed_attachment_types['txt'] = handler
+
+    results = email_processor.process_attachments([
+        attachment('a.txt', 'txt', b'first'), attachment('scan.png', 'png', b'png'),
+        attachment('b.txt', 'txt', b'second'), attachment('photo.jpg', 'jpg', b'jpeg')])
+
+    assert [(result['filename'], result['extracted_text']) for result in results] == [
+        ('a.txt', 'first'), ('scan.png', 'image 3'), ('b.txt', 'second'), ('photo.jpg', 'image 4')]
+    assert email_processor.image_batches == [[b'png', b'jpeg']]
+
+
+def test_slow_attachment_times_out_without_holding_up_the_others():
+    email_processor = processor(attachment_timeout=0.2)
+
+    def handler(data, name):
+        time.sleep(2 if name == 'slow.txt' else 0)
+        return name
+
+    email_processor.allowed_attachment_types['txt'] = handler
+
+    start = time.monotonic()
+    results = email_processor.process_attachments([attachment('slow.txt', 'txt'), attachment('fast.txt', 'txt')])
+
+    assert time.monotonic() - start < 1
+    assert results[0]['extracted_text'] == "Error extracting text from attachment: timed out after 0.2s"
+    assert results[1]['extracted_text'] == 'fast.txt'
+
+
+def test_attachment_whose_handler_raises_is_left_out():
+    email_processor = processor()
+
+    def handler(data, name):
+        if name == 'broken.txt':
+            raise ValueError("unreadable")
+        return name
+
+    email_processor.allowed_attachment_types['txt'] = handler
+
+    results = email_processor.process_attachments([attachment('broken.txt', 'txt'), attachment('ok.txt', 'txt')])
+
+    assert [result['filename'] for result in results] == ['ok.txt']
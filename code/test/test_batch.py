@@ -0,0 +1,81 @@
+import io
+import json
+import asyncio
+import tarfile
+import zipfile
+
+import pytest
+
+from services import classification_service
+from services.classification_service import classify_batch, expand_uploads
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_bytes(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_archives_are_expanded_into_classifiable_members():
+    uploads = [('emails.zip', zip_bytes({'a.eml': b'email a', 'notes.txt': b'skipped', 'dir/b.pdf': b'pdf b'})),
+               ('more.tgz', tar_bytes({'c.docx': b'docx c', 'image.png': b'skipped'})),
+               ('d.eml', b'email d')]
+
+    assert expand_uploads(uploads) == [('a.eml', b'email a'), ('dir/b.pdf', b'pdf b'), ('c.docx', b'docx c'),
+                                       ('d.eml', b'email d')]
+
+
+def test_too_many_files_are_rejected(monkeypatch):
+    monkeypatch.setattr(classification_service, 'BATCH_MAX_FILES', 2)
+
+    with pytest.raises(ValueError, match="limit of 2 files"):
+        expand_uploads([('emails.zip', zip_bytes({f'{i}.eml': b'email' for i in range(3)}))])
+
+
+def test_archive_bomb_is_rejected_from_its_declared_size(monkeypatch):
+    monkeypatch.setattr(classification_service, 'BATCH_MAX_BYTES', 1024)
+    bomb = zip_bytes({'bomb.eml': b'\0' * (1024 * 1024)})
+    assert len(bomb) < 2048
+
+    with pytest.raises(ValueError, match="limit of 1024 bytes"):
+        expand_uploads([('bomb.zip', bomb)])
+
+
+def test_batch_reports_every_file_and_bounds_llm_concurrency(monkeypatch):
+    monkeypatch.setattr(classification_service, 'BATCH_LLM_CONCURRENCY', 2)
+    active, peak = 0, 0
+
+    async def fake_classify_upload(filename, data, extraction_limit=None, llm_limit=None, progress=None):
+        nonlocal active, peak
+        async with llm_limit:
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+        if filename == 'bad.eml':
+            raise RuntimeError("extraction failed")
+        return {'filename': filename, 'response': {'request_type': 'Fee Payment'}}
+
+    monkeypatch.setattr(classification_service, 'classify_upload', fake_classify_upload)
+    items = [(f'{i}.eml', b'email') for i in range(5)] + [('bad.eml', b'email')]
+
+    async def collect():
+        return [json.loads(line) async for line in classify_batch(items)]
+
+    lines = asyncio.run(collect())
+
+    assert sorted(line['index'] for line in lines) == list(range(6))
+    assert next(line for line in lines if line['filename'] == 'bad.eml')['error'] == "extraction failed"
+    assert peak == 2
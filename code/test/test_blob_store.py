@@ -0,0 +1,74 @@
+import io
+import os
+import time
+
+from services.blob_service import BlobStore
+
+
+def blob_files(store):
+    return os.listdir(store.blob_dir)
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = BlobStore(root=str(tmp_path))
+
+    first = store.acquire(b'repayment notice')
+    second = store.acquire(io.BytesIO(b'repayment notice'))
+
+    assert first != second
+    assert len(blob_files(store)) == 1
+    with open(second, 'rb') as f:
+        assert f.read() == b'repayment notice'
+
+
+def test_blob_is_deleted_with_its_last_reference(tmp_path):
+    store = BlobStore(root=str(tmp_path))
+    first = store.acquire(b'fee payment')
+    second = store.acquire(b'fee payment')
+
+    store.release(first)
+    assert len(blob_files(store)) == 1
+    assert os.path.exists(second)
+
+    store.release(second)
+    assert blob_files(store) == []
+    # releasing twice is harmless
+    store.release(second)
+
+
+def test_hold_releases_on_error(tmp_path):
+    store = BlobStore(root=str(tmp_path))
+
+    try:
+        with store.hold(b'adjustment') as ref_path:
+            assert os.path.exists(ref_path)
+            raise RuntimeError("processing failed")
+    except RuntimeError:
+        pass
+
+    assert blob_files(store) == []
+    assert os.listdir(store.ref_dir) == []
+
+
+def test_reacquiring_after_release_writes_the_blob_again(tmp_path):
+    store = BlobStore(root=str(tmp_path))
+    store.release(store.acquire(b'closing notice'))
+
+    with store.hold(b'closing notice') as ref_path:
+        with open(ref_path, 'rb') as f:
+            assert f.read() == b'closing notice'
+
+
+def test_gc_removes_leaked_references_and_their_blobs(tmp_path):
+    store = BlobStore(root=str(tmp_path), max_ref_age=0.05)
+    store.acquire(b'leaked by a crashed request')
+    with open(os.path.join(store.tmp_dir, 'partial'), 'wb') as f:
+        f.write(b'half written')
+    time.sleep(0.1)
+    live = store.acquire(b'still in use')
+
+    # the leaked ref, its blob and the temporary file
+    assert store.gc() == 3
+    assert os.listdir(store.ref_dir) == [os.path.basename(live)]
+    assert len(blob_files(store)) == 1
+    assert os.listdir(store.tmp_dir) == []
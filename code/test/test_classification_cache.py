@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+from services import classification_service
+from services.cache_service import TieredCache, hash_bytes, request_types_fingerprint
+
+EMAIL = b"Subject: Fee payment\n\nPlease pay the agency fee for deal DL-12345."
+
+
+class RecordingCache(TieredCache):
+    """Remembers the threads its lookups and writes ran on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return super().get(key)
+
+    def set(self, key, value):
+        self.threads.append(threading.current_thread())
+        super().set(key, value)
+
+
+def test_sqlite_cache_is_read_off_the_event_loop(tmp_path, monkeypatch):
+    file_cache = RecordingCache("classification_file", db_path=str(tmp_path / "cache.db"))
+    monkeypatch.setattr(classification_service, 'file_cache', file_cache)
+    key = f"{hash_bytes(EMAIL)}:{request_types_fingerprint()}:{classification_service.model.backend_mode}"
+    file_cache.set(key, {"content": "Please pay the agency fee", "response": {"request_type": "Fee Payment"}})
+    file_cache.threads.clear()
+
+    result = asyncio.run(classification_service.classify_upload("fee.eml", EMAIL))
+
+    assert result['response'] == {"request_type": "Fee Payment"}
+    assert file_cache.threads and threading.main_thread() not in file_cache.threads
+
+
+def test_memory_only_cache_is_read_inline(monkeypatch):
+    file_cache = RecordingCache("classification_file")
+    monkeypatch.setattr(classification_service, 'file_cache', file_cache)
+    key = f"{hash_bytes(EMAIL)}:{request_types_fingerprint()}:{classification_service.model.backend_mode}"
+    file_cache.set(key, {"content": "Please pay the agency fee", "response": {"request_type": "Fee Payment"}})
+    file_cache.threads.clear()
+
+    asyncio.run(classification_service.classify_upload("fee.eml", EMAIL))
+
+    assert file_cache.threads == [threading.main_thread()]
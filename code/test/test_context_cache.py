@@ -0,0 +1,50 @@
+import asyncio
+
+from llm import DataStore
+from llm.ContextCache import LocalContextCache
+from llm.LLMService import LLMService
+
+
+def test_concurrent_callers_register_once():
+    cache = LocalContextCache()
+
+    async def register_all():
+        return await asyncio.gather(*(cache.get_or_register(1, "Request Type: Fee Payment") for _ in range(10)))
+
+    names = asyncio.run(register_all())
+
+    assert len(set(names)) == 1
+    assert cache.register_count == 1
+
+
+def test_new_key_replaces_the_old_entry():
+    cache = LocalContextCache()
+    first = asyncio.run(cache.get_or_register(1, "Request Type: Fee Payment"))
+    second = asyncio.run(cache.get_or_register(2, "Request Type: Adjustment"))
+
+    assert first != second
+    assert cache.contents == {second: "Request Type: Adjustment"}
+
+
+def test_local_cache_is_refused_with_the_live_backend(monkeypatch):
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE", "local")
+    monkeypatch.setenv("LLM_BACKEND", "live")
+    assert LLMService().context_cache is None
+
+    monkeypatch.setenv("LLM_BACKEND", "synthetic")
+    assert isinstance(LLMService().context_cache, LocalContextCache)
+
+
+def test_full_prompt_config_references_the_cached_context(monkeypatch):
+    monkeypatch.setenv("GEMINI_CONTEXT_CACHE", "local")
+    monkeypatch.setenv("LLM_BACKEND", "synthetic")
+    monkeypatch.setattr(DataStore, 'REQUEST_TYPES', {'Fee Payment': {'description': "Fees due to lenders"}})
+    service = LLMService()
+
+    config = asyncio.run(service._get_generation_config_async())
+
+    assert config.system_instruction is None
+    assert service.context_cache.contents[config.cached_content] == service.get_system_instruction()
+    # a pruned prompt lists its own request types inline
+    pruned = asyncio.run(service._get_generation_config_async(['Fee Payment']))
+    assert pruned.cached_content is None and "Fee Payment" in pruned.system_instruction
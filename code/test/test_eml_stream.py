@@ -0,0 +1,104 @@
+import io
+import base64
+from email.message import EmailMessage
+
+from services.eml_stream_service import EmlStreamLimits, parse_eml_stream
+
+PDF_BYTES = b'%PDF-1.4 repayment notice ' + bytes(range(256)) * 4
+
+
+def message(*attachments):
+    msg = EmailMessage()
+    msg['Subject'] = 'Repayment notice'
+    msg['From'] = 'servicing@harbor.example.com'
+    msg['To'] = 'loan.agency@example.com'
+    msg['Date'] = 'Mon, 3 Mar 2025 10:00:00 +0000'
+    msg.set_content("Please find the repayment notice attached.")
+    msg.add_alternative("<p>Please find the <b>HTML</b> notice attached.</p>", subtype='html')
+    for filename, data in attachments:
+        msg.add_attachment(data, maintype='application', subtype='pdf', filename=filename)
+    return io.BytesIO(msg.as_bytes())
+
+
+def limits(**overrides):
+    return EmlStreamLimits(**{'max_message_bytes': 1024 * 1024, 'max_attachment_bytes': 64 * 1024,
+                              'max_body_bytes': 64 * 1024, 'spool_max_memory': 1024, **overrides})
+
+
+def test_headers_plain_body_and_decoded_attachment():
+    email = parse_eml_stream(message(('notice.pdf', PDF_BYTES)), limits())
+
+    assert email.headers['subject'] == 'Repayment notice'
+    assert email.headers['from'] == 'servicing@harbor.example.com'
+    assert email.body_content_type == 'text/plain'
+    assert email.body_text.strip() == "Please find the repayment notice attached."
+    [attachment] = email.attachments
+    assert (attachment.filename, attachment.content_type, attachment.size) == ('notice.pdf', 'application/pdf', len(PDF_BYTES))
+    # larger than spool_max_memory, so it was read back from disk
+    assert attachment.read() == PDF_BYTES
+    assert not email.skipped
+    email.close()
+
+
+def test_html_body_is_used_without_a_plain_part():
+    msg = EmailMessage()
+    msg['Subject'] = 'Fee'
+    msg.set_content("<p>Fee payment due</p>", subtype='html')
+
+    email = parse_eml_stream(io.BytesIO(msg.as_bytes()), limits())
+
+    assert email.body_content_type == 'text/html'
+    assert "Fee payment due" in email.body_text
+
+
+def test_oversized_attachment_is_skipped_and_parsing_continues():
+    email = parse_eml_stream(message(('big.pdf', PDF_BYTES), ('small.pdf', b'%PDF small')),
+                             limits(max_attachment_bytes=100))
+
+    assert [part.filename for part in email.attachments] == ['small.pdf']
+    assert email.attachments[0].read() == b'%PDF small'
+    assert email.skipped == [{'filename': 'big.pdf', 'content_type': 'application/pdf',
+                              'reason': "attachment exceeds 100 bytes"}]
+    email.close()
+
+
+def test_rejected_attachment_is_not_decoded():
+    seen = []
+
+    def accept(filename, content_type):
+        seen.append((filename, content_type))
+        return filename != 'notice.pdf'
+
+    email = parse_eml_stream(message(('notice.pdf', PDF_BYTES), ('other.pdf', b'%PDF other')), limits(), accept)
+
+    assert seen == [('notice.pdf', 'application/pdf'), ('other.pdf', 'application/pdf')]
+    assert [part.filename for part in email.attachments] == ['other.pdf']
+    email.close()
+
+
+def test_message_size_limit_stops_reading():
+    source = message(('notice.pdf', PDF_BYTES * 8))
+    size = len(source.getvalue())
+
+    email = parse_eml_stream(source, limits(max_message_bytes=size // 2, max_attachment_bytes=size))
+
+    assert email.bytes_read <= size // 2 + 1024
+    assert not email.attachments
+    assert any("message size limit" in skipped['reason'] for skipped in email.skipped)
+    assert email.body_text.strip() == "Please find the repayment notice attached."
+
+
+def test_base64_lines_split_anywhere_decode_correctly():
+    encoded = base64.b64encode(PDF_BYTES).decode()
+    # odd line lengths, so groups of four characters straddle line breaks
+    lines = '\r\n'.join(encoded[i:i + 57] for i in range(0, len(encoded), 57))
+    raw = ('Subject: Lines\r\nMIME-Version: 1.0\r\nContent-Type: multipart/mixed; boundary="b"\r\n\r\n'
+           '--b\r\nContent-Type: text/plain\r\n\r\nBody\r\n'
+           '--b\r\nContent-Type: application/pdf\r\nContent-Transfer-Encoding: base64\r\n'
+           'Content-Disposition: attachment; filename="notice.pdf"\r\n\r\n' + lines + '\r\n--b--\r\n')
+
+    email = parse_eml_stream(io.BytesIO(raw.encode()), limits())
+
+    assert email.body_text == 'Body'
+    assert email.attachments[0].read() == PDF_BYTES
+    email.close()
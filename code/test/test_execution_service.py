@@ -0,0 +1,46 @@
+import os
+import time
+import asyncio
+import threading
+
+from services.execution_service import ExecutionService
+
+
+def blocking_io(seconds):
+    time.sleep(seconds)
+    return threading.current_thread().name
+
+
+def test_blocking_io_does_not_stall_the_event_loop():
+    service = ExecutionService(io_workers=2, cpu_workers=1)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        task = asyncio.create_task(ticker())
+        thread_name = await service.run_io_bound(blocking_io, 0.2)
+        task.cancel()
+        return thread_name
+
+    try:
+        thread_name = asyncio.run(main())
+    finally:
+        service.shutdown()
+
+    assert thread_name.startswith("io-worker")
+    # the loop kept running while the call blocked its thread
+    assert len(ticks) >= 5
+
+
+def test_cpu_bound_work_runs_in_another_process():
+    service = ExecutionService(io_workers=1, cpu_workers=1)
+    try:
+        pid = asyncio.run(service.run_cpu_bound(os.getpid))
+    finally:
+        service.shutdown()
+
+    assert pid != os.getpid()
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from llm.Governor import CircuitOpenError, Governor
+
+
+def server_error():
+    return genai_errors.ServerError(503, {'error': {'code': 503, 'status': 'UNAVAILABLE', 'message': 'down'}})
+
+
+def bad_request():
+    return genai_errors.ClientError(400, {'error': {'code': 400, 'status': 'INVALID_ARGUMENT', 'message': 'bad'}})
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setenv('LLM_RETRY_MAX_ATTEMPTS', '3')
+    monkeypatch.setenv('LLM_RETRY_BASE_DELAY', '0.001')
+    monkeypatch.setenv('LLM_BREAKER_FAILURES', '3')
+    monkeypatch.setenv('LLM_BREAKER_RESET_SECONDS', '60')
+    monkeypatch.setenv('LLM_CONCURRENCY_INITIAL', '2')
+    monkeypatch.setenv('LLM_REQUESTS_PER_MINUTE', '0')
+    monkeypatch.setenv('LLM_TOKENS_PER_MINUTE', '0')
+    return Governor()
+
+
+def failing(*errors):
+    """A request failing with the given errors in turn, then answering 'ok'."""
+    remaining = list(errors)
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if remaining:
+            raise remaining.pop(0)
+        return 'ok'
+
+    return func, calls
+
+
+def test_retryable_errors_are_retried(governor):
+    func, calls = failing(server_error(), server_error())
+    assert asyncio.run(governor.call(func)) == 'ok'
+    assert len(calls) == 3
+    assert governor.stats()['retries'] == 2
+    assert governor.breaker.state == 'closed'
+
+
+def test_outages_open_the_breaker(governor):
+    func, _ = failing(*[server_error()] * 3)
+    with pytest.raises(genai_errors.ServerError):
+        asyncio.run(governor.call(func))
+    assert governor.breaker.state == 'open'
+
+    func, calls = failing()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(governor.call(func))
+    assert calls == []
+
+
+@pytest.mark.parametrize('error', [bad_request(), ValueError("GOOGLE_API_KEY is missing.")])
+def test_bad_requests_are_not_retried_and_do_not_open_the_breaker(governor, error):
+    for _ in range(5):
+        func, calls = failing(error)
+        with pytest.raises(type(error)):
+            asyncio.run(governor.call(func))
+        assert len(calls) == 1
+    assert governor.breaker.state == 'closed'
+    assert governor.breaker.failures == 0
+    assert governor.limiter.in_flight == 0
+
+
+def test_cancelled_call_gives_back_its_slot_and_the_breaker_trial(governor):
+    # a half-open breaker lets one trial call through
+    governor.breaker.failures = 3
+    governor.breaker.opened_at = 0.0
+    assert governor.breaker.state == 'half_open'
+
+    async def main():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        task = asyncio.create_task(governor.call(hang))
+        await started.wait()
+        assert governor.limiter.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert governor.limiter.in_flight == 0
+
+        # the next call can still be the trial, and closes the breaker
+        func, _ = failing()
+        return await governor.call(func)
+
+    assert asyncio.run(main()) == 'ok'
+    assert governor.breaker.state == 'closed'
+
+
+def test_cancelled_waiter_does_not_take_a_slot(governor):
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+            return 'held'
+
+        holders = [asyncio.create_task(governor.call(hold)) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(governor.call(hold))
+        await asyncio.sleep(0)
+        assert governor.limiter.in_flight == 2
+        waiting.cancel()
+        release.set()
+        results = await asyncio.gather(*holders)
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return results
+
+    assert asyncio.run(main()) == ['held', 'held']
+    assert governor.limiter.in_flight == 0
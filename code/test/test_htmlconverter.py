@@ -0,0 +1,83 @@
+from utils.htmlconverter import clean_email_body, html_to_text
+
+REPLY = """Please process the fee payment for deal DL-12345.
+
+Regards,
+Agency Desk
+
+On Mon, 3 Mar 2025 at 09:12, Harbor Trust <servicing@harbor.example.com> wrote:
+> Can you confirm the fee amount for the upcoming payment date?
+> Thanks
+"""
+
+FORWARD = """FYI, see the notice below.
+
+---------- Forwarded message ---------
+From: Harbor Trust <servicing@harbor.example.com>
+Date: Mon, 3 Mar 2025 at 09:12
+Subject: Principal repayment - DL-12345
+To: <loan.agency@example.com>
+
+Harbor Trust is repaying USD 2,500,000.00 of principal on Term Loan A, effective 14 March 2025.
+"""
+
+GMAIL_FORWARD_HTML = """<html><body><div>FYI, see the notice below.</div>
+<div class="gmail_quote"><div class="gmail_attr">---------- Forwarded message ---------<br>
+From: Harbor Trust &lt;servicing@harbor.example.com&gt;<br>Date: Mon, 3 Mar 2025 at 09:12<br>
+Subject: Principal repayment - DL-12345<br></div><br>
+<div>Harbor Trust is repaying USD 2,500,000.00 of principal on Term Loan A.</div></div></body></html>"""
+
+
+def test_reply_history_is_collapsed():
+    text, stats = clean_email_body(REPLY, quoted_max_chars=0)
+    assert text.startswith("Please process the fee payment for deal DL-12345.")
+    assert "wrote:" not in text
+    assert "confirm the fee amount" not in text
+    assert stats['quoted_chars_removed'] > 0
+
+
+def test_reply_history_is_shortened_to_the_limit():
+    text, _ = clean_email_body(REPLY, quoted_max_chars=20)
+    assert "[Quoted text]" in text
+    assert "Thanks" not in text
+
+
+def test_forwarded_message_is_kept():
+    text, stats = clean_email_body(FORWARD, quoted_max_chars=0)
+    assert "FYI, see the notice below." in text
+    assert "Forwarded message" in text
+    assert "Subject: Principal repayment - DL-12345" in text
+    assert "repaying USD 2,500,000.00 of principal" in text
+    assert stats['quoted_chars_removed'] == 0
+
+
+def test_reply_inside_forwarded_message_is_collapsed():
+    forward = FORWARD + "\nOn Fri, 28 Feb 2025, Agency Desk wrote:\n> Please send the repayment notice.\n"
+    text, _ = clean_email_body(forward, quoted_max_chars=0)
+    assert "repaying USD 2,500,000.00 of principal" in text
+    assert "Please send the repayment notice." not in text
+
+
+def test_gmail_html_forward_is_not_quoted():
+    assert "> " not in html_to_text(GMAIL_FORWARD_HTML)
+    text, _ = clean_email_body(GMAIL_FORWARD_HTML, 'text/html', quoted_max_chars=0)
+    assert "repaying USD 2,500,000.00 of principal" in text
+    assert "From: Harbor Trust" in text
+
+
+def test_forwarded_message_after_signature_is_kept():
+    body = "Hi team, please action the request below.\n-- \nJohn Smith\nAgency Desk\n\n" + FORWARD.split("\n", 2)[2]
+    text, stats = clean_email_body(body, quoted_max_chars=0)
+    assert text.startswith("Hi team, please action the request below.")
+    assert "John Smith" not in text
+    assert "Subject: Principal repayment - DL-12345" in text
+    assert "repaying USD 2,500,000.00 of principal" in text
+    assert stats['signature_chars_removed'] > 0
+
+
+def test_gmail_html_forward_after_signature_is_kept():
+    html = GMAIL_FORWARD_HTML.replace(
+        '<div class="gmail_quote">', '<div class="gmail_signature">John Smith<br>Agency Desk</div><div class="gmail_quote">')
+    text, _ = clean_email_body(html, 'text/html', quoted_max_chars=0)
+    assert "John Smith" not in text
+    assert "repaying USD 2,500,000.00 of principal" in text
@@ -0,0 +1,54 @@
+import io
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from services import ocr_service as ocr_module
+from services.cache_service import TieredCache
+from services.ocr_service import OCRService, preprocess_image
+
+
+def png_bytes(size=(400, 200), text="Repayment"):
+    img = Image.new("RGB", size, "white")
+    ImageDraw.Draw(img).text((20, 20), text, fill="black")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def fake_tesseract(monkeypatch):
+    monkeypatch.setattr(ocr_module, '_ocr_with_confidence', lambda img, lang: (f"{img.mode} {img.width}x{img.height}", 90.0))
+    monkeypatch.setattr(ocr_module, '_ocr_cache', TieredCache("ocr"))
+    monkeypatch.setattr(ocr_module, '_ocr_cache_pid', os.getpid())
+
+
+def test_large_photo_is_downscaled_and_binarized():
+    img = preprocess_image(Image.open(io.BytesIO(png_bytes((5000, 1000)))), max_dimension=2500, binarize=True)
+
+    assert img.size == (2500, 500)
+    assert img.mode == "1"
+
+
+def test_blank_scan_is_left_unbinarized():
+    img = preprocess_image(Image.new("RGB", (100, 100), "white"), max_dimension=2500, binarize=True)
+
+    assert img.mode == "L"
+
+
+def test_bad_image_does_not_lose_the_others_text():
+    service = OCRService(workers=1)
+
+    results = service.ocr_images([png_bytes(), b'not an image', png_bytes((300, 100))])
+
+    assert results[0]['text'] == "1 400x200"
+    assert isinstance(results[1], Exception)
+    assert results[2]['text'] == "1 300x100"
+
+
+def test_remote_backend_without_a_key_falls_back_to_local(monkeypatch):
+    monkeypatch.setenv("IMAGE_OCR_BACKEND", "ocrspace")
+    monkeypatch.delenv("OCR_SPACE_API_KEY", raising=False)
+
+    assert OCRService(workers=1).image_backend == 'local'
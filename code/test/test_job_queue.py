@@ -0,0 +1,89 @@
+import json
+import asyncio
+
+import pytest
+
+from services import job_service
+from services.job_service import JobQueue, QueueFullError
+
+
+async def fake_classify_upload(filename, data, progress=None):
+    progress({'stage': 'extraction_started'})
+    await asyncio.sleep(0.01)
+    if filename == 'bad.eml':
+        raise RuntimeError("extraction failed")
+    return {'filename': filename, 'response': {'request_type': 'Fee Payment'}}
+
+
+@pytest.fixture(autouse=True)
+def fake_classification(monkeypatch):
+    monkeypatch.setattr(job_service, 'classify_upload', fake_classify_upload)
+
+
+def test_job_runs_and_streams_its_progress():
+    async def main():
+        queue = JobQueue(workers=1)
+        queue.start()
+        job = await queue.submit('fee.eml', b'email')
+        events = [event async for event in queue.events(job)]
+        await queue.stop()
+        return job, events
+
+    job, events = asyncio.run(main())
+
+    assert job.status == 'completed'
+    assert job.result['response'] == {'request_type': 'Fee Payment'}
+    assert job.data is None
+    stages = [event.split('\n')[0] for event in events]
+    assert stages == ['event: queued', 'event: started', 'event: extraction_started', 'event: completed']
+    assert json.loads(events[-1].split('data: ')[1])['stage'] == 'completed'
+
+
+def test_failed_job_records_the_error():
+    async def main():
+        queue = JobQueue(workers=1)
+        queue.start()
+        job = await queue.submit('bad.eml', b'email')
+        [event async for event in queue.events(job)]
+        await queue.stop()
+        return job
+
+    job = asyncio.run(main())
+
+    assert job.status == 'failed'
+    assert job.to_dict()['error'] == "extraction failed"
+    assert job.to_dict()['stage'] == 'failed'
+
+
+def test_submission_beyond_the_depth_is_rejected():
+    async def main():
+        queue = JobQueue(max_depth=1, workers=1)
+        # no workers started, so the first job stays queued
+        queue._queue = asyncio.Queue(maxsize=1)
+        await queue.submit('1.eml', b'email')
+        with pytest.raises(QueueFullError):
+            await queue.submit('2.eml', b'email')
+        return queue
+
+    queue = asyncio.run(main())
+
+    assert len(queue.jobs) == 1
+
+
+def test_oldest_finished_jobs_are_evicted():
+    async def main():
+        queue = JobQueue(workers=2, max_retained=2)
+        queue.start()
+        jobs = []
+        for i in range(4):
+            job = await queue.submit(f'{i}.eml', b'email')
+            [event async for event in queue.events(job)]
+            jobs.append(job)
+        await queue.stop()
+        return queue, jobs
+
+    queue, jobs = asyncio.run(main())
+
+    # eviction runs on submit, so the last submission leaves the two newest jobs
+    assert list(queue.jobs) == [jobs[2].id, jobs[3].id]
+    assert queue.get(jobs[0].id) is None
@@ -0,0 +1,54 @@
+import pytest
+
+from utils import jsonconverter
+
+
+def test_plain_json_is_not_repaired():
+    value, repaired = jsonconverter.parse_json('{"request_type": "Fee Payment", "confidence_score": 0.9}')
+
+    assert value == {'request_type': 'Fee Payment', 'confidence_score': 0.9}
+    assert not repaired
+
+
+def test_code_fences_and_surrounding_text_are_ignored():
+    text = 'Here is the answer:\n```json\n{"request_type": "Adjustment"}\n```\nLet me know if you need more.'
+
+    value, repaired = jsonconverter.parse_json(text)
+
+    assert value == {'request_type': 'Adjustment'}
+    assert not repaired
+
+
+def test_truncated_object_drops_the_incomplete_member():
+    value, repaired = jsonconverter.parse_json('{"request_type": "Money Movement - Inbound", "sub_request_type": "Princ')
+
+    assert repaired
+    assert value == {'request_type': 'Money Movement - Inbound'}
+
+
+def test_truncated_array_keeps_complete_entries():
+    text = '[{"id": "1", "request_type": "Fee Payment"}, {"id": "2", "request_type": "Adjust'
+
+    value, repaired = jsonconverter.parse_json(text)
+
+    assert repaired
+    assert value[0] == {'id': '1', 'request_type': 'Fee Payment'}
+    assert all(entry.get('request_type') != 'Adjust' for entry in value)
+
+
+def test_text_without_json_raises_and_is_counted():
+    failed = jsonconverter.get_parse_stats()['failed']
+
+    with pytest.raises(ValueError):
+        jsonconverter.get_response_string("The model could not classify this email.")
+
+    assert jsonconverter.get_parse_stats()['failed'] == failed + 1
+
+
+def test_extracted_fields_are_flattened_without_overwriting():
+    text = ('{"request_type": "Fee Payment", "extracted_fields": ['
+            '{"name": "deal_name", "value": "DL-12345"}, {"name": "request_type", "value": "Other"}]}')
+
+    response = jsonconverter.get_response_string(text)
+
+    assert response == {'request_type': 'Fee Payment', 'deal_name': 'DL-12345'}
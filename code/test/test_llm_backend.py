@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+from google import genai
+
+from llm.LLMBackend import LLMBackend, SimulatedBackend, prompt_text, split_continuation
+
+INSTRUCTION = "Request Type: Fee Payment\nRequest Type: Money Movement - Inbound\n"
+
+
+def config():
+    return genai.types.GenerateContentConfig(system_instruction=INSTRUCTION, max_output_tokens=1024)
+
+
+def backend(**options):
+    return SimulatedBackend('gemini-test', latency='constant', latency_ms=0, **options)
+
+
+def test_backend_must_implement_generate():
+    with pytest.raises(TypeError):
+        LLMBackend()
+
+
+def test_synthetic_answer_uses_the_listed_request_types():
+    response = asyncio.run(backend().generate("Please pay the fee", config()))
+    answer = json.loads(response.text)
+    assert answer['request_type'] in ('Fee Payment', 'Money Movement - Inbound')
+    # the same prompt always gets the same answer
+    assert asyncio.run(backend().generate("Please pay the fee", config())).text == response.text
+
+
+def test_continuation_gets_the_rest_of_the_answer():
+    full = asyncio.run(backend().generate("Please pay the fee", config())).text
+    contents = [genai.types.Content(role='user', parts=[genai.types.Part(text="Please pay the fee")]),
+                genai.types.Content(role='model', parts=[genai.types.Part(text=full[:20])]),
+                genai.types.Content(role='user', parts=[genai.types.Part(text="continue")])]
+
+    email, partial = split_continuation(contents)
+    assert prompt_text(email) == "Please pay the fee"
+    assert partial == full[:20]
+    assert full[:20] + asyncio.run(backend().generate(contents, config())).text == full
+
+
+def test_generate_sync_works_outside_an_event_loop_only():
+    assert json.loads(backend().generate_sync("Please pay the fee", config()).text)
+
+    async def inside_loop():
+        backend().generate_sync("Please pay the fee", config())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(inside_loop())
@@ -0,0 +1,23 @@
+import asyncio
+
+from llm.LLMService import LLMService
+
+
+def test_client_uses_and_closes_its_own_connection_pools(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_MAX_CONNECTIONS", "7")
+    service = LLMService()
+    service.start()
+    transport, async_transport = service._transports
+
+    # every request of the SDK goes through the pools created by the service
+    api_client = service._get_client()._api_client
+    assert api_client._httpx_client._transport is transport
+    assert api_client._async_httpx_client._transport is async_transport
+    assert transport._pool._max_connections == 7
+
+    asyncio.run(service.aclose())
+    assert service._client is None
+    assert transport._pool.connections == [] and async_transport._pool.connections == []
+    # a later call gets fresh pools
+    assert service._get_client() is not None and service._transports[0] is not transport
@@ -0,0 +1,66 @@
+import json
+import threading
+
+import pytest
+
+import llm.DataStore as DataStore
+from services.local_classifier_service import LocalClassifier
+
+REQUEST_TYPE = 'Fee Payment'
+
+
+@pytest.fixture(autouse=True)
+def request_types(monkeypatch):
+    monkeypatch.setattr(DataStore, 'REQUEST_TYPES', {REQUEST_TYPE: {'description': 'Payment of a facility fee'}})
+
+
+def test_examples_stay_in_memory_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('LOCAL_CLASSIFIER_EXAMPLES_FILE', raising=False)
+    classifier = LocalClassifier()
+    classifier.add_example("Please process the fee payment for deal DL-12345", REQUEST_TYPE, '')
+
+    assert classifier.stats()['examples'] == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_examples_file_is_compacted_to_the_newest_examples(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOCAL_CLASSIFIER_MAX_EXAMPLES', '5')
+    path = tmp_path / 'examples.jsonl'
+    classifier = LocalClassifier(examples_file=str(path))
+    for i in range(11):
+        classifier.add_example(f"Fee payment notice number {i}", REQUEST_TYPE, '')
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[-1])['text'] == "Fee payment notice number 10"
+    # a fresh process loads the newest examples only
+    reloaded = LocalClassifier(examples_file=str(path))
+    reloaded._load_examples()
+    assert [example['text'] for example in reloaded._examples][0] == "Fee payment notice number 6"
+
+
+def test_concurrent_writers_do_not_lose_examples(tmp_path):
+    path = tmp_path / 'examples.jsonl'
+    classifiers = [LocalClassifier(examples_file=str(path)) for _ in range(4)]
+
+    def write(classifier, worker):
+        for i in range(50):
+            classifier.add_example(f"Fee payment notice {worker}-{i}", REQUEST_TYPE, '')
+
+    threads = [threading.Thread(target=write, args=(classifier, i)) for i, classifier in enumerate(classifiers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 200
+    assert all(json.loads(line)['request_type'] == REQUEST_TYPE for line in lines)
+
+
+def test_fallback_needs_the_confidence_threshold():
+    classifier = LocalClassifier(threshold=0.8, examples_file='')
+    assert classifier.can_fall_back({'confidence_score': 0.85})
+    assert not classifier.can_fall_back({'confidence_score': 0.4})
+    assert not classifier.can_fall_back(None)
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import pytest
+
+from llm.Governor import CircuitOpenError
+from services.map_reduce_service import ChunkParseError, classify_chunks
+
+
+def answer(request_type, confidence):
+    return json.dumps({'request_type': request_type, 'sub_request_type': '', 'confidence_score': confidence,
+                       'summary': 'chunk', 'priority': 'High', 'extracted_fields': []})
+
+
+def test_chunk_answers_are_merged_and_failed_chunks_skipped():
+    responses = iter([answer('Fee Payment', 0.9), CircuitOpenError('open'), answer('Fee Payment', 0.8)])
+
+    async def call(chunk):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    merged = asyncio.run(classify_chunks(['a', 'b', 'c'], call, concurrency=1))
+    assert merged['request_type'] == 'Fee Payment'
+
+
+def test_llm_error_is_raised_when_every_chunk_call_fails():
+    async def call(chunk):
+        raise CircuitOpenError('open')
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(classify_chunks(['a', 'b'], call))
+
+
+def test_unparsable_answers_raise_chunk_parse_error():
+    async def call(chunk):
+        return 'not json at all'
+
+    with pytest.raises(ChunkParseError):
+        asyncio.run(classify_chunks(['a', 'b'], call))
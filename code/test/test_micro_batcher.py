@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from llm.MicroBatcher import MicroBatcher
+
+
+def answer(item_id, request_type='Fee Payment'):
+    return {'id': item_id, 'request_type': request_type, 'sub_request_type': '', 'confidence_score': 0.9,
+            'summary': 'Fee payment', 'priority': 'High',
+            'extracted_fields': [{'name': 'deal', 'value': f'DL-{item_id}'}]}
+
+
+def run_batch(batch_answer):
+    """Submits three items in one batch; returns the results and the contents sent as single calls."""
+    singles = []
+
+    async def send_batch(items):
+        return batch_answer
+
+    async def send_one(content, request_types):
+        singles.append(content)
+        return json.dumps({'request_type': 'single', 'content': content})
+
+    async def main():
+        batcher = MicroBatcher(send_batch, send_one, max_items=3, max_wait=1)
+        results = await asyncio.gather(*(batcher.submit(f"email {i}") for i in range(1, 4)))
+        return [json.loads(result) for result in results], batcher.stats()
+
+    results, stats = asyncio.run(main())
+    return results, singles, stats
+
+
+def test_complete_batch_answer_is_split_among_the_items():
+    results, singles, stats = run_batch(json.dumps([answer('1'), answer('2'), answer('3')]))
+
+    assert singles == []
+    assert [result['extracted_fields'][0]['value'] for result in results] == ['DL-1', 'DL-2', 'DL-3']
+    assert stats['incomplete_items'] == 0
+
+
+def test_cut_off_entry_is_retried_on_its_own():
+    full = json.dumps([answer('1'), answer('2'), answer('3')])
+    # cut inside the last entry's extracted fields, where a repair would still close a plausible object
+    cut = full[:full.rindex('DL-3') - 12]
+    results, singles, stats = run_batch(cut)
+
+    assert singles == ['email 3']
+    assert results[2]['request_type'] == 'single'
+    assert [result['request_type'] for result in results[:2]] == ['Fee Payment', 'Fee Payment']
+    assert stats['retried_items'] == 1
+
+
+def test_entries_missing_fields_are_retried_on_their_own():
+    partial = answer('2')
+    del partial['summary']
+    results, singles, stats = run_batch(json.dumps([answer('1'), partial, answer('3')]))
+
+    assert singles == ['email 2']
+    assert results[1]['request_type'] == 'single'
+    assert stats['incomplete_items'] == 1
+
+
+def test_answers_without_the_schema_are_not_retried():
+    # without the response schema, extra fields come as top-level keys instead of an extracted_fields list
+    entries = []
+    for item_id in ('1', '2', '3'):
+        entry = answer(item_id)
+        entry['deal_name'] = entry.pop('extracted_fields')[0]['value']
+        entries.append(entry)
+    results, singles, stats = run_batch(json.dumps(entries))
+
+    assert singles == []
+    assert [result['deal_name'] for result in results] == ['DL-1', 'DL-2', 'DL-3']
+    assert stats['incomplete_items'] == 0
@@ -0,0 +1,114 @@
+import os
+
+import fitz
+import pytest
+
+from services import ocr_service as ocr_module
+from services.blob_service import blob_store
+from services.cache_service import TieredCache, hash_bytes
+from services.ocr_service import OCRService, OCRSettings
+
+PAGES = 6
+
+
+def scanned_pdf():
+    # pages of different widths, so the fake OCR below can tell them apart from the rendered image alone
+    pdf = fitz.open()
+    for page_num in range(PAGES):
+        pdf.new_page(width=200 + 10 * page_num, height=200)
+    return pdf.tobytes()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # the pool forks after this, so the workers see the fake OCR too
+    monkeypatch.setattr(ocr_module, '_ocr_with_confidence', lambda img, lang: (f"width {img.width}", 99.0))
+    service = OCRService(workers=2)
+    service.calls = []
+    original_map = service._map
+
+    def recording_map(func, args_list, *args, **kwargs):
+        service.calls.append((func, args_list))
+        return original_map(func, args_list, *args, **kwargs)
+
+    monkeypatch.setattr(service, '_map', recording_map)
+    yield service
+    service.shutdown()
+
+
+def expected_text(page_num):
+    with fitz.open(stream=scanned_pdf(), filetype="pdf") as pdf:
+        return f"width {ocr_module._render_page(pdf[page_num], 150).width}"
+
+
+def test_pool_results_come_back_in_page_order(service):
+    page_nums = [5, 0, 3, 1]
+    results = service.ocr_pdf_pages(scanned_pdf(), page_nums)
+
+    assert [result['text'] for result in results] == [expected_text(page_num) for page_num in page_nums]
+
+
+def test_pool_workers_get_a_path_instead_of_the_pdf(service):
+    pdf = scanned_pdf()
+    service.ocr_pdf_pages(pdf, list(range(PAGES)))
+
+    [(func, args_list)] = service.calls
+    assert func is ocr_module.ocr_shared_pdf_page
+    assert all(isinstance(args[0], str) for args in args_list)
+    assert len({args[0] for args in args_list}) == 1
+    # the shared copy is released once the pages are done
+    assert not os.path.exists(args_list[0][0])
+    assert hash_bytes(pdf) not in os.listdir(blob_store.blob_dir)
+
+
+def test_single_page_runs_in_process(service):
+    [result] = service.ocr_pdf_pages(scanned_pdf(), [2])
+
+    assert result['text'] == expected_text(2)
+    assert service.calls[0][0] is ocr_module.ocr_pdf_page
+
+
+@pytest.fixture
+def fresh_ocr_cache(monkeypatch):
+    monkeypatch.setattr(ocr_module, '_ocr_cache', TieredCache("ocr"))
+    monkeypatch.setattr(ocr_module, '_ocr_cache_pid', os.getpid())
+
+
+def test_low_confidence_page_is_retried_at_high_dpi(monkeypatch, fresh_ocr_cache):
+    rendered = []
+
+    def fake_ocr(img, lang):
+        rendered.append(img.width)
+        # only the high resolution render reads well
+        return f"width {img.width}", 90.0 if len(rendered) > 1 else 30.0
+
+    monkeypatch.setattr(ocr_module, '_ocr_with_confidence', fake_ocr)
+    result = ocr_module.ocr_pdf_page(scanned_pdf(), 0, OCRSettings(low_dpi=150, high_dpi=300, min_confidence=60))
+
+    assert (result['dpi'], result['confidence'], result['cache_hit']) == (300, 90.0, False)
+    assert rendered[1] == 2 * rendered[0]
+
+
+def test_confident_page_stays_at_low_dpi_and_is_cached(monkeypatch, fresh_ocr_cache):
+    calls = []
+    monkeypatch.setattr(ocr_module, '_ocr_with_confidence', lambda img, lang: calls.append(img.width) or ("text", 95.0))
+    settings = OCRSettings(low_dpi=150, high_dpi=300, min_confidence=60)
+
+    first = ocr_module.ocr_pdf_page(scanned_pdf(), 1, settings)
+    second = ocr_module.ocr_pdf_page(scanned_pdf(), 1, settings)
+
+    assert first['dpi'] == 150 and not first['cache_hit']
+    assert second['cache_hit'] and second['text'] == "text"
+    assert second['seconds_saved'] == first['seconds']
+    assert len(calls) == 1
+
+
+def test_identical_pages_share_the_cache_entry(monkeypatch, fresh_ocr_cache):
+    pdf = fitz.open()
+    for _ in range(2):
+        pdf.new_page().insert_text((72, 72), "Signed repayment instruction")
+    monkeypatch.setattr(ocr_module, '_ocr_with_confidence', lambda img, lang: ("Signed repayment instruction", 95.0))
+
+    results = [ocr_module.ocr_pdf_page(pdf.tobytes(), page_num, OCRSettings()) for page_num in (0, 1)]
+
+    assert [result['cache_hit'] for result in results] == [False, True]
@@ -0,0 +1,43 @@
+import pytest
+
+from llm import DataStore
+from llm.LLMService import LLMService
+
+REQUEST_TYPES = {f"Type {i}": {'description': f"Description of type {i}", 'sub_requests': {f"Sub {i}": "Sub request"}}
+                 for i in range(8)}
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(DataStore, 'REQUEST_TYPES', REQUEST_TYPES)
+    monkeypatch.setattr(DataStore, 'REQUEST_TYPES_VERSION', DataStore.REQUEST_TYPES_VERSION + 1000)
+    monkeypatch.setenv("LLM_PROMPT_TOP_K", "3")
+    return LLMService()
+
+
+def ranking(*scores):
+    return [(f"Type {i}", score) for i, score in enumerate(scores)]
+
+
+def test_clear_ranking_lists_only_the_top_k(service):
+    assert service.select_request_types(ranking(0.8, 0.6, 0.5, 0.2, 0.1)) == ["Type 0", "Type 1", "Type 2"]
+
+
+def test_weak_or_flat_ranking_sends_the_full_list(service):
+    # best match below prompt_min_score
+    assert service.select_request_types(ranking(0.01, 0.005, 0.004, 0.001)) is None
+    # the first type left out scores nearly as well as the best one
+    assert service.select_request_types(ranking(0.5, 0.49, 0.48, 0.47)) is None
+    assert service.select_request_types(None) is None
+
+
+def test_pruned_instruction_lists_only_the_candidates(service):
+    config = service._get_generation_config(["Type 2", "Type 5"])
+
+    assert "Request Type: Type 2" in config.system_instruction
+    assert "Sub 5" in config.system_instruction
+    assert "Type 0" not in config.system_instruction
+    assert len(config.system_instruction) < len(service.get_system_instruction())
+    # the same candidates in another order reuse the compiled config
+    assert service._get_generation_config(["Type 5", "Type 2"]) is config
+    assert service.get_prompt_stats()['pruned'] == 2
@@ -0,0 +1,69 @@
+import io
+
+import fitz
+import pytest
+from docx import Document
+
+from services.document_processing_service import EmailProcessor
+
+NOTICE = "Principal repayment notice for Term Loan A, deal DL-12345, effective 14 March 2025."
+EMAIL_LINES = ["From: servicing@harbor.example.com", "To: loan.agency@example.com",
+               "Subject: Principal repayment", "", NOTICE]
+
+
+def pdf_bytes(lines):
+    pdf = fitz.open()
+    page = pdf.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((72, 72 + 14 * i), line, fontsize=9)
+    return pdf.tobytes()
+
+
+def docx_bytes(lines):
+    buffer = io.BytesIO()
+    document = Document()
+    for line in lines:
+        document.add_paragraph(line)
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    processor = EmailProcessor(ocr_enabled=False)
+    processor.extractions = []
+    for method in ('extract_pdf', 'extract_word'):
+        original = getattr(processor, method)
+
+        def counting(source, name=None, original=original, method=method):
+            processor.extractions.append(method)
+            return original(source, name)
+
+        monkeypatch.setattr(processor, method, counting)
+    return processor
+
+
+def test_plain_pdf_is_extracted_once(processor):
+    email_data = processor.process_input(pdf_bytes([NOTICE]), 'notice.pdf')
+
+    assert processor.extractions == ['extract_pdf']
+    assert NOTICE in email_data['email_body']
+    assert email_data['subject'] == 'notice.pdf'
+    assert email_data['extraction']['pages'] == 1
+
+
+def test_email_pdf_reuses_the_extracted_text(processor):
+    email_data = processor.process_input(pdf_bytes(EMAIL_LINES), 'email.pdf')
+
+    assert processor.extractions == ['extract_pdf']
+    assert email_data['subject'] == 'Principal repayment'
+    assert email_data['from'] == 'servicing@harbor.example.com'
+    assert NOTICE in email_data['email_body']
+
+
+def test_word_document_is_extracted_once(processor):
+    email_data = processor.process_input(docx_bytes(EMAIL_LINES), 'email.docx')
+
+    assert processor.extractions == ['extract_word']
+    assert email_data['subject'] == 'Principal repayment'
+    assert NOTICE in email_data['email_body']
@@ -0,0 +1,63 @@
+import io
+from email.message import EmailMessage
+
+from docx import Document
+
+from filereader.ReaderRegistry import OLE2_MAGIC, sniff_format
+from services.document_processing_service import EmailProcessor
+
+BANK_NOTE = b"BMO Harris Bank N.A. confirms the principal repayment for deal DL-12345.\n"
+FORWARDED_TEXT = (b"From: Harbor Trust <servicing@harbor.example.com>\nTo: loan.agency@example.com\n"
+                  b"Subject: Principal repayment\n\nHarbor Trust is repaying USD 2,500,000.00 of principal.\n")
+
+
+def docx_bytes():
+    buffer = io.BytesIO()
+    document = Document()
+    document.add_paragraph("Fee payment notice")
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def test_content_wins_over_a_wrong_name():
+    assert sniff_format(b'%PDF-1.7\n...', 'notice.txt') == 'pdf'
+    assert sniff_format(docx_bytes(), 'notice.pdf') == 'docx'
+
+
+def test_name_breaks_ole2_ties():
+    assert sniff_format(OLE2_MAGIC + b'\x00' * 64, 'ledger.xls') == 'xls'
+    assert sniff_format(OLE2_MAGIC + b'\x00' * 64, 'letter.doc') == 'doc'
+
+
+def test_weak_signatures_do_not_override_a_text_name():
+    assert sniff_format(BANK_NOTE, 'notes.txt') == 'txt'
+    assert sniff_format(FORWARDED_TEXT, 'fwd.txt') == 'txt'
+    assert sniff_format(FORWARDED_TEXT, 'fwd.csv') == 'txt'
+
+
+def test_weak_signatures_are_used_without_a_text_name():
+    assert sniff_format(b'BM' + b'\x36\x00\x0c\x00' + b'\x00' * 64, 'scan') == 'bmp'
+    assert sniff_format(FORWARDED_TEXT, 'message') == 'eml'
+    assert sniff_format(FORWARDED_TEXT) == 'eml'
+
+
+def test_text_and_attached_emails_are_extracted():
+    forwarded = EmailMessage()
+    forwarded['From'] = 'Harbor Trust <servicing@harbor.example.com>'
+    forwarded['Subject'] = 'Principal repayment'
+    forwarded.set_content("Harbor Trust is repaying USD 2,500,000.00 of principal.")
+
+    msg = EmailMessage()
+    msg['Subject'] = 'FW: Principal repayment'
+    msg.set_content("See the attached notice and bank note.")
+    msg.add_attachment(BANK_NOTE, maintype='text', subtype='plain', filename='notes.txt')
+    msg.add_attachment(forwarded, filename='notice.eml')
+
+    email_data = EmailProcessor(ocr_enabled=False).process_eml_file(msg.as_bytes())
+
+    texts = {attachment['filename']: (attachment['format'], attachment['extracted_text'])
+             for attachment in email_data['attachments']}
+    assert texts['notes.txt'] == ('txt', BANK_NOTE.decode())
+    assert texts['notice.eml'][0] == 'eml'
+    assert "Subject: Principal repayment" in texts['notice.eml'][1]
+    assert "repaying USD 2,500,000.00 of principal" in texts['notice.eml'][1]
@@ -0,0 +1,48 @@
+import io
+import datetime
+
+import openpyxl
+
+from services.spreadsheet_service import SpreadsheetLimits, extract_spreadsheet
+
+
+def workbook_bytes(sheets=3, rows=50, cols=30):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for sheet_num in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet{sheet_num + 1}")
+        sheet.append(["Deal", "Amount", "Effective date", "Notes | remarks"] + [f"col{i}" for i in range(4, cols)])
+        for row in range(1, rows):
+            sheet.append([f"DL-{row}", 2500000.0, datetime.datetime(2025, 3, 14), "x" * 100] + [row] * (cols - 4))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_rows_columns_cells_and_sheets_are_capped():
+    text = extract_spreadsheet(workbook_bytes(), SpreadsheetLimits(max_sheets=2, max_rows=10, max_cols=5,
+                                                                   max_cell_chars=10, max_chars=100000))
+    blocks = text.split("\n\n")
+
+    assert len(blocks) == 2
+    header, *lines = blocks[0].split("\n")
+    assert header == "[Sheet: Sheet1 (50 rows x 30 columns)] showing first 10 rows, 5 columns"
+    assert len(lines) == 10
+    assert lines[0] == "Deal | Amount | Effective… | Notes / r… | col4"
+    assert lines[1] == "DL-1 | 2500000 | 2025-03-14 | xxxxxxxxx… | 1"
+
+
+def test_sheets_past_the_character_limit_are_omitted():
+    text = extract_spreadsheet(workbook_bytes(), SpreadsheetLimits(max_sheets=5, max_rows=200, max_cols=20,
+                                                                   max_cell_chars=60, max_chars=2000))
+
+    assert len(text) <= 2200
+    assert "[Sheet: Sheet2 omitted, character limit reached]" in text
+    assert "[Sheet: Sheet3 omitted, character limit reached]" in text
+
+
+def test_small_sheet_is_rendered_whole():
+    text = extract_spreadsheet(workbook_bytes(sheets=1, rows=3, cols=4), SpreadsheetLimits())
+
+    assert text.split("\n")[0] == "[Sheet: Sheet1 (3 rows x 4 columns)]"
+    assert len(text.split("\n")) == 4
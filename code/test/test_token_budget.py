@@ -0,0 +1,72 @@
+import fitz
+
+from services.document_processing_service import EmailProcessor
+from services.token_budget_service import OMITTED_MARKER, TokenBudget, TokenBudgetAssembler, TokenCounter
+
+PDF_TEXT = "Principal repayment notice for Term Loan A, deal DL-12345, effective 14 March 2025. " * 20
+IMAGE_TEXT = "Scanned page of a signed repayment instruction with the bank stamp and reference. " * 20
+
+
+def counter():
+    # the estimate is deterministic and needs no tokenizer download
+    return TokenCounter(tokenizer_file='', tokenizer_name='', chars_per_token=4)
+
+
+def email(attachments):
+    return {'from': 'servicing@harbor.example.com', 'to': 'loan.agency@example.com', 'date': '3 Mar 2025',
+            'subject': 'Repayment', 'email_body': 'Please see the attached notice.', 'attachments': attachments}
+
+
+def test_pdf_outranks_image_when_budget_is_tight():
+    # the image comes first, so only the format can put the pdf ahead of it
+    attachments = [{'filename': 'scan.png', 'format': 'png', 'extracted_text': IMAGE_TEXT},
+                   {'filename': 'notice.pdf', 'format': 'pdf', 'extracted_text': PDF_TEXT}]
+    budget = TokenBudget(max_input_tokens=600, body_max_tokens=100, attachment_max_tokens=420)
+    text, stats = TokenBudgetAssembler(budget, counter()).assemble(email(attachments))
+
+    image_section, pdf_section = text.split("=== ATTACHMENT 2: notice.pdf ===")
+    assert PDF_TEXT.strip() in pdf_section
+    assert IMAGE_TEXT.strip() not in image_section
+    assert stats['truncated_sections'] + stats['omitted_sections'] == 1
+    assert stats['output_tokens'] <= budget.max_input_tokens
+
+
+def test_image_is_omitted_before_pdf_is_cut():
+    attachments = [{'filename': 'scan.png', 'format': 'png', 'extracted_text': IMAGE_TEXT},
+                   {'filename': 'notice.pdf', 'format': 'pdf', 'extracted_text': PDF_TEXT}]
+    budget = TokenBudget(max_input_tokens=500, body_max_tokens=100, attachment_max_tokens=420)
+    text, stats = TokenBudgetAssembler(budget, counter()).assemble(email(attachments))
+
+    assert text.split("=== ATTACHMENT 2")[0].rstrip().endswith(OMITTED_MARKER)
+    assert stats['omitted_sections'] == 1
+
+
+def test_long_email_is_split_into_chunks_within_budget():
+    attachments = [{'filename': 'notice.pdf', 'format': 'pdf', 'extracted_text': PDF_TEXT * 4}]
+    budget = TokenBudget(max_input_tokens=400, body_max_tokens=100, attachment_max_tokens=400, max_chunks=8)
+    assembler = TokenBudgetAssembler(budget, counter())
+
+    chunks, stats = assembler.assemble_chunks(email(attachments))
+
+    assert len(chunks) > 1
+    for number, chunk in enumerate(chunks, 1):
+        # every chunk can be classified on its own
+        assert chunk.startswith("=== EMAIL METADATA ===")
+        assert "Subject: Repayment" in chunk
+        assert f"(part {number} of {len(chunks)})" in chunk
+        assert counter().count(chunk) <= budget.max_input_tokens
+    assert stats['chunks'] == len(chunks)
+    assert stats['truncated_sections'] == stats['omitted_sections'] == 0
+
+
+def test_processed_attachments_keep_their_format():
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "Principal repayment notice for Term Loan A, deal DL-12345, effective 14 March.")
+    attachments = [{'filename': 'notes.txt', 'content_type': 'text/plain', 'format': 'txt', 'data': b'Fee payment'},
+                   {'filename': 'notice.pdf', 'content_type': 'application/pdf', 'format': 'pdf', 'data': pdf.tobytes()}]
+
+    results = EmailProcessor().process_attachments(attachments)
+
+    assert [result['format'] for result in results] == ['txt', 'pdf']
+    assert "Fee payment" in results[0]['extracted_text']
+    assert "Principal repayment notice" in results[1]['extracted_text']